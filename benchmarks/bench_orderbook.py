@@ -0,0 +1,101 @@
+"""
+Benchmarks Orderbook, SortedOrderbook and OrderbookAlt on synthetic events.
+
+usage: python -m benchmarks.bench_orderbook [depth ...]
+"""
+
+import logging
+import random
+import sys
+import time
+
+from typing import Callable, Iterator
+
+from orderbook import Orderbook, OrderbookAlt, SortedOrderbook
+from ws_apis.events import OrderbookEvent, OBEventType, Level
+
+_tick = 0.01
+_mid = 20_000.0
+
+
+def _random_level(rng: random.Random, mid: float, is_bid: bool, depth: int) -> Level:
+    """random level, most updates land close to the top but some beyond depth"""
+    offset = min(int(rng.expovariate(1 / 20)), 2 * depth) + 1
+    price = round(mid - offset * _tick if is_bid else mid + offset * _tick, 2)
+    qty = 0.0 if rng.random() < 0.3 else round(rng.uniform(0.001, 5.0), 3)
+    return Level(price, qty)
+
+
+def make_snapshot(depth: int) -> OrderbookEvent:
+    """snapshot with depth levels on each side around _mid"""
+    bids = [Level(round(_mid - i * _tick, 2), 1.0) for i in range(1, depth + 1)]
+    asks = [Level(round(_mid + i * _tick, 2), 1.0) for i in range(1, depth + 1)]
+    return OrderbookEvent("bench", "btcusdt", OBEventType.SNAPSHOT, bids, asks, 0, 0)
+
+
+def make_updates(
+    n: int, depth: int, levels_per_update: int = 10, seed: int = 0
+) -> list[OrderbookEvent]:
+    """n update events around a slowly drifting mid price"""
+    rng = random.Random(seed)
+    mid, events = _mid, []
+    for i in range(n):
+        mid = round(mid + rng.choice((-1, 0, 0, 1)) * _tick, 2)
+        bids = [_random_level(rng, mid, True, depth) for _ in range(levels_per_update)]
+        asks = [_random_level(rng, mid, False, depth) for _ in range(levels_per_update)]
+        events.append(
+            OrderbookEvent("bench", "btcusdt", OBEventType.UPDATE, bids, asks, i, i)
+        )
+    return events
+
+
+def _time_it(fn: Callable[[], None], repeat: int = 3) -> float:
+    """best of repeat runs (in seconds)"""
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def bench_book(cls: type, depth: int, n_updates: int) -> tuple[float, float]:
+    """returns (us per update, us per snapshot) for a book class"""
+    snapshot, updates = make_snapshot(depth), make_updates(n_updates, depth)
+
+    def run_updates():
+        book = cls("bench", "btcusdt", depth)
+        book.update(snapshot)
+        for e in updates:
+            book.update(e)
+
+    book = cls("bench", "btcusdt", depth)
+    book.update(snapshot)
+    for e in updates:
+        book.update(e)
+
+    def run_snapshots():
+        for _ in range(n_updates):
+            book.take_snapshot(10)
+
+    t_update = _time_it(run_updates) / n_updates * 1e6
+    t_snapshot = _time_it(run_snapshots) / n_updates * 1e6
+    return t_update, t_snapshot
+
+
+def _iter_results(depths: list[int], n_updates: int) -> Iterator[str]:
+    yield f"{'book':16s} {'depth':>6s} {'update (us)':>12s} {'snapshot (us)':>14s}"
+    for depth in depths:
+        for cls in (Orderbook, SortedOrderbook, OrderbookAlt):
+            t_update, t_snapshot = bench_book(cls, depth, n_updates)
+            yield f"{cls.__name__:16s} {depth:6d} {t_update:12.2f} {t_snapshot:14.2f}"
+
+
+def main(depths: list[int], n_updates: int = 2000):
+    logging.disable(logging.INFO)
+    for line in _iter_results(depths, n_updates):
+        print(line)
+
+
+if __name__ == "__main__":
+    main([int(d) for d in sys.argv[1:]] or [100, 1000, 5000])
@@ -0,0 +1,558 @@
+"""
+Benchmarks the stages of the event pipeline separately and end to end, on
+synthetic frames or on a recording (see ws_apis/recorder.py):
+
+    decode      frame -> dict or struct (binance and kraken decoders)
+    parse       dict or struct -> OrderbookEvent (parse_book_msg_binance/_kraken)
+    sync        BinanceWebsocket._process (BinanceEventsBuffer checks)
+    book        Orderbook/SortedOrderbook/OrderbookAlt update and snapshot
+    handoff     parsed event -> consumer through Websocket and WsManager
+    end_to_end  frame -> synced book update through WsManager
+
+Each stage reports messages/sec and p50/p99/p999 latency (per message; for
+handoff and end_to_end from the parse to the consumer, which replay frames
+as fast as possible, so it includes the time events wait in the queues).
+Results are saved as JSON and can be compared against a baseline run (the
+exit status is 1 if a stage regressed).
+
+usage: python -m benchmarks.bench_pipeline [--depths 100 1000] [--update-sizes 10]
+           [--symbols 1 10] [--recording path] [--output results.json]
+           [--baseline baseline.json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from itertools import product
+from typing import Any, Callable, Iterable, Iterator, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from benchmarks.bench_orderbook import make_snapshot, make_updates
+from orderbook import Orderbook, OrderbookAlt, SortedOrderbook
+from ws_apis import WsManager, Subscription, OrderbookEvent, StreamType
+from ws_apis.binance import BinanceWebsocket, parse_book_msg_binance
+from ws_apis.binance import parse_snapshot_binance, unwrap_msg_binance
+from ws_apis.binance import prepare_book_subscription_msg_binance
+from ws_apis.binance import prepare_trades_subscription_msg_binance
+from ws_apis.decoders import get_binance_decoder, get_kraken_decoder
+from ws_apis.kraken import parse_book_msg_kraken
+from ws_apis.recorder import FrameRecorder, RecordKind, read_records
+from ws_apis.replay import Replay, ReplayBinanceWebsocket
+from ws_apis.utils import SymbolsMeta
+
+_meta = SymbolsMeta()
+_book_classes = (Orderbook, SortedOrderbook, OrderbookAlt)
+_max_alt_depth = 1000  # OrderbookAlt is too slow beyond that
+
+
+""" ==================== Synthetic frames ==================== """
+
+
+def bench_symbols(n: int) -> list[str]:
+    """n symbols known to binance and kraken"""
+    both = set(_meta.sym2ws["binance"]) & set(_meta.sym2ws["kraken"])
+    return sorted(both)[:n]
+
+
+def _str_levels(levels: Iterable, ts: Optional[str] = None) -> list[list[str]]:
+    if ts is None:
+        return [[f"{l.price:.2f}", f"{l.qty:.3f}"] for l in levels]
+    return [[f"{l.price:.5f}", f"{l.qty:.8f}", ts] for l in levels]
+
+
+def binance_book_frames(
+    symbols: list[str], n: int, depth: int, update_size: int
+) -> tuple[list[str], dict[str, dict]]:
+    """n depthUpdate frames (round robin over symbols) and a rest snapshot per symbol"""
+    snapshot = make_snapshot(depth)
+    updates = make_updates(n, depth, update_size)
+    rest = {
+        s: {
+            "lastUpdateId": 0,
+            "bids": _str_levels(snapshot.bids),
+            "asks": _str_levels(snapshot.asks),
+        }
+        for s in symbols
+    }
+    update_ids = dict.fromkeys(symbols, 1)
+    frames = []
+    for i, event in enumerate(updates):
+        symbol = symbols[i % len(symbols)]
+        first = update_ids[symbol]
+        update_ids[symbol] += 2 * update_size
+        data = {
+            "e": "depthUpdate",
+            "E": i,
+            "s": _meta.sym2rest_sym("binance", symbol),
+            "U": first,
+            "u": update_ids[symbol] - 1,
+            "b": _str_levels(event.bids),
+            "a": _str_levels(event.asks),
+        }
+        ws_symbol = _meta.sym2ws_sym("binance", symbol)
+        frames.append(json.dumps({"stream": f"{ws_symbol}@depth", "data": data}))
+    return frames, rest
+
+
+def kraken_book_frames(
+    symbols: list[str], n: int, depth: int, update_size: int
+) -> list[str]:
+    """n book update frames (round robin over symbols)"""
+    frames = []
+    for i, event in enumerate(make_updates(n, depth, update_size)):
+        pair = _meta.sym2ws_sym("kraken", symbols[i % len(symbols)])
+        ts = f"{1.7e9 + i / 1000:.6f}"
+        asks, bids = _str_levels(event.asks, ts), _str_levels(event.bids, ts)
+        frames.append(json.dumps([0, {"a": asks}, {"b": bids}, f"book-{depth}", pair]))
+    return frames
+
+
+def binance_trade_frames(symbols: list[str], n: int) -> list[str]:
+    frames = []
+    for i in range(n):
+        symbol = symbols[i % len(symbols)]
+        data = {
+            "e": "aggTrade",
+            "E": i,
+            "s": _meta.sym2rest_sym("binance", symbol),
+            "p": "20000.01",
+            "q": "0.125",
+            "T": i,
+            "m": bool(i & 1),
+        }
+        ws_symbol = _meta.sym2ws_sym("binance", symbol)
+        frames.append(json.dumps({"stream": f"{ws_symbol}@aggTrade", "data": data}))
+    return frames
+
+
+def write_recording(
+    directory: str,
+    subscription_msg: str,
+    frames: list[str],
+    rest: Optional[dict[str, dict]] = None,
+    depth: int = 100,
+):
+    """
+    records frames on one binance connection (with the rest snapshot of each
+    symbol after its first update)
+    """
+    with FrameRecorder(directory) as recorder:
+        url = BinanceWebsocket._ws_url
+        recorder.record(1, RecordKind.CONNECT, f"{url}\n{subscription_msg}")
+        pending = dict(rest or {})
+        for frame in frames:
+            recorder.record(1, RecordKind.FRAME, frame)
+            symbol = json.loads(frame)["data"]["s"]
+            snapshot = pending.pop(_meta.rest_sym2sym("binance", symbol), None)
+            if snapshot is not None:
+                query = f"api/v3/depth?symbol={symbol}&limit={depth}"
+                payload = f"{BinanceWebsocket._rest_url}{query}\n{json.dumps(snapshot)}"
+                recorder.record(1, RecordKind.REST, payload)
+
+
+""" ==================== Recorded frames ==================== """
+
+
+def recorded_frames(paths: list[str]) -> dict[str, list[bytes]]:
+    """book frames of a recording by exchange"""
+    exchanges: dict[int, str] = {}
+    frames: dict[str, list[bytes]] = {"binance": [], "kraken": []}
+    for path in paths:
+        for record in read_records(path):
+            if record.kind == RecordKind.CONNECT:
+                url = record.payload.split(b"\n", 1)[0]
+                exchanges[record.conn_id] = "kraken" if b"kraken" in url else "binance"
+            elif record.kind == RecordKind.FRAME and (
+                b"depthUpdate" in record.payload or b'"book-' in record.payload
+            ):
+                frames[exchanges[record.conn_id]].append(record.payload)
+    return frames
+
+
+def recorded_subscriptions(paths: list[str]) -> list[Subscription]:
+    """the subscriptions of the connections of a recording (to replay it)"""
+    subs, depths = [], {}
+    for path in paths:
+        for record in read_records(path):
+            if record.kind == RecordKind.REST:
+                url = record.payload.split(b"\n", 1)[0].decode()
+                query = parse_qs(urlsplit(url).query)
+                depths[query["symbol"][0]] = int(query.get("limit", [100])[0])
+            if record.kind != RecordKind.CONNECT:
+                continue
+            url, msg = record.payload.decode().split("\n", 1)
+            msg = json.loads(msg)
+            if "kraken" in url:
+                sub = msg["subscription"]
+                stream = "book" if sub["name"] == "book" else "trades"
+                for pair in msg["pair"]:
+                    symbol = _meta.ws_sym2sym("kraken", pair)
+                    subs.append(
+                        Subscription("kraken", symbol, stream, sub.get("depth"))
+                    )
+                continue
+            for param in msg["params"]:
+                ws_symbol, stream = param.split("@")[:2]
+                symbol = _meta.ws_sym2sym("binance", ws_symbol)
+                stream = "book" if stream == "depth" else "trades"
+                subs.append(Subscription("binance", symbol, stream))
+
+    return [
+        (
+            s._replace(
+                orderbook_depth=depths.get(_meta.sym2rest_sym("binance", s.symbol))
+            )
+            if s.exch_name == "binance" and s.stream_name == "book"
+            else s
+        )
+        for s in dict.fromkeys(subs)
+    ]
+
+
+""" ==================== Measurements ==================== """
+
+
+def summarize(stage: str, params: dict, n: int, seconds: float, latencies) -> dict:
+    """result of a stage: messages/sec and latency percentiles (us)"""
+    lat = np.asarray(latencies, np.float64) / 1e3
+    p50, p99, p999 = np.percentile(lat, (50, 99, 99.9)) if len(lat) else (0, 0, 0)
+    return {
+        "stage": stage,
+        "params": params,
+        "n": n,
+        "msgs_per_sec": n / seconds if seconds else 0.0,
+        "p50_us": float(p50),
+        "p99_us": float(p99),
+        "p999_us": float(p999),
+    }
+
+
+def bench_calls(
+    stage: str, params: dict, make_fn: Callable[[], Callable[[Any], Any]], items: list
+) -> dict:
+    """
+    calls fn(item) for each item, once for the throughput and once timing
+    each call (make_fn returns a fresh fn for each run)
+    """
+    fn = make_fn()
+    t = time.perf_counter()
+    for item in items:
+        fn(item)
+    seconds = time.perf_counter() - t
+
+    fn, latencies = make_fn(), []
+    clock = time.perf_counter_ns
+    for item in items:
+        t0 = clock()
+        fn(item)
+        latencies.append(clock() - t0)
+    return summarize(stage, params, len(items), seconds, latencies)
+
+
+def bench_decode(params: dict, frames: dict[str, list]) -> Iterator[dict]:
+    decoders = {"binance": get_binance_decoder(), "kraken": get_kraken_decoder()}
+    for exch, exch_frames in frames.items():
+        if exch_frames:
+            decode = decoders[exch]
+            yield bench_calls(f"decode_{exch}", params, lambda: decode, exch_frames)
+
+
+def bench_parse(params: dict, frames: dict[str, list]) -> Iterator[dict]:
+    if frames["binance"]:
+        decode = get_binance_decoder()
+        data = [unwrap_msg_binance(decode(f)) for f in frames["binance"]]
+        parse = lambda d: parse_book_msg_binance("binance", "btcusdt", d)
+        yield bench_calls("parse_binance", params, lambda: parse, data)
+    if frames["kraken"]:
+        decode = get_kraken_decoder()
+        data = [decode(f) for f in frames["kraken"]]
+        parse = lambda d: parse_book_msg_kraken("kraken", "btcusdt", d)
+        yield bench_calls("parse_kraken", params, lambda: parse, data)
+
+
+def bench_sync(params: dict, frames: list[str], rest: dict[str, dict]) -> dict:
+    """BinanceWebsocket._process of updates that follow the snapshots"""
+
+    async def run() -> dict:
+        ws = BinanceWebsocket(StreamType.BOOK, list(rest), params["depth"])
+        events = [ws._parse_book_msg(unwrap_msg_binance(ws._decode(f))) for f in frames]
+        snapshots = [
+            parse_snapshot_binance("binance", symbol, 0, data)
+            for symbol, data in rest.items()
+        ]
+
+        async def process_all(latencies: Optional[list] = None) -> float:
+            for snapshot in snapshots:
+                ws.eventsBuffers[snapshot.symbol].reset()
+                await ws._process(snapshot)
+
+            clock = time.perf_counter_ns
+            t = clock()
+            for event in events:
+                t0 = clock()
+                await ws._process(event)
+                if latencies is not None:
+                    latencies.append(clock() - t0)
+            return (clock() - t) / 1e9
+
+        seconds = await process_all()
+        latencies: list[int] = []
+        await process_all(latencies)
+        return summarize("sync_binance", params, len(events), seconds, latencies)
+
+    return asyncio.run(run())
+
+
+def bench_books(params: dict, n: int) -> Iterator[dict]:
+    depth, update_size = params["depth"], params["update_size"]
+    snapshot = make_snapshot(depth)
+    updates = make_updates(n, depth, update_size)
+    for cls in _book_classes:
+        if cls is OrderbookAlt and depth > _max_alt_depth:
+            continue
+
+        def make_book():
+            book = cls("bench", "btcusdt", depth)
+            book.update(snapshot)
+            return book
+
+        name = cls.__name__
+        yield bench_calls(
+            f"book_update_{name}", params, lambda: make_book().update, updates
+        )
+
+        book = make_book()
+        for event in updates:
+            book.update(event)
+        snap = lambda _: book.take_snapshot(10)
+        yield bench_calls(f"book_snapshot_{name}", params, lambda: snap, range(n))
+
+
+async def _consume(source: Any, n: int, on_event: Callable[[Any], None]) -> list[int]:
+    """receives n events from a Websocket or WsManager, returns their latencies"""
+    latencies: list[int] = []
+    while len(latencies) < n:
+        events = await source.recv_many(timeout=5)
+        if not events:
+            break
+        for event in events:
+            on_event(event)
+            latencies.append(time.time_ns() - event.ts_recorded)
+    return latencies
+
+
+async def bench_handoff(params: dict, n: int) -> list[dict]:
+    """parsed trade -> consumer, replayed as fast as possible"""
+    symbols = bench_symbols(params["symbols"])
+    ws_symbols = [_meta.sym2ws_sym("binance", s) for s in symbols]
+    msg = prepare_trades_subscription_msg_binance(ws_symbols, 0)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        write_recording(directory, msg, binance_trade_frames(symbols, n))
+
+        replay = Replay(directory, speed=None)
+        ws = ReplayBinanceWebsocket(StreamType.TRADES, symbols, None)
+        replay.add(ws)
+        t = time.perf_counter()
+        await ws.connect()
+        latencies = await _consume(ws, n, lambda _: None)
+        seconds = time.perf_counter() - t
+        await ws.cleanup()
+        results.append(
+            summarize("handoff_websocket", params, len(latencies), seconds, latencies)
+        )
+
+        replay = Replay(directory, speed=None)
+        subs = [Subscription("binance", s, "trades") for s in symbols]
+        t = time.perf_counter()
+        async with WsManager(subs, replay=replay) as wsm:
+            latencies = await _consume(wsm, n, lambda _: None)
+        seconds = time.perf_counter() - t
+        results.append(
+            summarize("handoff_manager", params, len(latencies), seconds, latencies)
+        )
+    return results
+
+
+async def _bench_replay(
+    params: dict, replay: Replay, subs: list[Subscription], n: int
+) -> dict:
+    """frames -> synced Orderbook updates through WsManager"""
+    books: dict[tuple[str, str], Orderbook] = {}
+
+    def update_book(event: Any):
+        if isinstance(event, OrderbookEvent):
+            key = (event.exch_name, event.symbol)
+            book = books.get(key)
+            if book is None:
+                book = books[key] = Orderbook(*key, event_depth(subs, key))
+            book.update(event)
+
+    t = time.perf_counter()
+    async with WsManager(subs, replay=replay) as wsm:
+        latencies = await _consume(wsm, n, update_book)
+    seconds = time.perf_counter() - t
+    return summarize("end_to_end", params, len(latencies), seconds, latencies)
+
+
+def event_depth(subs: list[Subscription], key: tuple[str, str]) -> int:
+    for s in subs:
+        if (s.exch_name, s.symbol) == key and s.orderbook_depth:
+            return s.orderbook_depth
+    return 100
+
+
+async def bench_end_to_end(params: dict, n: int) -> dict:
+    symbols = bench_symbols(params["symbols"])
+    depth, update_size = params["depth"], params["update_size"]
+    frames, rest = binance_book_frames(symbols, n, depth, update_size)
+    ws_symbols = [_meta.sym2ws_sym("binance", s) for s in symbols]
+    msg = prepare_book_subscription_msg_binance(ws_symbols, 0)
+    with tempfile.TemporaryDirectory() as directory:
+        write_recording(directory, msg, frames, rest, depth)
+        subs = [Subscription("binance", s, "book", depth) for s in symbols]
+        replay = Replay(directory, speed=None)
+        return await _bench_replay(params, replay, subs, n + len(symbols))
+
+
+""" ==================== Runs ==================== """
+
+
+def run_synthetic(
+    depths: list[int], update_sizes: list[int], symbol_counts: list[int], n: int
+) -> Iterator[dict]:
+    symbols = bench_symbols(1)
+    for depth, update_size in product(depths, update_sizes):
+        params = {"depth": depth, "update_size": update_size}
+        bframes, rest = binance_book_frames(symbols, n, depth, update_size)
+        kframes = kraken_book_frames(symbols, n, depth, update_size)
+        frames = {"binance": bframes, "kraken": kframes}
+        yield from bench_decode(params, frames)
+        yield from bench_parse(params, frames)
+        yield bench_sync(params, bframes, rest)
+        yield from bench_books(params, n)
+
+    for n_symbols in symbol_counts:
+        yield from asyncio.run(bench_handoff({"symbols": n_symbols}, n))
+
+    for depth, update_size, n_symbols in product(depths, update_sizes, symbol_counts):
+        params = {"depth": depth, "update_size": update_size, "symbols": n_symbols}
+        yield asyncio.run(bench_end_to_end(params, n))
+
+
+def run_recording(path: str) -> Iterator[dict]:
+    """decode, parse and end_to_end on the frames of a recording"""
+    paths = Replay(path).paths
+    params = {"recording": path}
+    frames = recorded_frames(paths)
+    yield from bench_decode(params, frames)
+    yield from bench_parse(params, frames)
+
+    async def replay() -> dict:
+        n_frames = sum(
+            1 for p in paths for r in read_records(p) if r.kind == RecordKind.FRAME
+        )
+        return await _bench_replay(
+            params, Replay(path, speed=None), recorded_subscriptions(paths), n_frames
+        )
+
+    yield asyncio.run(replay())
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    """
+    returns the results that regressed against the baseline: throughput
+    lower or p99 latency higher by more than tolerance
+    """
+    key = lambda r: (r["stage"], json.dumps(r["params"], sort_keys=True))
+    base = {key(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = base.get(key(r))
+        if b is None or not b["msgs_per_sec"] or not b["p99_us"]:
+            continue
+        throughput = r["msgs_per_sec"] / b["msgs_per_sec"]
+        p99 = r["p99_us"] / b["p99_us"]
+        r["vs_baseline"] = {"msgs_per_sec": throughput, "p99_us": p99}
+        if throughput < 1 - tolerance or p99 > 1 + tolerance:
+            regressions.append(f"{r['stage']} {r['params']}")
+    return regressions
+
+
+def format_result(r: dict) -> str:
+    params = " ".join(f"{k}={v}" for k, v in r["params"].items())
+    line = (
+        f"{r['stage']:30s} {params:36s} {r['msgs_per_sec']:12.0f} "
+        f"{r['p50_us']:9.2f} {r['p99_us']:9.2f} {r['p999_us']:9.2f}"
+    )
+    vs = r.get("vs_baseline")
+    if vs is not None:
+        line += f"   x{vs['msgs_per_sec']:.2f} msgs/s, x{vs['p99_us']:.2f} p99"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--depths", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--update-sizes", type=int, nargs="+", default=[10])
+    parser.add_argument("--symbols", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("-n", type=int, default=20_000, help="messages per run")
+    parser.add_argument("--recording", help="benchmark a recording instead")
+    parser.add_argument("--output", help="saves the results as json")
+    parser.add_argument("--baseline", help="compares against a saved run")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    print(
+        f"{'stage':30s} {'params':36s} {'msgs/s':>12s} "
+        f"{'p50 (us)':>9s} {'p99 (us)':>9s} {'p999 (us)':>9s}"
+    )
+    if args.recording:
+        runs = run_recording(args.recording)
+    else:
+        runs = run_synthetic(args.depths, args.update_sizes, args.symbols, args.n)
+
+    results = []
+    for result in runs:
+        results.append(result)
+        print(format_result(result))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        print()
+        for r in results:
+            if "vs_baseline" in r:
+                print(format_result(r))
+        print(f"{len(regressions)} regressions (tolerance {args.tolerance:.0%})")
+        for line in regressions:
+            print(f"  {line}")
+
+    if args.output:
+        meta = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        }
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,19 @@
 import asyncio
 from collections import defaultdict
 from datetime import datetime
-from orderbook import Orderbook
+from typing import Sequence
+from orderbook import Orderbook, BookView
 
 from ws_apis import OrderbookEvent, Level, Subscription, WsManager
 
 
-def calculate_spot_price(b: list[Level], a: list[Level]) -> float:
+def calculate_spot_price(b: Sequence[Level], a: Sequence[Level]) -> float:
     if not a or not b:
         return 0.0
     return (b[0].price * a[0].qty + a[0].price * b[0].qty) / (b[0].qty + a[0].qty)
 
 
-def format_orderbook_snapshot(snap: OrderbookEvent, depth: int = 3) -> str:
+def format_orderbook_snapshot(snap: BookView, depth: int = 3) -> str:
     ts_exch = datetime.fromtimestamp(snap.ts_exchange / 1e9).strftime("%H:%M:%S.%f")
 
     info_str = f" - {ts_exch} - {snap.exch_name:<10s} ({snap.symbol:<8s}):"
@@ -33,7 +34,7 @@ async def maintain_orderbooks(
             exch_name, symbol = event.exch_name, event.symbol
 
             if isinstance(event, OrderbookEvent):
-                await orderbooks[exch_name][symbol].async_update(event)
+                orderbooks[exch_name][symbol].update(event)
 
 
 async def print_orderbooks(orderbooks: dict[str, dict[str, Orderbook]]) -> None:
@@ -42,7 +43,7 @@ async def print_orderbooks(orderbooks: dict[str, dict[str, Orderbook]]) -> None:
         print(f"\n{t} - Orderbook snapshots:")
         for exch_obs in orderbooks.values():
             for ob in exch_obs.values():
-                snap = await ob.async_take_snapshot()
+                snap = ob.top_view()
                 print(format_orderbook_snapshot(snap))
 
         await asyncio.sleep(1)
@@ -0,0 +1,487 @@
+"""
+Local stand-in for the binance and kraken websocket apis (and the binance
+depth snapshot endpoint), generating synthetic books and trades to load test
+BinanceWebsocket, KrakenWebsocket and WsManager on one machine.
+
+usage: python mock_exchange.py [--rate N] [--symbols N] [--depth N] ...
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+
+import websockets
+
+from aiohttp import web
+from typing import Any, Optional
+from ws_apis import BinanceWebsocket, KrakenWebsocket
+from ws_apis.utils import SymbolsMeta
+
+_tick = 0.01
+
+
+class SyntheticBook:
+    """
+    Random walk orderbook: updates land close to the top, the mid drifts by a
+    tick now and then (levels it crosses are deleted). update_id counts the
+    level changes like binance's update ids.
+    """
+
+    def __init__(self, rng: random.Random, depth: int, mid: float = 20_000.0):
+        self.rng = rng
+        self.depth = depth
+        self.mid = mid
+        self.bids = {round(mid - i * _tick, 2): 1.0 for i in range(1, depth + 1)}
+        self.asks = {round(mid + i * _tick, 2): 1.0 for i in range(1, depth + 1)}
+        self.update_id = 1
+
+    def _drift(self, bids: list, asks: list):
+        self.mid = round(self.mid + self.rng.choice((-_tick, _tick)), 2)
+        for price in [p for p in self.bids if p >= self.mid]:
+            del self.bids[price]
+            bids.append((price, 0.0))
+        for price in [p for p in self.asks if p <= self.mid]:
+            del self.asks[price]
+            asks.append((price, 0.0))
+
+    def step(self, n_levels: int) -> tuple[int, int, list, list]:
+        """changes n_levels levels, returns first and last update id, bids, asks"""
+        bids: list[tuple[float, float]] = []
+        asks: list[tuple[float, float]] = []
+        if self.rng.random() < 0.05:
+            self._drift(bids, asks)
+
+        for _ in range(n_levels):
+            is_bid = self.rng.random() < 0.5
+            offset = min(int(self.rng.expovariate(1 / 5)), 2 * self.depth) + 1
+            price = round(
+                self.mid - offset * _tick if is_bid else self.mid + offset * _tick, 2
+            )
+            qty = (
+                0.0 if self.rng.random() < 0.3 else round(self.rng.uniform(0.001, 5), 3)
+            )
+            side, changes = (self.bids, bids) if is_bid else (self.asks, asks)
+            if qty > 0:
+                side[price] = qty
+            else:
+                side.pop(price, None)
+            changes.append((price, qty))
+
+        first = self.update_id
+        self.update_id += len(bids) + len(asks)
+        return first, self.update_id - 1, bids, asks
+
+    def top(self, limit: int) -> tuple[list, list]:
+        bids = sorted(self.bids.items(), reverse=True)[:limit]
+        asks = sorted(self.asks.items())[:limit]
+        return bids, asks
+
+    def trade(self) -> tuple[float, float, bool]:
+        """returns price, qty and whether the buyer was the maker"""
+        is_sell = self.rng.random() < 0.5
+        price = self.mid - _tick if is_sell else self.mid + _tick
+        return round(price, 2), round(self.rng.uniform(0.001, 1), 3), is_sell
+
+
+def _binance_levels(levels: list) -> list[list[str]]:
+    return [[f"{p:.2f}", f"{q:.3f}"] for p, q in levels]
+
+
+def _kraken_levels(levels: list, ts: str) -> list[list[str]]:
+    return [[f"{p:.5f}", f"{q:.8f}", ts] for p, q in levels]
+
+
+class MockExchange:
+    """
+    Serves the binance combined stream (depthUpdate and aggTrade frames) on
+    ws://host:port/binance/stream, the kraken book, trade and heartbeat
+    messages on ws://host:port/kraken and binance depth snapshots on
+    http://host:rest_port/api/v3/depth, with lastUpdateIds consistent with
+    the streamed updates.
+
+    Each served symbol (the first n_symbols known to both exchanges, or
+    symbols) has one synthetic book per exchange, updated rate times per
+    second with levels_per_update levels, and trade_rate trades per second.
+    With gap_prob a book update is dropped (binance clients see a gap and
+    resync), with disconnect_interval every connection is closed after that
+    many seconds (clients reconnect).
+
+    Using it as an async context manager starts the servers and points the
+    class-level _ws_url/_rest_url of the websockets at them.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 8765,
+        rest_port: int = 8766,
+        n_symbols: int = 10,
+        symbols: Optional[list[str]] = None,
+        rate: float = 100.0,
+        trade_rate: float = 10.0,
+        depth: int = 100,
+        levels_per_update: int = 5,
+        gap_prob: float = 0.0,
+        disconnect_interval: Optional[float] = None,
+        heartbeat_interval: float = 1.0,
+        seed: int = 0,
+    ):
+        self.host = host
+        self.port = port
+        self.rest_port = rest_port
+        self.rate = rate
+        self.trade_rate = trade_rate
+        self.depth = depth
+        self.levels_per_update = levels_per_update
+        self.gap_prob = gap_prob
+        self.disconnect_interval = disconnect_interval
+        self.heartbeat_interval = heartbeat_interval
+
+        self._meta = SymbolsMeta()
+        if symbols is None:
+            both = set(self._meta.sym2ws["binance"]) & set(self._meta.sym2ws["kraken"])
+            symbols = sorted(both)[:n_symbols]
+        self.symbols = symbols
+
+        self._rng = random.Random(seed)
+        self._books = {
+            (exch, s): SyntheticBook(self._rng, depth)
+            for exch in ("binance", "kraken")
+            for s in symbols
+        }
+        # (exch, symbol) -> channel -> connections, channels are binance stream
+        # names and kraken channel names ("book-10", "trade")
+        self._subscribers: dict[tuple[str, str], dict[str, set]] = {}
+        self._channel_ids: dict[tuple[str, str, str], int] = {}
+
+        self.n_connections = 0
+        self.n_messages = 0
+        self.n_gaps = 0
+        self.n_disconnects = 0
+
+        self._logger = logging.getLogger(__name__)
+        self._tasks: list[asyncio.Task] = []
+        self._server: Optional[Any] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._saved_urls: Optional[tuple] = None
+
+    @property
+    def binance_ws_url(self) -> str:
+        return f"ws://{self.host}:{self.port}/binance/stream"
+
+    @property
+    def kraken_ws_url(self) -> str:
+        return f"ws://{self.host}:{self.port}/kraken"
+
+    @property
+    def rest_url(self) -> str:
+        return f"http://{self.host}:{self.rest_port}/"
+
+    async def __aenter__(self):
+        await self.start()
+        self.patch_clients()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.restore_clients()
+        await self.stop()
+
+    def patch_clients(self):
+        """points the websocket classes at the mock"""
+        self._saved_urls = (
+            BinanceWebsocket._ws_url,
+            BinanceWebsocket._rest_url,
+            KrakenWebsocket._ws_url,
+        )
+        BinanceWebsocket._ws_url = self.binance_ws_url
+        BinanceWebsocket._rest_url = self.rest_url
+        KrakenWebsocket._ws_url = self.kraken_ws_url
+
+    def restore_clients(self):
+        if self._saved_urls is not None:
+            (
+                BinanceWebsocket._ws_url,
+                BinanceWebsocket._rest_url,
+                KrakenWebsocket._ws_url,
+            ) = self._saved_urls
+            self._saved_urls = None
+
+    async def start(self):
+        self._server = await websockets.serve(
+            self._handle, self.host, self.port, max_size=None
+        )
+
+        app = web.Application()
+        app.router.add_get("/api/v3/depth", self._depth)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.rest_port).start()
+
+        loop = asyncio.get_running_loop()
+        self._tasks = [
+            loop.create_task(self._generate()),
+            loop.create_task(self._heartbeats()),
+        ]
+        self._logger.info(f"mock exchange on {self.host}:{self.port}/{self.rest_port}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    """ ==================== Connections ==================== """
+
+    def _parse_subscription(self, exch: str, msg: dict) -> list[tuple[str, str]]:
+        """returns the (symbol, channel) pairs of a subscription message"""
+        subs = []
+        if exch == "binance":
+            for param in msg.get("params", []):
+                ws_symbol, _, _ = param.partition("@")
+                symbol = self._meta.ws_sym2sym(exch, ws_symbol)
+                subs.append((symbol, param))
+        else:
+            sub = msg["subscription"]
+            channel = f"book-{sub['depth']}" if sub["name"] == "book" else sub["name"]
+            for pair in msg["pair"]:
+                subs.append((self._meta.ws_sym2sym(exch, pair), channel))
+        return subs
+
+    async def _subscribe(self, conn: Any, exch: str, msg: dict) -> list[tuple]:
+        keys = []
+        for symbol, channel in self._parse_subscription(exch, msg):
+            if (exch, symbol) not in self._books:
+                self._logger.info(f"{exch} {symbol} is not served")
+                continue
+            keys.append((exch, symbol, channel))
+            self._channel_ids.setdefault(keys[-1], len(self._channel_ids))
+
+        if exch == "binance":
+            for key in keys:
+                self._subscribe_channel(conn, key)
+            await conn.send(json.dumps({"result": None, "id": msg.get("id")}))
+            return keys
+
+        for key in keys:
+            _, symbol, channel = key
+            pair = self._meta.sym2ws_sym(exch, symbol)
+            status = {
+                "event": "subscriptionStatus",
+                "pair": pair,
+                "status": "subscribed",
+            }
+            await conn.send(json.dumps(status))
+            # send writes before it yields, no update can go before the snapshot
+            snapshot = (
+                self._kraken_snapshot(symbol, channel) if "book" in channel else None
+            )
+            self._subscribe_channel(conn, key)
+            if snapshot is not None:
+                await conn.send(snapshot)
+        return keys
+
+    def _subscribe_channel(self, conn: Any, key: tuple[str, str, str]):
+        exch, symbol, channel = key
+        channels = self._subscribers.setdefault((exch, symbol), {})
+        channels.setdefault(channel, set()).add(conn)
+
+    async def _handle(self, conn: Any):
+        exch = "kraken" if conn.path.startswith("/kraken") else "binance"
+        self.n_connections += 1
+        keys = []
+        try:
+            keys = await self._subscribe(conn, exch, json.loads(await conn.recv()))
+            if self.disconnect_interval is None:
+                await conn.wait_closed()
+                return
+            try:
+                await asyncio.wait_for(conn.wait_closed(), self.disconnect_interval)
+            except asyncio.TimeoutError:
+                self.n_disconnects += 1
+                await conn.close(1001, "going away")
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for exch, symbol, channel in keys:
+                self._subscribers[(exch, symbol)][channel].discard(conn)
+
+    def _broadcast(self, key: tuple[str, str, str], msg: str):
+        conns = self._subscribers[key[:2]][key[2]]
+        websockets.broadcast(conns, msg)
+        self.n_messages += len(conns)
+
+    """ ==================== Messages ==================== """
+
+    def _channels(self, exch: str, symbol: str, kind: str) -> list[tuple]:
+        """returns the subscribed channels of a book that contain kind"""
+        channels = self._subscribers.get((exch, symbol), {})
+        return [
+            (exch, symbol, c) for c, conns in channels.items() if conns and kind in c
+        ]
+
+    def _kraken_snapshot(self, symbol: str, channel: str) -> str:
+        book = self._books[("kraken", symbol)]
+        bids, asks = book.top(int(channel.split("-")[1]))
+        ts = f"{time.time():.6f}"
+        pair = self._meta.sym2ws_sym("kraken", symbol)
+        levels = {"as": _kraken_levels(asks, ts), "bs": _kraken_levels(bids, ts)}
+        channel_id = self._channel_ids[("kraken", symbol, channel)]
+        return json.dumps([channel_id, levels, channel, pair])
+
+    def _book_update(self, exch: str, symbol: str):
+        book = self._books[(exch, symbol)]
+        first, last, bids, asks = book.step(self.levels_per_update)
+        if self.gap_prob and self._rng.random() < self.gap_prob:
+            self.n_gaps += 1
+            return
+
+        if exch == "binance":
+            data = {
+                "e": "depthUpdate",
+                "E": int(time.time() * 1000),
+                "s": self._meta.sym2rest_sym(exch, symbol),
+                "U": first,
+                "u": last,
+                "b": _binance_levels(bids),
+                "a": _binance_levels(asks),
+            }
+            for key in self._channels(exch, symbol, "@depth"):
+                self._broadcast(key, json.dumps({"stream": key[2], "data": data}))
+            return
+
+        ts = f"{time.time():.6f}"
+        pair = self._meta.sym2ws_sym(exch, symbol)
+        parts = []
+        if asks:
+            parts.append({"a": _kraken_levels(asks, ts)})
+        if bids:
+            parts.append({"b": _kraken_levels(bids, ts)})
+        if not parts:
+            return
+        for key in self._channels(exch, symbol, "book"):
+            msg = [self._channel_ids[key], *parts, key[2], pair]
+            self._broadcast(key, json.dumps(msg))
+
+    def _trade(self, exch: str, symbol: str):
+        price, qty, is_sell = self._books[(exch, symbol)].trade()
+        if exch == "binance":
+            ts = int(time.time() * 1000)
+            data = {
+                "e": "aggTrade",
+                "E": ts,
+                "s": self._meta.sym2rest_sym(exch, symbol),
+                "p": f"{price:.2f}",
+                "q": f"{qty:.3f}",
+                "T": ts,
+                "m": is_sell,
+            }
+            for key in self._channels(exch, symbol, "@aggTrade"):
+                self._broadcast(key, json.dumps({"stream": key[2], "data": data}))
+            return
+
+        pair = self._meta.sym2ws_sym(exch, symbol)
+        side = "s" if is_sell else "b"
+        trade = [f"{price:.5f}", f"{qty:.8f}", f"{time.time():.6f}", side, "l", ""]
+        for key in self._channels(exch, symbol, "trade"):
+            self._broadcast(
+                key, json.dumps([self._channel_ids[key], [trade], "trade", pair])
+            )
+
+    async def _generate(self, interval: float = 0.01):
+        """updates every book rate times per second, in batches every interval"""
+        last = time.monotonic()
+        n_updates, n_trades = 0.0, 0.0
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            n_updates += (now - last) * self.rate
+            n_trades += (now - last) * self.trade_rate
+            last = now
+
+            for _ in range(int(n_updates)):
+                for exch, symbol in self._books:
+                    self._book_update(exch, symbol)
+            for _ in range(int(n_trades)):
+                for exch, symbol in self._books:
+                    self._trade(exch, symbol)
+            n_updates -= int(n_updates)
+            n_trades -= int(n_trades)
+
+    async def _heartbeats(self):
+        msg = json.dumps({"event": "heartbeat"})
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            conns = set()
+            for (exch, _), channels in self._subscribers.items():
+                if exch == "kraken":
+                    conns.update(*channels.values())
+            websockets.broadcast(conns, msg)
+
+    """ ==================== REST ==================== """
+
+    async def _depth(self, request: web.Request) -> web.Response:
+        rest_symbol = request.query.get("symbol", "")
+        limit = int(request.query.get("limit", 100))
+        try:
+            symbol = self._meta.rest_sym2sym("binance", rest_symbol)
+            book = self._books[("binance", symbol)]
+        except KeyError:
+            error = {"code": -1121, "msg": "Invalid symbol."}
+            return web.json_response(error, status=400)
+
+        bids, asks = book.top(limit)
+        snapshot = {
+            "lastUpdateId": book.update_id - 1,
+            "bids": _binance_levels(bids),
+            "asks": _binance_levels(asks),
+        }
+        return web.json_response(snapshot)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rest-port", type=int, default=8766)
+    parser.add_argument("--symbols", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=100.0)
+    parser.add_argument("--trade-rate", type=float, default=10.0)
+    parser.add_argument("--depth", type=int, default=100)
+    parser.add_argument("--levels-per-update", type=int, default=5)
+    parser.add_argument("--gap-prob", type=float, default=0.0)
+    parser.add_argument("--disconnect-interval", type=float, default=None)
+    args = parser.parse_args()
+
+    mock = MockExchange(
+        args.host,
+        args.port,
+        args.rest_port,
+        n_symbols=args.symbols,
+        rate=args.rate,
+        trade_rate=args.trade_rate,
+        depth=args.depth,
+        levels_per_update=args.levels_per_update,
+        gap_prob=args.gap_prob,
+        disconnect_interval=args.disconnect_interval,
+    )
+    await mock.start()
+    print(f"binance: {mock.binance_ws_url} {mock.rest_url}")
+    print(f"kraken:  {mock.kraken_ws_url}")
+    print(f"symbols: {' '.join(mock.symbols)}")
+    while True:
+        await asyncio.sleep(10)
+        print(f"connections: {mock.n_connections}, messages: {mock.n_messages}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -1,16 +1,19 @@
 import asyncio
+import heapq
 import logging
 
 from copy import deepcopy
-from ws_apis.events import OrderbookEvent, OBEventType, Level
-from typing import Any, Callable, Optional
+from ws_apis.book_side import SortedSide
+from ws_apis.events import OrderbookEvent, OBEventType, Level, level_pairs
+from ws_apis.latency import Stage
+from typing import Any, Callable, NamedTuple, Optional
 
 
-def _update_side(side: dict[float, float], level: Level):
-    if level.price in side and level.qty <= 0:
-        del side[level.price]
-    elif level.qty > 0:
-        side[level.price] = level.qty
+def _update_side(side: dict[float, float], price: float, qty: float):
+    if price in side and qty <= 0:
+        del side[price]
+    elif qty > 0:
+        side[price] = qty
 
 
 def _trim_side(side: dict[float, float], depth: int, reverse: bool = False):
@@ -19,10 +22,56 @@ def _trim_side(side: dict[float, float], depth: int, reverse: bool = False):
         del side[k]
 
 
+class ViewLevel(NamedTuple):
+    price: float
+    qty: float
+
+
+class BookView(NamedTuple):
+    """immutable snapshot of the top levels of a book (see Orderbook.top_view)"""
+
+    exch_name: str
+    symbol: str
+    bids: tuple[ViewLevel, ...]  # best first
+    asks: tuple[ViewLevel, ...]
+    ts_exchange: int
+    ts_recorded: int
+
+
+# callbacks are called with the orderbook and the event that was applied
+BookCallback = Callable[["Orderbook", OrderbookEvent], Any]
+
+
+def _view_bounds(bids: list[Level], asks: list[Level], n: int) -> tuple[float, float]:
+    """prices beyond which updates don't change the top n levels"""
+    floor = bids[-1].price if len(bids) == n else float("-inf")
+    ceil = asks[-1].price if len(asks) == n else float("inf")
+    return floor, ceil
+
+
+def _touches(event: OrderbookEvent, floor: float, ceil: float) -> bool:
+    """returns true if the update has bids at or above floor or asks at or below ceil"""
+    return any(p >= floor for p, _ in level_pairs(event.bids)) or any(
+        p <= ceil for p, _ in level_pairs(event.asks)
+    )
+
+
 class Orderbook:
     """
     Orderbook maintains a local copy of the orderbook for a given symbol.
     It updates the orderbook state when it receives an update from the exchange.
+    Events with LevelColumns are applied straight from the price/qty arrays.
+
+    top_view returns an immutable snapshot of the top levels (BookView) that
+    is only rebuilt after an update touched them (updates beyond the n-th
+    level leave it as is), so polling it is cheap and needs no lock: updates
+    are synchronous and the view is replaced rather than modified.
+
+    Instead of polling, consumers can wait for changes (wait_bbo_change,
+    wait_change) or register callbacks (on_change, on_update). They are
+    notified only when an update changed the watched top levels (a price or
+    a qty): updates beyond their bounds are skipped as for top_view, the
+    others are checked against the levels last notified.
     """
 
     def __init__(self, exch_name: str, symbol: str, depth: int):
@@ -35,21 +84,33 @@ class Orderbook:
         self.ts_exchange: int = 0
         self.ts_recorded: int = 0
 
+        self._view: Optional[BookView] = None
+        self._view_depth = 0
+        self._view_dirty = True
+        self._bid_floor = float("-inf")  # updates below don't touch the view
+        self._ask_ceil = float("inf")
+
+        # top levels watched by waiters and callbacks, as last notified (by levels)
+        self._watched: dict[int, tuple[list[Level], list[Level]]] = {}
+        self._waiters: dict[int, list[asyncio.Future]] = {}
+        self._on_change: dict[int, list[BookCallback]] = {}
+        self._on_update: list[BookCallback] = []
+
         self._lock = asyncio.Lock()
         self._logger = logging.getLogger(__name__)
 
     def _handle_snapshot(self, event: OrderbookEvent):
         self._logger.info(f"taking snapshot of {self.symbol}")
 
-        self.asks = {l.price: l.qty for l in event.asks}
-        self.bids = {l.price: l.qty for l in event.bids}
+        self.asks = dict(level_pairs(event.asks))
+        self.bids = dict(level_pairs(event.bids))
 
     def _handle_update(self, event: OrderbookEvent):
-        for l in event.asks:
-            _update_side(self.asks, l)
+        for p, q in level_pairs(event.asks):
+            _update_side(self.asks, p, q)
 
-        for l in event.bids:
-            _update_side(self.bids, l)
+        for p, q in level_pairs(event.bids):
+            _update_side(self.bids, p, q)
 
         if len(self.asks) > self.depth:
             _trim_side(self.asks, self.depth)
@@ -63,20 +124,130 @@ class Orderbook:
 
         if event.type == OBEventType.SNAPSHOT:
             self._handle_snapshot(event)
+            self._view_dirty = True
         else:
             self._handle_update(event)
+            if not self._view_dirty:
+                self._view_dirty = _touches(event, self._bid_floor, self._ask_ceil)
+
+        if event.stamps is not None:
+            event.stamps.mark(Stage.APPLIED)
+        if self._watched or self._on_update:
+            self._notify(event)
+
+    def _top_levels(self, n: int) -> tuple[list[Level], list[Level]]:
+        """returns the best n bids and asks, best first"""
+        bids = heapq.nlargest(n, self.bids.items())
+        asks = heapq.nsmallest(n, self.asks.items())
+        return [Level(p, q) for p, q in bids], [Level(p, q) for p, q in asks]
 
     def take_snapshot(self, depth: Optional[int] = None) -> OrderbookEvent:
         depth = depth or self.depth
+        bids, asks = self._top_levels(depth)
         return OrderbookEvent(
             self.exch_name,
             self.symbol,
             OBEventType.SNAPSHOT,
-            [Level(p, q) for p, q in sorted(self.bids.items(), reverse=True)[:depth]],
-            [Level(p, q) for p, q in sorted(self.asks.items())[:depth]],
+            bids,
+            asks,
+            self.ts_exchange,
+            self.ts_recorded,
+        )
+
+    def top_view(self, n: Optional[int] = None) -> BookView:
+        """
+        returns a shared, immutable snapshot of the top n levels (n defaults
+        to depth). its timestamps are those of the last update that changed
+        them.
+        """
+        n = n or self.depth
+        view = self._view
+        if view is not None and not self._view_dirty and self._view_depth == n:
+            return view
+
+        bids, asks = self._top_levels(n)
+        view = BookView(
+            self.exch_name,
+            self.symbol,
+            tuple(ViewLevel(l.price, l.qty) for l in bids),
+            tuple(ViewLevel(l.price, l.qty) for l in asks),
             self.ts_exchange,
             self.ts_recorded,
         )
+        self._bid_floor, self._ask_ceil = _view_bounds(bids, asks, n)
+        self._view, self._view_depth, self._view_dirty = view, n, False
+        return view
+
+    def _watch(self, levels: int):
+        if levels not in self._watched:
+            self._watched[levels] = self._top_levels(levels)
+
+    def _unwatch(self, levels: int):
+        if not self._waiters.get(levels) and not self._on_change.get(levels):
+            self._watched.pop(levels, None)
+            self._waiters.pop(levels, None)
+            self._on_change.pop(levels, None)
+
+    def _call(self, callback: BookCallback, event: OrderbookEvent):
+        try:
+            callback(self, event)
+        except Exception as e:
+            self._logger.exception(f"exception in orderbook callback: {e}")
+
+    def _notify(self, event: OrderbookEvent):
+        """wakes the waiters and calls the callbacks of the changed top levels"""
+        for callback in self._on_update:
+            self._call(callback, event)
+
+        is_snapshot = event.type == OBEventType.SNAPSHOT
+        for levels, (bids, asks) in list(self._watched.items()):
+            floor, ceil = _view_bounds(bids, asks, levels)
+            if not is_snapshot and not _touches(event, floor, ceil):
+                continue
+            # the update may resend a qty or delete a missing level
+            top = self._top_levels(levels)
+            if top == (bids, asks):
+                continue
+
+            self._watched[levels] = top
+            waiters = self._waiters.pop(levels, [])
+            self._unwatch(levels)
+
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(self)
+            for callback in self._on_change.get(levels, []):
+                self._call(callback, event)
+
+    async def wait_change(self, levels: int = 1) -> "Orderbook":
+        """waits until an update changes the top levels, returns the orderbook"""
+        self._watch(levels)
+        future = asyncio.get_running_loop().create_future()
+        waiters = [w for w in self._waiters.get(levels, []) if not w.done()]
+        waiters.append(future)
+        self._waiters[levels] = waiters
+        return await future
+
+    async def wait_bbo_change(self) -> "Orderbook":
+        """waits until the best bid or ask (price or qty) changes"""
+        return await self.wait_change(1)
+
+    def on_change(self, callback: BookCallback, levels: int = 1):
+        """calls callback(orderbook, event) whenever an update changes the top levels"""
+        self._watch(levels)
+        self._on_change.setdefault(levels, []).append(callback)
+
+    def on_update(self, callback: BookCallback):
+        """calls callback(orderbook, event) after every update"""
+        self._on_update.append(callback)
+
+    def remove_callback(self, callback: BookCallback):
+        if callback in self._on_update:
+            self._on_update.remove(callback)
+        for levels, callbacks in list(self._on_change.items()):
+            if callback in callbacks:
+                callbacks.remove(callback)
+                self._unwatch(levels)
 
     async def async_update(self, event: OrderbookEvent):
         """thread-safe update of the orderbook"""
@@ -89,6 +260,41 @@ class Orderbook:
             return self.take_snapshot(depth)
 
 
+""" ==================== Sorted Orderbook ==================== """
+
+
+class SortedOrderbook(Orderbook):
+    """
+    Version of Orderbook that keeps both sides in price order.
+    Updates only bisect into the sorted keys, trimming drops the worst levels
+    without sorting and snapshots read the top levels straight off each side.
+    """
+
+    def __init__(self, exch_name: str, symbol: str, depth: int):
+        super().__init__(exch_name, symbol, depth)
+        self.asks = SortedSide(is_bids=False)
+        self.bids = SortedSide(is_bids=True)
+
+    def _handle_snapshot(self, event: OrderbookEvent):
+        self._logger.info(f"taking snapshot of {self.symbol}")
+
+        self.asks.load(level_pairs(event.asks))
+        self.bids.load(level_pairs(event.bids))
+
+    def _handle_update(self, event: OrderbookEvent):
+        for p, q in level_pairs(event.asks):
+            self.asks.set(p, q)
+
+        for p, q in level_pairs(event.bids):
+            self.bids.set(p, q)
+
+        self.asks.trim(self.depth)
+        self.bids.trim(self.depth)
+
+    def _top_levels(self, n: int) -> tuple[list[Level], list[Level]]:
+        return self.bids.top(n), self.asks.top(n)
+
+
 """ ==================== Orderbook Alt ==================== """
 
 
@@ -159,8 +365,8 @@ class OrderbookAlt:
 
     def _handle_snapshot(self, event: OrderbookEvent):
         self._logger.info(f"Received snapshot for {self.symbol}")
-        self.bids = event.bids
-        self.asks = event.asks
+        self.bids = list(event.bids)
+        self.asks = list(event.asks)
 
     def _handle_update(self, event: OrderbookEvent):
         for b in event.bids:
@@ -179,6 +385,8 @@ class OrderbookAlt:
             self._handle_snapshot(event)
         elif event.type == OBEventType.UPDATE:
             self._handle_update(event)
+        if event.stamps is not None:
+            event.stamps.mark(Stage.APPLIED)
 
     def take_snapshot(self, depth: Optional[int] = None) -> OrderbookEvent:
         """takes a snapshot of the current state of the orderbook"""
@@ -0,0 +1,199 @@
+import logging
+
+from ws_apis.book_side import SortedSide
+from ws_apis.events import OrderbookEvent, OBEventType, Level, level_pairs
+from typing import Iterable, Optional
+
+from orderbook import Orderbook
+
+
+class ConsolidatedSide:
+    """
+    One side of a consolidated orderbook: the book side of each venue and a
+    merged side with the qty summed over the venues at each price.
+
+    Setting a level of a venue updates the merged qty at that price only, so
+    an update costs a bisect into the merged side (plus a sum over the few
+    venues quoting that price).
+    """
+
+    def __init__(self, is_bids: bool):
+        self.is_bids = is_bids
+        self.merged = SortedSide(is_bids)
+        self.venues: dict[str, SortedSide] = {}
+        self.by_price: dict[float, dict[str, float]] = {}  # price -> venue -> qty
+
+    def _venue_side(self, venue: str) -> SortedSide:
+        side = self.venues.get(venue)
+        if side is None:
+            side = self.venues[venue] = SortedSide(self.is_bids)
+        return side
+
+    def _set_merged(self, venue: str, price: float, qty: float):
+        shares = self.by_price.get(price)
+        if qty > 0:
+            if shares is None:
+                shares = self.by_price[price] = {}
+            shares[venue] = qty
+        elif shares is not None:
+            shares.pop(venue, None)
+            if not shares:
+                del self.by_price[price]
+                shares = None
+
+        self.merged.set(price, sum(shares.values()) if shares else 0)
+
+    def set(self, venue: str, price: float, qty: float):
+        """sets the qty of venue at price, a qty <= 0 deletes the level"""
+        self._venue_side(venue).set(price, qty)
+        self._set_merged(venue, price, qty)
+
+    def load(self, venue: str, levels: Iterable[tuple[float, float]]):
+        """replaces the levels of venue"""
+        side = self._venue_side(venue)
+        for price in list(side.levels):
+            self._set_merged(venue, price, 0)
+        side.load(levels)
+        for price, qty in side.levels.items():
+            self._set_merged(venue, price, qty)
+
+    def remove(self, venue: str):
+        """removes the levels of venue"""
+        if venue in self.venues:
+            self.load(venue, [])
+            del self.venues[venue]
+
+    def trim(self, venue: str, depth: int):
+        """removes the levels of venue beyond depth"""
+        for price in self._venue_side(venue).trim(depth):
+            self._set_merged(venue, price, 0)
+
+    def best(self, venue: Optional[str] = None) -> Optional[Level]:
+        """returns the best merged level (or the best level of venue)"""
+        if venue is None:
+            return self.merged.best()
+        side = self.venues.get(venue)
+        return side.best() if side is not None else None
+
+    def qty_at(self, price: float) -> float:
+        """returns the qty at price summed over the venues"""
+        return self.merged.levels.get(price, 0)
+
+    def venues_at(self, price: float) -> dict[str, float]:
+        """returns the qty of each venue at price"""
+        return dict(self.by_price.get(price, {}))
+
+    def top(self, n: Optional[int] = None) -> list[tuple[Level, dict[str, float]]]:
+        """returns the best n merged levels with the qty of each venue, best first"""
+        return [(l, dict(self.by_price[l.price])) for l in self.merged.top(n)]
+
+
+class ConsolidatedOrderbook:
+    """
+    Orderbook of one symbol consolidated across venues (exchanges).
+
+    Orderbook events of any venue are applied incrementally to the venue's
+    levels and to the merged ladder (see ConsolidatedSide), so the best
+    prices, the depth at a price and the spreads across venues are read in
+    constant time instead of merging snapshots.
+
+    attach() loads the levels of an Orderbook and then follows its updates,
+    detach() stops following it and removes its levels.
+    Prices of the venues have to be in the same units (all floats, or
+    fixed-point ints with the same scale).
+    """
+
+    def __init__(self, symbol: str, depth: int):
+        self.symbol = symbol
+        self.depth = depth
+
+        self.bids = ConsolidatedSide(is_bids=True)
+        self.asks = ConsolidatedSide(is_bids=False)
+        self.ts_exchange: dict[str, int] = {}  # by venue
+        self.ts_recorded: int = 0
+
+        self._logger = logging.getLogger(__name__)
+
+    @property
+    def venues(self) -> list[str]:
+        return list(self.ts_exchange)
+
+    def update(self, event: OrderbookEvent):
+        """applies an orderbook event of the venue event.exch_name"""
+        venue = event.exch_name
+        self.ts_exchange[venue] = event.ts_exchange
+        self.ts_recorded = max(self.ts_recorded, event.ts_recorded)
+
+        if event.type == OBEventType.SNAPSHOT:
+            self._logger.info(f"taking snapshot of {venue} {self.symbol}")
+            self.bids.load(venue, level_pairs(event.bids))
+            self.asks.load(venue, level_pairs(event.asks))
+            return
+
+        for p, q in level_pairs(event.bids):
+            self.bids.set(venue, p, q)
+        for p, q in level_pairs(event.asks):
+            self.asks.set(venue, p, q)
+
+        self.bids.trim(venue, self.depth)
+        self.asks.trim(venue, self.depth)
+
+    def attach(self, orderbook: Orderbook):
+        """loads the current levels of orderbook, then follows its updates"""
+        self.update(orderbook.take_snapshot(self.depth))
+        orderbook.on_update(self._on_book_update)
+
+    def detach(self, orderbook: Orderbook):
+        """stops following orderbook and removes its levels"""
+        orderbook.remove_callback(self._on_book_update)
+        self.remove_venue(orderbook.exch_name)
+
+    def remove_venue(self, venue: str):
+        """removes the levels of venue"""
+        self.bids.remove(venue)
+        self.asks.remove(venue)
+        self.ts_exchange.pop(venue, None)
+
+    def _on_book_update(self, orderbook: Orderbook, event: OrderbookEvent):
+        self.update(event)
+
+    def best_bid(self, venue: Optional[str] = None) -> Optional[Level]:
+        return self.bids.best(venue)
+
+    def best_ask(self, venue: Optional[str] = None) -> Optional[Level]:
+        return self.asks.best(venue)
+
+    def spread(self) -> Optional[float]:
+        """best ask minus best bid over all venues (negative if the venues cross)"""
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+        return ask.price - bid.price
+
+    def mid_price(self) -> Optional[float]:
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+        return (bid.price + ask.price) / 2
+
+    def cross_venue_spread(self, buy_venue: str, sell_venue: str) -> Optional[float]:
+        """best ask of buy_venue minus best bid of sell_venue (negative = arbitrage)"""
+        ask, bid = self.asks.best(buy_venue), self.bids.best(sell_venue)
+        if bid is None or ask is None:
+            return None
+        return ask.price - bid.price
+
+    def take_snapshot(self, depth: Optional[int] = None) -> OrderbookEvent:
+        """returns the merged levels (other holds the qty of each venue per level)"""
+        depth = depth or self.depth
+        bids, asks = self.bids.top(depth), self.asks.top(depth)
+        return OrderbookEvent(
+            "consolidated",
+            self.symbol,
+            OBEventType.SNAPSHOT,
+            [l for l, _ in bids],
+            [l for l, _ in asks],
+            max(self.ts_exchange.values(), default=0),
+            self.ts_recorded,
+            other={"bids": [v for _, v in bids], "asks": [v for _, v in asks]},
+        )
@@ -0,0 +1,273 @@
+import asyncio
+import logging
+
+import numpy as np
+
+from decimal import Decimal
+from ws_apis.events import OrderbookEvent, OBEventType, Level, TradeSide
+from ws_apis.events import LevelColumns, Levels, level_pairs
+from ws_apis.utils import FixedPointScale
+from typing import Optional, Union
+
+
+def _level_arrays(
+    levels: Levels, scale: Optional[FixedPointScale] = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    converts levels to float (prices, qtys) arrays (without copying float
+    columns). fixed-point levels are divided by their scale.
+    """
+    if isinstance(levels, LevelColumns):
+        if levels.prices.typecode == "q" and scale is None:
+            raise ValueError("fixed-point levels need the scale of the symbol")
+        prices = np.frombuffer(levels.prices, levels.prices.typecode)
+        qtys = np.frombuffer(levels.qtys, levels.qtys.typecode)
+        prices, qtys = prices.astype(np.float64, copy=False), qtys.astype(np.float64)
+    else:
+        pairs = np.array(list(level_pairs(levels)), np.float64).reshape(-1, 2)
+        prices, qtys = pairs[:, 0], pairs[:, 1]
+
+    if scale is not None:
+        prices = prices / 10**scale.price_decimals
+        qtys = qtys / 10**scale.qty_decimals
+    return prices, qtys
+
+
+class LadderOrderbook:
+    """
+    Orderbook that stores each side as a numpy qty array indexed by price tick.
+
+    Index i of a side holds the qty at price (anchor + i) * tick_size. The
+    anchor is re-centered around the mid price when the book drifts towards
+    the edges of the ladder. Applying an event is a scatter of (tick, qty)
+    pairs and depth analytics are vectorized calls on the ladder.
+
+    n_ticks has to cover the price range of the book (2 * depth levels at
+    the tightest), levels that fall outside of the ladder are dropped.
+
+    Events parsed with fixed_point=True need the scale of the symbol (see
+    utils.FixedPointScale), the ladder stores float prices and quantities.
+    """
+
+    def __init__(
+        self,
+        exch_name: str,
+        symbol: str,
+        depth: int,
+        tick_size: float,
+        n_ticks: Optional[int] = None,
+        scale: Optional[FixedPointScale] = None,
+    ):
+        self.exch_name = exch_name
+        self.symbol = symbol
+        self.depth = depth
+        self.tick_size = tick_size
+        self.scale = scale
+        self.n_ticks = n_ticks or max(8 * depth, 1024)
+        self._decimals = max(0, -int(Decimal(str(tick_size)).as_tuple().exponent))
+
+        self.bids = np.zeros(self.n_ticks)
+        self.asks = np.zeros(self.n_ticks)
+        self.anchor = 0  # price tick of index 0
+        self.ts_exchange: int = 0
+        self.ts_recorded: int = 0
+
+        self._lock = asyncio.Lock()
+        self._logger = logging.getLogger(__name__)
+
+    def _to_ticks(self, prices: np.ndarray) -> np.ndarray:
+        return np.rint(prices / self.tick_size).astype(np.int64)
+
+    def _to_prices(self, idx: np.ndarray) -> np.ndarray:
+        return np.round((self.anchor + idx) * self.tick_size, self._decimals)
+
+    def _recenter(self, center_tick: int):
+        """moves the anchor so that center_tick sits in the middle of the ladder"""
+        shift = center_tick - self.n_ticks // 2 - self.anchor
+        if shift == 0:
+            return
+
+        for side in (self.bids, self.asks):
+            if abs(shift) >= self.n_ticks:
+                side[:] = 0
+            elif shift > 0:
+                side[:-shift] = side[shift:]
+                side[-shift:] = 0
+            else:
+                side[-shift:] = side[:shift]
+                side[:-shift] = 0
+        self.anchor += shift
+
+    def _scatter(self, side: np.ndarray, ticks: np.ndarray, qtys: np.ndarray):
+        """writes qtys at ticks, levels outside the ladder are dropped"""
+        idx = ticks - self.anchor
+        mask = (idx >= 0) & (idx < self.n_ticks)
+        side[idx[mask]] = np.maximum(qtys[mask], 0)
+
+    def _mid_tick(self) -> Optional[int]:
+        bid, ask = self._best_bid_idx(), self._best_ask_idx()
+        if bid is None or ask is None:
+            return None
+        return self.anchor + (bid + ask) // 2
+
+    def _best_bid_idx(self) -> Optional[int]:
+        nz = np.flatnonzero(self.bids)
+        return int(nz[-1]) if len(nz) else None
+
+    def _best_ask_idx(self) -> Optional[int]:
+        nz = np.flatnonzero(self.asks)
+        return int(nz[0]) if len(nz) else None
+
+    def _trim(self):
+        """keeps at most depth non-empty levels on each side"""
+        nz = np.flatnonzero(self.bids)
+        if len(nz) > self.depth:
+            self.bids[nz[: -self.depth]] = 0
+
+        nz = np.flatnonzero(self.asks)
+        if len(nz) > self.depth:
+            self.asks[nz[self.depth :]] = 0
+
+    def _handle_snapshot(self, event: OrderbookEvent):
+        self._logger.info(f"taking snapshot of {self.symbol}")
+
+        bid_prices, bid_qtys = _level_arrays(event.bids, self.scale)
+        ask_prices, ask_qtys = _level_arrays(event.asks, self.scale)
+        bid_ticks, ask_ticks = self._to_ticks(bid_prices), self._to_ticks(ask_prices)
+
+        self.bids[:] = 0
+        self.asks[:] = 0
+        if len(bid_ticks) and len(ask_ticks):
+            center = (int(bid_ticks.max()) + int(ask_ticks.min())) // 2
+        elif len(bid_ticks) or len(ask_ticks):
+            center = int(np.concatenate((bid_ticks, ask_ticks))[0])
+        else:
+            return
+        self.anchor = center - self.n_ticks // 2
+
+        self._scatter(self.bids, bid_ticks, bid_qtys)
+        self._scatter(self.asks, ask_ticks, ask_qtys)
+
+    def _handle_update(self, event: OrderbookEvent):
+        bid_prices, bid_qtys = _level_arrays(event.bids, self.scale)
+        ask_prices, ask_qtys = _level_arrays(event.asks, self.scale)
+
+        self._scatter(self.bids, self._to_ticks(bid_prices), bid_qtys)
+        self._scatter(self.asks, self._to_ticks(ask_prices), ask_qtys)
+        self._trim()
+
+        # re-center once the mid leaves the middle half of the ladder
+        mid = self._mid_tick()
+        if mid is not None and not (
+            self.n_ticks // 4 <= mid - self.anchor < 3 * self.n_ticks // 4
+        ):
+            self._recenter(mid)
+
+    def update(self, event: OrderbookEvent):
+        self.ts_exchange = event.ts_exchange
+        self.ts_recorded = event.ts_recorded
+
+        if event.type == OBEventType.SNAPSHOT:
+            self._handle_snapshot(event)
+        else:
+            self._handle_update(event)
+
+    def bid_arrays(self, depth: Optional[int] = None) -> tuple[np.ndarray, np.ndarray]:
+        """returns (prices, qtys) of the best depth bids, best first"""
+        idx = np.flatnonzero(self.bids)[::-1][: depth or self.depth]
+        return self._to_prices(idx), self.bids[idx]
+
+    def ask_arrays(self, depth: Optional[int] = None) -> tuple[np.ndarray, np.ndarray]:
+        """returns (prices, qtys) of the best depth asks, best first"""
+        idx = np.flatnonzero(self.asks)[: depth or self.depth]
+        return self._to_prices(idx), self.asks[idx]
+
+    def mid_price(self) -> float:
+        """returns the mid price (nan if one side is empty)"""
+        bid, ask = self._best_bid_idx(), self._best_ask_idx()
+        if bid is None or ask is None:
+            return float("nan")
+        return (2 * self.anchor + bid + ask) * self.tick_size / 2
+
+    def cumulative_depth(
+        self, depth: Optional[int] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """returns the cumulative qty of the best depth (bids, asks)"""
+        return np.cumsum(self.bid_arrays(depth)[1]), np.cumsum(
+            self.ask_arrays(depth)[1]
+        )
+
+    def depth_at_bps(
+        self, bps: Union[float, np.ndarray]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """returns the qty within bps of the mid price as (bids, asks)"""
+        mid = self.mid_price()
+        bps = np.asarray(bps, dtype=np.float64)
+        if np.isnan(mid):
+            return np.zeros_like(bps), np.zeros_like(bps)
+
+        bid_prices, bid_qtys = self.bid_arrays()
+        ask_prices, ask_qtys = self.ask_arrays()
+        bid_cum = np.concatenate(([0.0], np.cumsum(bid_qtys)))
+        ask_cum = np.concatenate(([0.0], np.cumsum(ask_qtys)))
+
+        # prices are best first: bids descending, asks ascending
+        n_bids = np.searchsorted(-bid_prices, -mid * (1 - bps / 1e4), side="right")
+        n_asks = np.searchsorted(ask_prices, mid * (1 + bps / 1e4), side="right")
+        return bid_cum[n_bids], ask_cum[n_asks]
+
+    def vwap_to_fill(
+        self, qty: Union[float, np.ndarray], side: TradeSide
+    ) -> np.ndarray:
+        """
+        returns the average fill price of a market order of size qty.
+        a buy walks the asks and a sell walks the bids. nan if the book is
+        not deep enough.
+        """
+        prices, qtys = self.ask_arrays() if side == TradeSide.BUY else self.bid_arrays()
+        qty = np.asarray(qty, dtype=np.float64)
+
+        cum_qty = np.cumsum(qtys)
+        cum_notional = np.cumsum(prices * qtys)
+        idx = np.searchsorted(cum_qty, qty, side="left")
+        valid = idx < len(cum_qty)
+        idx = np.minimum(idx, max(len(cum_qty) - 1, 0))
+        if not len(cum_qty):
+            return np.full_like(qty, np.nan)
+
+        prev_qty = np.where(idx > 0, cum_qty[idx - 1], 0.0)
+        prev_notional = np.where(idx > 0, cum_notional[idx - 1], 0.0)
+        notional = prev_notional + (qty - prev_qty) * prices[idx]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(valid & (qty > 0), notional / qty, np.nan)
+
+    def slippage_curve(
+        self, qty: Union[float, np.ndarray], side: TradeSide
+    ) -> np.ndarray:
+        """returns the slippage (in bps vs. the mid price) of filling qty"""
+        mid = self.mid_price()
+        sign = 1 if side == TradeSide.BUY else -1
+        return sign * (self.vwap_to_fill(qty, side) / mid - 1) * 1e4
+
+    def take_snapshot(self, depth: Optional[int] = None) -> OrderbookEvent:
+        bid_prices, bid_qtys = self.bid_arrays(depth)
+        ask_prices, ask_qtys = self.ask_arrays(depth)
+        return OrderbookEvent(
+            self.exch_name,
+            self.symbol,
+            OBEventType.SNAPSHOT,
+            [Level(p, q) for p, q in zip(bid_prices.tolist(), bid_qtys.tolist())],
+            [Level(p, q) for p, q in zip(ask_prices.tolist(), ask_qtys.tolist())],
+            self.ts_exchange,
+            self.ts_recorded,
+        )
+
+    async def async_update(self, event: OrderbookEvent):
+        """thread-safe update of the orderbook"""
+        async with self._lock:
+            self.update(event)
+
+    async def async_take_snapshot(self, depth: Optional[int] = None) -> OrderbookEvent:
+        """thread-safe snapshot of the orderbook"""
+        async with self._lock:
+            return self.take_snapshot(depth)
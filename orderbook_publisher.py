@@ -0,0 +1,217 @@
+import logging
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+from multiprocessing import shared_memory
+from ws_apis.events import OrderbookEvent, OBEventType, Level, Levels, level_pairs
+from typing import Any, Optional
+
+from orderbook import Orderbook
+
+try:
+    import _posixshmem
+except ImportError:  # windows
+    _posixshmem = None
+
+# seq, n_bids, n_asks, ts_exchange, ts_recorded, depth
+_HEADER = struct.Struct("<QIIqqI4x")
+_SEQ = struct.Struct("<Q")
+_FIELDS = struct.Struct("<IIqqI4x")
+
+
+def shm_name(exch_name: str, symbol: str) -> str:
+    """name of the shared memory block an orderbook is published to"""
+    return f"orderbook_{exch_name}_{symbol}"
+
+
+def _block_size(depth: int) -> int:
+    # bid prices, bid qtys, ask prices, ask qtys
+    return _HEADER.size + 4 * depth * 8
+
+
+def _attach(name: str) -> Any:
+    """
+    maps a block read-only. on posix this bypasses SharedMemory, which would
+    register the block with this process' resource tracker and unlink it
+    when the process exits.
+    """
+    if _posixshmem is None:
+        return shared_memory.SharedMemory(name).buf
+
+    fd = _posixshmem.shm_open("/" + name, os.O_RDONLY, mode=0o600)
+    try:
+        return mmap.mmap(fd, os.fstat(fd).st_size, prot=mmap.PROT_READ)
+    finally:
+        os.close(fd)
+
+
+def _levels_array(levels: Levels, depth: int) -> np.ndarray:
+    pairs = np.array(list(level_pairs(levels)), np.float64).reshape(-1, 2)
+    return pairs[:depth]
+
+
+class OrderbookPublisher:
+    """
+    Publishes the top depth levels of an Orderbook to a shared memory block
+    that any number of OrderbookReaders (in other processes) can sample.
+
+    The block is guarded by a seqlock: the sequence number is odd while the
+    levels are written and even once they are consistent. Readers retry
+    instead of blocking the writer, so the feed process never waits for them.
+    Prices and quantities are stored as float64 (fixed-point ints as well).
+    """
+
+    def __init__(
+        self,
+        orderbook: Orderbook,
+        depth: Optional[int] = None,
+        name: Optional[str] = None,
+    ):
+        self.orderbook = orderbook
+        self.depth = depth or orderbook.depth
+        self.name = name or shm_name(orderbook.exch_name, orderbook.symbol)
+
+        size = _block_size(self.depth)
+        try:
+            self._shm = shared_memory.SharedMemory(self.name, create=True, size=size)
+        except FileExistsError:
+            # left over by a previous publisher, readers stay attached (they
+            # follow the depth in the header)
+            self._shm = shared_memory.SharedMemory(self.name)
+            if self._shm.size < size:
+                self._shm.close()
+                raise ValueError(f"{self.name} is too small for depth {self.depth}")
+
+        self._buf = self._shm.buf
+        self._levels = np.ndarray(
+            (4, self.depth), np.float64, self._buf, offset=_HEADER.size
+        )
+        self.seq = _SEQ.unpack_from(self._buf, 0)[0] & ~1
+        self.write([], [], 0, 0)
+
+        self._logger = logging.getLogger(__name__)
+
+    def write(self, bids: Levels, asks: Levels, ts_exchange: int, ts_recorded: int):
+        """writes the levels (best first) to the block"""
+        bids_arr = _levels_array(bids, self.depth)
+        asks_arr = _levels_array(asks, self.depth)
+        n_bids, n_asks = len(bids_arr), len(asks_arr)
+
+        _SEQ.pack_into(self._buf, 0, self.seq + 1)
+        self._levels[0, :n_bids] = bids_arr[:, 0]
+        self._levels[1, :n_bids] = bids_arr[:, 1]
+        self._levels[2, :n_asks] = asks_arr[:, 0]
+        self._levels[3, :n_asks] = asks_arr[:, 1]
+        fields = (n_bids, n_asks, ts_exchange, ts_recorded, self.depth)
+        _FIELDS.pack_into(self._buf, _SEQ.size, *fields)
+        self.seq += 2
+        _SEQ.pack_into(self._buf, 0, self.seq)  # last, readers check it
+
+    def publish(self):
+        """writes the current top levels of the orderbook"""
+        snapshot = self.orderbook.take_snapshot(self.depth)
+        self.write(
+            snapshot.bids, snapshot.asks, snapshot.ts_exchange, snapshot.ts_recorded
+        )
+
+    def update(self, event: OrderbookEvent):
+        """updates the orderbook and publishes it"""
+        self.orderbook.update(event)
+        self.publish()
+
+    def close(self, unlink: bool = True):
+        self._levels = None
+        self._buf = None
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+class OrderbookReader:
+    """
+    Reads consistent snapshots of an orderbook published by an
+    OrderbookPublisher, without locking and without involving the publisher.
+    A read that overlaps a write is retried, for at most timeout seconds.
+
+    The depth is read from the header on every read, so a reader stays valid
+    when a publisher with another depth takes over the block.
+    """
+
+    def __init__(
+        self,
+        exch_name: str,
+        symbol: str,
+        name: Optional[str] = None,
+        timeout: float = 1.0,
+    ):
+        self.exch_name = exch_name
+        self.symbol = symbol
+        self.name = name or shm_name(exch_name, symbol)
+        self.timeout = timeout
+
+        self._buf = _attach(self.name)
+        self._depth = 0
+        self._levels: Optional[np.ndarray] = None
+        self.last_seq = 0  # seq of the last read
+
+    def _view(self, depth: int) -> Optional[np.ndarray]:
+        """levels of a block of depth levels (None if it doesn't fit the block)"""
+        if depth != self._depth or self._levels is None:
+            if _block_size(depth) > len(self._buf):
+                return None
+            self._levels = np.frombuffer(
+                self._buf, np.float64, 4 * depth, offset=_HEADER.size
+            ).reshape(4, depth)
+            self._depth = depth
+        return self._levels
+
+    @property
+    def seq(self) -> int:
+        """sequence number of the published book (even when consistent)"""
+        return _SEQ.unpack_from(self._buf, 0)[0]
+
+    def changed(self) -> bool:
+        """returns true if the book was published since the last read"""
+        return self.seq != self.last_seq
+
+    def read_arrays(self) -> tuple[np.ndarray, np.ndarray, int, int]:
+        """returns bids and asks as (n, 2) [price, qty] arrays, ts_exchange, ts_recorded"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            header = _HEADER.unpack_from(self._buf, 0)
+            seq, n_bids, n_asks, ts_exchange, ts_recorded, depth = header
+            levels = None if seq & 1 else self._view(depth)
+            if levels is not None:
+                bids = levels[0:2, :n_bids].T.copy()
+                asks = levels[2:4, :n_asks].T.copy()
+                if _SEQ.unpack_from(self._buf, 0)[0] == seq:
+                    self.last_seq = seq
+                    return bids, asks, ts_exchange, ts_recorded
+
+            # the publisher is writing, it may have been preempted
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"no consistent read of {self.name}")
+            time.sleep(0)
+
+    def read(self) -> OrderbookEvent:
+        """returns the published book as a snapshot event"""
+        bids, asks, ts_exchange, ts_recorded = self.read_arrays()
+        return OrderbookEvent(
+            self.exch_name,
+            self.symbol,
+            OBEventType.SNAPSHOT,
+            [Level(p, q) for p, q in bids.tolist()],
+            [Level(p, q) for p, q in asks.tolist()],
+            ts_exchange,
+            ts_recorded,
+        )
+
+    def close(self):
+        self._levels = None
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+        self._buf = None
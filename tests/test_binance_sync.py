@@ -0,0 +1,211 @@
+import asyncio
+import json
+
+from benchmarks.bench_pipeline import binance_book_frames
+from orderbook import Orderbook
+from ws_apis.binance import BinanceWebsocket, BinanceEventsBuffer
+from ws_apis.binance import parse_book_msg_binance, parse_snapshot_binance
+from ws_apis.binance import parse_event_type_binance, unwrap_msg_binance
+from ws_apis.decoders import get_binance_decoder
+from ws_apis.events import OrderbookEvent, OBEventType, StatusEvent, StatusEventType
+from ws_apis.events import StreamType, WsEventType
+from ws_apis.rest import PRIORITY_RESYNC, PRIORITY_SNAPSHOT
+
+SYMBOL = "btcusdt"
+DEPTH = 50
+
+
+class SyncWebsocket(BinanceWebsocket):
+    """binance book websocket fed by the tests, snapshot requests are recorded"""
+
+    def __init__(self):
+        super().__init__(StreamType.BOOK, SYMBOL, DEPTH)
+        self.requests: list[tuple[str, int]] = []
+        self._snapshots_wanted[SYMBOL] = PRIORITY_SNAPSHOT  # as after connect
+
+    def _request_snapshot(self, symbol: str, priority: int = PRIORITY_SNAPSHOT):
+        self.requests.append((symbol, priority))
+
+    async def feed(self, items: list) -> list:
+        """queues items as received, returns the events recv would return"""
+        for item in items:
+            self._queue.put_nowait(item)
+        return await self._drain([], len(items) + 10_000)
+
+
+def make_stream(n: int = 100, update_size: int = 5):
+    """initial book and n updates with consecutive update ids"""
+    frames, rest = binance_book_frames([SYMBOL], n, DEPTH, update_size)
+    base = parse_snapshot_binance("binance", SYMBOL, 0, rest[SYMBOL])
+    updates = [
+        parse_book_msg_binance("binance", SYMBOL, json.loads(f)["data"]) for f in frames
+    ]
+    return base, updates
+
+
+def apply(events: list, book: Orderbook = None) -> Orderbook:
+    book = book or Orderbook("binance", SYMBOL, 10_000)
+    for event in events:
+        if isinstance(event, OrderbookEvent):
+            book.update(event)
+    return book
+
+
+def levels(book: Orderbook) -> tuple:
+    snapshot = book.take_snapshot()
+    return snapshot.bids, snapshot.asks
+
+
+def snapshot_at(base: OrderbookEvent, updates: list, k: int) -> OrderbookEvent:
+    """rest snapshot of the book after the first k updates"""
+    book = apply([base, *updates[:k]])
+    last_update_id = updates[k - 1].other["last_update_id"] if k else 0
+    bids, asks = levels(book)
+    ids = {"last_update_id": last_update_id}
+    return OrderbookEvent(
+        "binance", SYMBOL, OBEventType.SNAPSHOT, bids, asks, 0, 0, ids
+    )
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_snapshot_after_buffered_updates():
+    async def main():
+        base, updates = make_stream()
+        ws = SyncWebsocket()
+
+        events = await ws.feed(updates[:60])
+        assert events == []
+        assert ws.requests == [(SYMBOL, PRIORITY_SNAPSHOT)]
+
+        events = await ws.feed([snapshot_at(base, updates, 40), *updates[60:]])
+        assert events[0].type == OBEventType.SNAPSHOT
+        assert events[1:] == updates[40:]
+
+        eventsBuffer = ws.eventsBuffers[SYMBOL]
+        assert eventsBuffer.n_stale == 40
+        assert eventsBuffer.n_gaps == eventsBuffer.n_resyncs == 0
+        assert levels(apply(events)) == levels(apply([base, *updates]))
+
+    run(main())
+
+
+def test_stale_updates_after_snapshot():
+    async def main():
+        base, updates = make_stream()
+        ws = SyncWebsocket()
+
+        events = await ws.feed([snapshot_at(base, updates, 50), *updates[30:]])
+        assert events[1:] == updates[50:]
+        assert ws.eventsBuffers[SYMBOL].n_stale == 20
+        assert levels(apply(events)) == levels(apply([base, *updates]))
+
+    run(main())
+
+
+def test_gap_resyncs():
+    async def main():
+        base, updates = make_stream()
+        ws = SyncWebsocket()
+        ws.status_events = True
+
+        events = await ws.feed(
+            [*updates[:20], snapshot_at(base, updates, 10), *updates[20:50]]
+        )
+        assert events[1:] == updates[10:50]
+
+        # update 50 is lost
+        events += await ws.feed(updates[51:80])
+        assert isinstance(events[-1], StatusEvent)
+        assert events[-1].type == StatusEventType.RESYNC
+        assert ws.requests[-1] == (SYMBOL, PRIORITY_RESYNC)
+
+        eventsBuffer = ws.eventsBuffers[SYMBOL]
+        assert eventsBuffer.n_gaps == eventsBuffer.n_resyncs == 1
+        assert len(eventsBuffer.events_buffer) == 29
+
+        resynced = await ws.feed([snapshot_at(base, updates, 70), *updates[80:]])
+        assert resynced[0].type == OBEventType.SNAPSHOT
+        assert resynced[1:] == updates[70:]
+        assert levels(apply(events + resynced)) == levels(apply([base, *updates]))
+
+    run(main())
+
+
+def test_snapshot_older_than_buffered_updates():
+    async def main():
+        base, updates = make_stream()
+        ws = SyncWebsocket()
+
+        # the updates between the snapshot and the buffered ones are missing
+        events = await ws.feed([*updates[30:60], snapshot_at(base, updates, 10)])
+        assert events == []
+
+        eventsBuffer = ws.eventsBuffers[SYMBOL]
+        assert eventsBuffer.n_resyncs == 1
+        assert not eventsBuffer.has_snapshot
+        assert not eventsBuffer.events_buffer
+
+        # the next update requests a new snapshot
+        events = await ws.feed(updates[60:70])
+        assert ws.requests[-1] == (SYMBOL, PRIORITY_RESYNC)
+
+        events = await ws.feed([snapshot_at(base, updates, 65), *updates[70:]])
+        assert events[1:] == updates[65:]
+        assert levels(apply(events)) == levels(apply([base, *updates]))
+
+    run(main())
+
+
+def test_overflow_adapts_buffer_size():
+    async def main():
+        base, updates = make_stream()
+        ws = SyncWebsocket()
+        eventsBuffer = BinanceEventsBuffer(ws._buffer_queue, min_buffer_size=8)
+        ws.eventsBuffers[SYMBOL] = eventsBuffer
+
+        # the oldest updates are dropped, the snapshot doesn't reach the others
+        events = await ws.feed([*updates[:20], snapshot_at(base, updates, 5)])
+        assert events == []
+        assert eventsBuffer.n_overflows == 12
+        assert eventsBuffer.n_resyncs == 1
+        assert eventsBuffer.buffer_size == 40  # twice the updates of the snapshot
+
+        events = await ws.feed([*updates[20:30], snapshot_at(base, updates, 25)])
+        assert events[1:] == updates[25:30]
+        assert eventsBuffer.n_overflows == 12
+        assert eventsBuffer.buffer_size == 20  # shrinks by at most half
+
+        events += await ws.feed(updates[30:])
+        assert levels(apply(events)) == levels(apply([base, *updates]))
+
+    run(main())
+
+
+def test_typed_and_untyped_frames_parse_the_same():
+    async def main():
+        frames, _ = binance_book_frames([SYMBOL], 20, DEPTH, 5)
+        trade = {"e": "aggTrade", "E": 2, "s": "BTCUSDT", "p": "1.5", "q": "2"}
+        trade.update({"a": 1, "f": 1, "l": 1, "T": 1, "m": True, "M": True})
+        frames.append(json.dumps({"stream": f"{SYMBOL}@aggTrade", "data": trade}))
+
+        typed, untyped = get_binance_decoder("msgspec"), get_binance_decoder("json")
+        ws = SyncWebsocket()
+        for frame in frames:
+            msg = unwrap_msg_binance(typed(frame))
+            data = unwrap_msg_binance(untyped(frame))
+            assert not isinstance(msg, dict) and isinstance(data, dict)
+
+            event_type = parse_event_type_binance(msg)
+            assert event_type == parse_event_type_binance(data)
+            if event_type == WsEventType.BOOK:
+                parsed, expected = ws._parse_book_msg(msg), ws._parse_book_msg(data)
+            else:
+                parsed = ws._parse_trade_msg(msg)
+                expected = ws._parse_trade_msg(data)
+            parsed.ts_recorded = expected.ts_recorded
+            assert parsed == expected
+
+    run(main())
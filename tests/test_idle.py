@@ -0,0 +1,44 @@
+import asyncio
+
+from ws_apis import Subscription, WsManager
+from ws_apis.binance import BinanceWebsocket
+from ws_apis.events import StreamType, TradeEvent
+
+
+def trade() -> TradeEvent:
+    return TradeEvent("binance", "btcusdt", 1, 1, [])
+
+
+async def wait_with_idle(recv, consumer, queue):
+    """calls recv while the queue stays empty for about 5 idle timeouts"""
+    idle = []
+    consumer._idle.timeout = 0.02
+    consumer._idle.on_idle = lambda: idle.append(1)
+    loop = asyncio.get_running_loop()
+    loop.call_later(0.11, queue.put_nowait, trade())
+    result = await recv()
+    return result, len(idle)
+
+
+def test_manager_recv_logs_while_idle():
+    async def main():
+        subscriptions = [Subscription("binance", "btcusdt", "trades")]
+        for recv in ("recv", "recv_many"):
+            wsm = WsManager(subscriptions)
+            result, n_idle = await wait_with_idle(getattr(wsm, recv), wsm, wsm._queue)
+            assert result == trade() or result == [trade()]
+            assert n_idle >= 3
+
+    asyncio.run(main())
+
+
+def test_websocket_recv_waits_while_idle():
+    async def main():
+        ws = BinanceWebsocket(StreamType.TRADES, "btcusdt", 0)
+        ws._timeout = 0.01  # recv used to raise TimeoutError after it
+        recv = super(BinanceWebsocket, ws).recv  # Websocket.recv
+        result, n_idle = await wait_with_idle(recv, ws, ws._queue)
+        assert result == trade()
+        assert n_idle >= 3
+
+    asyncio.run(main())
@@ -0,0 +1,37 @@
+from ws_apis.metrics import RateMeter, Sample, format_prometheus
+
+
+def counters(n: int) -> list[Sample]:
+    return [
+        Sample("stream_messages_total", {"conn": "0"}, n),
+        Sample("queue_size", {}, 3),
+    ]
+
+
+def test_rate_meters_are_independent(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("ws_apis.metrics.time.monotonic", lambda: now[0])
+    mine, scraper = RateMeter(), RateMeter()
+
+    assert mine.rates(counters(0)) == [
+        Sample("stream_messages_per_second", {"conn": "0"}, 0)
+    ]
+    now[0] = 1.0
+    scraper.rates(counters(100))
+    now[0] = 2.0
+    scraper.rates(counters(200))
+
+    (rate,) = mine.rates(counters(200))
+    assert rate.value == 100.0
+
+
+def test_format_prometheus():
+    text = format_prometheus(counters(5) + [Sample("lag", {"s": 'a"b'}, 0.5)])
+    assert text.splitlines() == [
+        "# TYPE ws_apis_stream_messages_total counter",
+        'ws_apis_stream_messages_total{conn="0"} 5',
+        "# TYPE ws_apis_queue_size gauge",
+        "ws_apis_queue_size 3",
+        "# TYPE ws_apis_lag gauge",
+        'ws_apis_lag{s="a\\"b"} 0.5',
+    ]
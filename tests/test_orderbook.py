@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from orderbook import Orderbook, SortedOrderbook
+from ws_apis.events import LazyLevels, Level, OrderbookEvent, OBEventType
+
+
+def event(type: OBEventType, bids: list, asks: list, ts: int = 0) -> OrderbookEvent:
+    bids = [Level(p, q) for p, q in bids]
+    asks = [Level(p, q) for p, q in asks]
+    return OrderbookEvent("binance", "btcusdt", type, bids, asks, ts, ts)
+
+
+def snapshot(ts: int = 0) -> OrderbookEvent:
+    bids = [(100.0, 1.0), (99.0, 2.0), (98.0, 3.0)]
+    asks = [(101.0, 1.0), (102.0, 2.0), (103.0, 3.0)]
+    return event(OBEventType.SNAPSHOT, bids, asks, ts)
+
+
+def update(bids: list = (), asks: list = ()) -> OrderbookEvent:
+    return event(OBEventType.UPDATE, list(bids), list(asks))
+
+
+@pytest.fixture(params=[Orderbook, SortedOrderbook])
+def book(request) -> Orderbook:
+    book = request.param("binance", "btcusdt", 10)
+    book.update(snapshot())
+    return book
+
+
+def test_on_change_fires_only_when_the_top_levels_change(book):
+    changes = []
+    book.on_change(lambda b, e: changes.append(b.take_snapshot(2)), levels=2)
+
+    book.update(update(bids=[(100.0, 1.0)]))  # same qty
+    book.update(update(asks=[(101.5, 0.0)]))  # missing level
+    book.update(update(bids=[(98.0, 5.0)], asks=[(103.0, 0.0)]))  # below the top 2
+    book.update(snapshot())  # same levels
+    assert changes == []
+
+    book.update(update(bids=[(99.0, 4.0)]))
+    book.update(update(asks=[(101.5, 1.0)]))
+    assert [(c.bids[1].qty, c.asks[1].price) for c in changes] == [
+        (4.0, 102.0),
+        (4.0, 101.5),
+    ]
+
+    book.update(update(asks=[(101.5, 1.0)]))
+    assert len(changes) == 2
+
+
+def test_wait_bbo_change_ignores_unchanged_levels(book):
+    async def main():
+        waiter = asyncio.ensure_future(book.wait_bbo_change())
+        await asyncio.sleep(0)
+
+        book.update(update(bids=[(99.0, 5.0), (100.0, 1.0)]))
+        book.update(snapshot(1))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        book.update(update(asks=[(101.0, 2.0)]))
+        assert await waiter is book
+        assert not book._watched
+
+    asyncio.run(main())
+
+
+def test_top_view_is_immutable_and_shared(book):
+    view = book.top_view(2)
+    assert [l.price for l in view.bids] == [100.0, 99.0]
+    with pytest.raises(AttributeError):
+        view.bids[0].qty = 0.0
+
+    book.update(update(bids=[(97.0, 1.0)]))
+    assert book.top_view(2) is view
+
+    book.update(update(bids=[(99.0, 0.0)]))
+    assert [l.price for l in book.top_view(2).bids] == [100.0, 98.0]
+
+
+def test_callbacks_get_the_book_and_the_event(book):
+    calls = []
+    book.on_update(lambda b, e: calls.append(("update", b, e)))
+    book.on_change(lambda b, e: calls.append(("change", b, e)))
+
+    unchanged, changed = update(bids=[(99.0, 1.0)]), update(bids=[(100.0, 2.0)])
+    book.update(unchanged)
+    book.update(changed)
+    assert calls == [
+        ("update", book, unchanged),
+        ("update", book, changed),
+        ("change", book, changed),
+    ]
+
+
+def test_lazy_levels_are_converted_once(book):
+    book.top_view(2)
+    book.on_change(lambda b, e: None, levels=1)
+    book.on_change(lambda b, e: None, levels=2)
+
+    bids = LazyLevels([["100.5", "1"], ["99", "0"]])
+    pairs = bids.pairs()
+    book.update(
+        OrderbookEvent("binance", "btcusdt", OBEventType.UPDATE, bids, [], 1, 1)
+    )
+
+    assert bids.pairs() is pairs
+    assert list(bids) == [Level(100.5, 1.0), Level(99.0, 0.0)]
+    assert book.top_view(2).bids[0] == (100.5, 1.0)
@@ -0,0 +1,60 @@
+from orderbook import Orderbook
+from orderbook_consolidated import ConsolidatedOrderbook
+from ws_apis.events import Level, OrderbookEvent, OBEventType
+
+
+def event(venue: str, type: OBEventType, bids: list, asks: list) -> OrderbookEvent:
+    bids = [Level(p, q) for p, q in bids]
+    asks = [Level(p, q) for p, q in asks]
+    return OrderbookEvent(venue, "btcusdt", type, bids, asks, 1, 1)
+
+
+def running_book(venue: str, bid: float, ask: float) -> Orderbook:
+    book = Orderbook(venue, "btcusdt", 10)
+    book.update(event(venue, OBEventType.SNAPSHOT, [(bid, 1.0)], [(ask, 1.0)]))
+    return book
+
+
+def test_attach_loads_the_current_levels():
+    book = running_book("binance", 100.0, 101.0)
+    merged = ConsolidatedOrderbook("btcusdt", 10)
+    merged.attach(book)
+
+    book.update(event("binance", OBEventType.UPDATE, [(98.0, 2.0)], []))
+    assert merged.best_bid() == Level(100.0, 1.0)
+    assert merged.best_ask() == Level(101.0, 1.0)
+    assert merged.bids.qty_at(98.0) == 2.0
+    assert merged.venues == ["binance"]
+
+
+def test_detach_removes_the_venue():
+    binance = running_book("binance", 100.0, 101.0)
+    kraken = running_book("kraken", 99.0, 102.0)
+    merged = ConsolidatedOrderbook("btcusdt", 10)
+    merged.attach(binance)
+    merged.attach(kraken)
+    assert merged.best_bid() == Level(100.0, 1.0)
+
+    merged.detach(binance)
+    assert merged.venues == ["kraken"]
+    assert merged.best_bid() == Level(99.0, 1.0)
+    assert merged.best_ask() == Level(102.0, 1.0)
+    assert merged.best_bid("binance") is None
+    assert merged.bids.venues_at(100.0) == {}
+
+    binance.update(event("binance", OBEventType.UPDATE, [(100.5, 1.0)], []))
+    assert merged.best_bid() == Level(99.0, 1.0)
+
+
+def test_snapshot_replaces_only_its_venue():
+    merged = ConsolidatedOrderbook("btcusdt", 10)
+    merged.update(event("binance", OBEventType.SNAPSHOT, [(100.0, 1.0)], []))
+    merged.update(
+        event("kraken", OBEventType.SNAPSHOT, [(100.0, 2.0), (99.0, 1.0)], [])
+    )
+
+    merged.update(event("binance", OBEventType.SNAPSHOT, [(99.0, 3.0)], []))
+    assert merged.bids.venues_at(100.0) == {"kraken": 2.0}
+    assert merged.bids.venues_at(99.0) == {"kraken": 1.0, "binance": 3.0}
+    assert merged.best_bid() == Level(100.0, 2.0)
+    assert merged.bids.qty_at(99.0) == 4.0
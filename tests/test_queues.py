@@ -0,0 +1,155 @@
+import asyncio
+import json
+
+import pytest
+
+from benchmarks.bench_pipeline import binance_book_frames
+from orderbook import Orderbook
+from ws_apis.binance import parse_book_msg_binance, parse_snapshot_binance
+from ws_apis.events import BboEvent, Level, LevelColumns, OrderbookEvent, OBEventType
+from ws_apis.events import StatusEvent, StatusEventType, Trade, TradeEvent, TradeSide
+from ws_apis.queues import EventQueue, OverflowPolicy
+from ws_apis.utils import parse_level_columns
+
+
+def book_updates(symbol: str = "btcusdt", n: int = 10) -> list[OrderbookEvent]:
+    frames, _ = binance_book_frames([symbol], n, 20, 5)
+    return [
+        parse_book_msg_binance("binance", symbol, json.loads(f)["data"]) for f in frames
+    ]
+
+
+def trade_event(price: float, ts: int, symbol: str = "btcusdt") -> TradeEvent:
+    trades = [Trade(price, 1.0, TradeSide.BUY)]
+    return TradeEvent("binance", symbol, ts, ts, trades)
+
+
+def levels(events: list[OrderbookEvent]) -> tuple:
+    book = Orderbook("binance", "btcusdt", 1000)
+    for event in events:
+        book.update(event)
+    snapshot = book.take_snapshot()
+    return snapshot.bids, snapshot.asks
+
+
+def test_conflated_book_updates_apply_like_the_originals():
+    updates = book_updates()
+    first_update_id = updates[0].other["first_update_id"]
+    last_update_id = updates[-1].other["last_update_id"]
+    expected = levels([*book_updates()])
+
+    queue = EventQueue(policy=OverflowPolicy.CONFLATE)
+    for event in updates:
+        queue.put_nowait(event)
+
+    assert queue.qsize() == 1
+    assert queue.n_conflated == len(updates) - 1
+    merged = queue.get_nowait()
+    assert merged.other["first_update_id"] == first_update_id
+    assert merged.other["last_update_id"] == last_update_id
+    assert merged.ts_exchange == updates[-1].ts_exchange
+    assert levels([merged]) == expected
+
+
+def test_conflation_keeps_level_columns():
+    bids = parse_level_columns([["1.0", "1"], ["0.9", "1"]])
+    first = OrderbookEvent("kraken", "btcusdt", OBEventType.UPDATE, bids, [], 1, 1)
+    bids = parse_level_columns([["1.0", "0"], ["0.8", "2"]])
+    second = OrderbookEvent("kraken", "btcusdt", OBEventType.UPDATE, bids, [], 2, 2)
+
+    queue = EventQueue(policy=OverflowPolicy.CONFLATE)
+    queue.put_nowait(first)
+    queue.put_nowait(second)
+
+    merged = queue.get_nowait()
+    assert isinstance(merged.bids, LevelColumns)
+    assert merged.bids.prices.typecode == "d"
+    assert list(merged.bids) == [Level(1.0, 0.0), Level(0.9, 1.0), Level(0.8, 2.0)]
+
+
+def test_streams_are_conflated_separately():
+    queue = EventQueue(policy=OverflowPolicy.CONFLATE)
+    btc, eth = book_updates("btcusdt", 2), book_updates("ethusdt", 2)
+    for event in (btc[0], eth[0], btc[1], eth[1]):
+        queue.put_nowait(event)
+    queue.put_nowait(trade_event(1.0, 1))
+    queue.put_nowait(trade_event(2.0, 2))
+    queue.put_nowait(trade_event(3.0, 3, "ethusdt"))
+    queue.put_nowait(BboEvent("binance", "btcusdt", 1.0, 1.0, 2.0, 1.0, 1, 1))
+    queue.put_nowait(BboEvent("binance", "btcusdt", 1.5, 1.0, 2.0, 1.0, 2, 2))
+
+    items = [queue.get_nowait() for _ in range(queue.qsize())]
+    assert [(type(e).__name__, e.symbol) for e in items] == [
+        ("OrderbookEvent", "btcusdt"),
+        ("OrderbookEvent", "ethusdt"),
+        ("TradeEvent", "btcusdt"),
+        ("TradeEvent", "ethusdt"),
+        ("BboEvent", "btcusdt"),
+    ]
+    assert [t.price for t in items[2].trades] == [1.0, 2.0]
+    assert items[4].bid_price == 1.5
+
+
+def test_no_conflation_across_snapshots_and_status_events():
+    updates = book_updates(n=4)
+    snapshot = parse_snapshot_binance(
+        "binance", "btcusdt", 0, {"lastUpdateId": 0, "bids": [], "asks": []}
+    )
+    status = StatusEvent("binance", "btcusdt", StatusEventType.RESYNC, 0)
+
+    queue = EventQueue(policy=OverflowPolicy.CONFLATE)
+    for item in (updates[0], snapshot, updates[1], status, updates[2], updates[3]):
+        queue.put_nowait(item)
+
+    items = [queue.get_nowait() for _ in range(queue.qsize())]
+    assert items[:4] == [updates[0], snapshot, updates[1], status]
+    assert items[4] is updates[2]
+    assert items[4].other["last_update_id"] == updates[3].other["last_update_id"]
+    assert queue.n_conflated == 1
+
+
+def test_consumed_events_are_not_modified():
+    first, second = book_updates(n=2)
+    bids = list(first.bids)
+
+    queue = EventQueue(policy=OverflowPolicy.CONFLATE)
+    queue.put_nowait(first)
+    assert queue.get_nowait() is first
+    queue.put_nowait(second)
+
+    assert first.bids == bids
+    assert queue.get_nowait() is second
+    assert queue.n_conflated == 0
+
+
+def test_full_conflating_queue_blocks_without_a_queued_event():
+    async def main():
+        queue = EventQueue(1, OverflowPolicy.CONFLATE)
+        first, second = book_updates(n=2)
+        await queue.put(first)
+        await queue.put(second)  # merged, doesn't wait
+        assert queue.qsize() == 1
+
+        trade = trade_event(1.0, 1)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(queue.put(trade), 0.05)
+        with pytest.raises(asyncio.QueueFull):
+            queue.put_nowait(trade)
+
+    asyncio.run(main())
+
+
+def test_drop_policies_count_dropped_events():
+    events = [trade_event(float(i), i) for i in range(5)]
+
+    queue = EventQueue(2, OverflowPolicy.DROP_OLDEST)
+    for event in events:
+        queue.put_nowait(event)
+    assert [queue.get_nowait() for _ in range(2)] == events[3:]
+    assert queue.n_dropped == 3
+
+    queue = EventQueue(2, OverflowPolicy.DROP_NEWEST)
+    for event in events:
+        queue.put_nowait(event)
+    assert [queue.get_nowait() for _ in range(2)] == events[:2]
+    assert queue.n_dropped == 3
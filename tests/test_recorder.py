@@ -0,0 +1,62 @@
+import os
+
+from ws_apis.recorder import FrameRecorder, RecordKind, read_records
+
+
+def record_all(directory: str, records: list, **kwargs) -> FrameRecorder:
+    with FrameRecorder(directory, **kwargs) as recorder:
+        for conn_id, kind, payload in records:
+            recorder.record(conn_id, kind, payload)
+    return recorder
+
+
+def read_all(paths: list[str]) -> list:
+    return [r for path in paths for r in read_records(path)]
+
+
+def test_records_round_trip(tmp_path):
+    records = [
+        (1, RecordKind.CONNECT, "wss://stream\n{}"),
+        (1, RecordKind.FRAME, '{"e": "depthUpdate"}'),
+        (1, RecordKind.FRAME, "prix 20000 €"),
+        (2, RecordKind.REST, b"https://api/depth?symbol=BTCUSDT\n{}"),
+        (2, RecordKind.FRAME, b""),
+    ]
+    recorder = record_all(str(tmp_path), records)
+
+    read = read_all(recorder.paths)
+    assert recorder.n_records == len(records)
+    assert [(r.conn_id, r.kind, r.payload) for r in read] == [
+        (c, k, p.encode() if isinstance(p, str) else p) for c, k, p in records
+    ]
+    assert all(isinstance(r.kind, RecordKind) for r in read)
+    assert [r.ts for r in read] == sorted(r.ts for r in read)
+
+
+def test_blocks_and_rotation(tmp_path):
+    payloads = [f"frame {i} " + "é" * (i % 50) for i in range(2000)]
+    records = [(1, RecordKind.FRAME, p) for p in payloads]
+    recorder = record_all(str(tmp_path), records, block_size=2048, max_file_size=8192)
+
+    assert len(recorder.paths) > 1
+    assert all(os.path.getsize(p) <= 8192 for p in recorder.paths)
+    assert [r.payload.decode() for r in read_all(recorder.paths)] == payloads
+
+
+def test_truncated_block_is_skipped(tmp_path):
+    recorder = record_all(
+        str(tmp_path), [(1, RecordKind.FRAME, "x" * 100)] * 10, block_size=1
+    )
+    (path,) = recorder.paths
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.truncate(size - 5)
+    assert len(list(read_records(path))) == 9
+
+
+def test_recorders_with_the_same_prefix(tmp_path):
+    first = record_all(str(tmp_path), [(1, RecordKind.FRAME, "a")])
+    second = record_all(str(tmp_path), [(1, RecordKind.FRAME, "b")])
+
+    assert set(first.paths).isdisjoint(second.paths)
+    assert [r.payload for r in read_all(first.paths + second.paths)] == [b"a", b"b"]
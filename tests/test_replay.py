@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+import websockets
+
+import ws_apis.replay
+from ws_apis.recorder import FrameRecorder, RecordKind
+from ws_apis.replay import Replay, ReplayConnection
+
+SUBSCRIPTIONS = ['{"params": ["btcusdt@depth"]}', '{"params": ["btcusdt@aggTrade"]}']
+
+
+def record(directory: str, n: int):
+    """two connections (conn ids 1 and 2) with n interleaved frames each"""
+    with FrameRecorder(directory, block_size=256) as recorder:
+        for conn_id, subscription in enumerate(SUBSCRIPTIONS, 1):
+            recorder.record(conn_id, RecordKind.CONNECT, f"wss://x\n{subscription}")
+        for i in range(n):
+            recorder.record(1, RecordKind.FRAME, f"book {i}")
+            recorder.record(2, RecordKind.FRAME, f"trade {i}")
+
+
+async def recv_all(conn: ReplayConnection) -> list[str]:
+    frames = []
+    with pytest.raises(websockets.ConnectionClosedOK):
+        while True:
+            frames.append(await conn.recv())
+    return frames
+
+
+def test_connections_share_one_read_of_the_recording(tmp_path, monkeypatch):
+    n = ReplayConnection.buffer_size * 3  # more than the read ahead
+    record(str(tmp_path), n)
+    n_reads = []
+    read_records = ws_apis.replay.read_records
+    monkeypatch.setattr(
+        ws_apis.replay,
+        "read_records",
+        lambda path: n_reads.append(path) or read_records(path),
+    )
+
+    async def main():
+        replay = Replay(str(tmp_path), speed=None)
+        n_reads.clear()  # the first timestamp
+        replay._n_open = 2  # as if two websockets were added
+        book = ReplayConnection(replay, SUBSCRIPTIONS[0])
+        trades = ReplayConnection(replay, SUBSCRIPTIONS[1])
+        return await asyncio.gather(recv_all(book), recv_all(trades))
+
+    book, trades = asyncio.run(main())
+    assert book == [f"book {i}" for i in range(n)]
+    assert trades == [f"trade {i}" for i in range(n)]
+    assert len(n_reads) == 1
+
+
+def test_closed_connection_doesnt_block_the_others(tmp_path):
+    n = ReplayConnection.buffer_size * 3
+    record(str(tmp_path), n)
+
+    async def main():
+        replay = Replay(str(tmp_path), speed=None)
+        replay._n_open = 2
+        book = ReplayConnection(replay, SUBSCRIPTIONS[0])
+        trades = ReplayConnection(replay, SUBSCRIPTIONS[1])
+        assert await book.recv() == "book 0"
+        await book.close()
+        return await recv_all(trades)
+
+    assert len(asyncio.run(main())) == n
@@ -0,0 +1,56 @@
+import asyncio
+import multiprocessing
+
+import pytest
+
+from ws_apis.sharded import ShardedWsManager, ShardsExited
+from ws_apis.shm import ShmRing
+
+
+def _send_and_exit(ring: ShmRing, n: int):
+    for i in range(n):
+        ring.put_obj(i)
+    ring.close()
+
+
+def start_shard(wsm: ShardedWsManager, n: int):
+    """a shard process that sends n events and exits"""
+    ring = ShmRing(capacity=4096)
+    process = multiprocessing.get_context("spawn").Process(
+        target=_send_and_exit, args=(ring, n)
+    )
+    process.start()
+    process.join(10)
+    wsm._rings.append(ring)
+    wsm._processes.append(process)
+
+
+@pytest.fixture
+def wsm():
+    wsm = ShardedWsManager([], n_shards=2)
+    yield wsm
+    for ring in wsm._rings:
+        ring.close()
+
+
+def test_recv_raises_once_every_shard_exited(wsm):
+    async def main():
+        start_shard(wsm, 3)
+        start_shard(wsm, 0)
+
+        assert sorted([await wsm.recv() for _ in range(3)]) == [0, 1, 2]
+        with pytest.raises(ShardsExited):
+            await wsm.recv()
+        with pytest.raises(ShardsExited):
+            await wsm.recv_many()
+        assert wsm._exited == {0, 1}
+
+    asyncio.run(main())
+
+
+def test_iteration_stops_once_every_shard_exited(wsm):
+    async def main():
+        start_shard(wsm, 5)
+        return [event async for event in wsm]
+
+    assert asyncio.run(main()) == list(range(5))
@@ -0,0 +1,84 @@
+import multiprocessing
+import pickle
+
+import pytest
+
+from ws_apis.events import Trade, TradeEvent, TradeSide
+from ws_apis.shm import ShmRing
+
+
+@pytest.fixture
+def ring():
+    ring = ShmRing(capacity=64)
+    yield ring
+    ring.close()
+
+
+def test_records_come_out_in_order(ring):
+    assert ring.empty() and ring.get() is None
+    for payload in (b"a", b"bc", b""):
+        assert ring.put(payload)
+    assert [ring.get() for _ in range(3)] == [b"a", b"bc", b""]
+    assert ring.empty()
+
+
+def test_put_fails_when_full(ring):
+    assert ring.put(b"x" * 40)  # 44 bytes with the length
+    assert not ring.put(b"x" * 20)
+    assert ring.get() == b"x" * 40
+    assert ring.put(b"x" * 20)
+
+    with pytest.raises(ValueError):
+        ring.put(b"x" * 61)
+
+
+def test_records_wrap_around(ring):
+    # positions go around the buffer many times, with tails of every length
+    payloads = [bytes([i % 256]) * (i % 23) for i in range(500)]
+    received = []
+    for payload in payloads:
+        while not ring.put(payload):
+            received.append(ring.get())
+    while not ring.empty():
+        received.append(ring.get())
+    assert received == payloads
+
+
+def test_attach_by_name_and_pickle():
+    ring = ShmRing(capacity=4096)
+    other = pickle.loads(pickle.dumps(ring))
+    try:
+        assert other.name == ring.name and other.capacity == ring.capacity
+        event = TradeEvent("binance", "btcusdt", 1, 2, [Trade(1.0, 2.0, TradeSide.BUY)])
+        assert ring.put_obj(event)
+        assert other.get_obj() == event
+        assert ring.empty()
+    finally:
+        other.close()
+        ring.close()
+
+
+def _produce(ring: ShmRing, n: int):
+    for i in range(n):
+        while not ring.put_obj(i):
+            pass
+    ring.close()
+
+
+def test_records_cross_processes():
+    ring = ShmRing(capacity=256)
+    n = 2000
+    process = multiprocessing.get_context("spawn").Process(
+        target=_produce, args=(ring, n)
+    )
+    process.start()
+    try:
+        received = []
+        while len(received) < n:
+            item = ring.get_obj()
+            if item is not None:
+                received.append(item)
+        assert received == list(range(n))
+    finally:
+        process.join(10)
+        ring.close()
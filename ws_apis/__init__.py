@@ -1,5 +1,9 @@
 from .binance import BinanceWebsocket
 from .kraken import KrakenWebsocket
 from .events import StreamType, OrderbookEvent, TradeEvent
+from .events import StatusEvent, StatusEventType, BboEvent
 from .ws_manager import WsManager, Subscription
-from .events import Level
+from .queues import OverflowPolicy
+from .events import Level, LevelColumns, LazyLevels, LevelsFormat
+from .sharded import ShardedWsManager, ShardsExited, Placement
+from .replay import Replay
@@ -0,0 +1,60 @@
+from typing import Optional
+
+from .book_side import SortedSide
+from .events import BboEvent, OrderbookEvent, OBEventType, level_pairs
+
+
+class BboTracker:
+    """
+    Maintains the book of a symbol and derives its best bid and ask.
+    update returns a BboEvent only when the price or qty of the best bid or
+    ask changed, updates deeper in the book are absorbed.
+
+    With a depth the book is trimmed to it after each update (for exchanges
+    that don't delete levels pushed beyond the subscribed depth).
+    """
+
+    __slots__ = ("exch_name", "symbol", "depth", "bids", "asks", "_last")
+
+    def __init__(self, exch_name: str, symbol: str, depth: Optional[int] = None):
+        self.exch_name = exch_name
+        self.symbol = symbol
+        self.depth = depth
+        self.bids = SortedSide(is_bids=True)
+        self.asks = SortedSide(is_bids=False)
+        self._last = (0, 0, 0, 0)
+
+    def update(self, event: OrderbookEvent) -> Optional[BboEvent]:
+        if event.type == OBEventType.SNAPSHOT:
+            self.bids.load(level_pairs(event.bids))
+            self.asks.load(level_pairs(event.asks))
+        else:
+            for p, q in level_pairs(event.bids):
+                self.bids.set(p, q)
+            for p, q in level_pairs(event.asks):
+                self.asks.set(p, q)
+
+        # levels pushed beyond the subscribed depth are not deleted by kraken
+        if self.depth is not None:
+            self.bids.trim(self.depth)
+            self.asks.trim(self.depth)
+
+        bid, ask = self.bids.best(), self.asks.best()
+        bbo = (
+            bid.price if bid else 0,
+            bid.qty if bid else 0,
+            ask.price if ask else 0,
+            ask.qty if ask else 0,
+        )
+        if bbo == self._last:
+            return None
+
+        self._last = bbo
+        return BboEvent(
+            self.exch_name,
+            self.symbol,
+            *bbo,
+            event.ts_exchange,
+            event.ts_recorded,
+            event.stamps,
+        )
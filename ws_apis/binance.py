@@ -1,50 +1,112 @@
+import aiohttp
 import asyncio
 import json
 import logging
 import time
 
-from typing import Any, Optional, Union
+from bisect import bisect_right
+from collections import deque
+from typing import Any, Callable, Optional, Union
 from urllib.parse import urljoin
 
-from .events import WsEventType, StreamType
-from .events import OrderbookEvent, OBEventType, Level
-from .events import TradeEvent, Trade, TradeSide
-from .utils import get_request, SymbolsMeta
+from .decoders import get_binance_decoder
+from .events import WsEventType, StreamType, StatusEventType
+from .events import OrderbookEvent, OBEventType, Level, LevelsFormat
+from .events import TradeEvent, Trade, TradeSide, StatusEvent
+from .latency import Stage
+from .metrics import Sample
+from .rest import PRIORITY_RESYNC, PRIORITY_SNAPSHOT
+from .utils import get_request, parse_levels, SymbolsMeta, FixedPointScale
 from .websocket import Websocket
 
 
-async def get_ob_snapshot_binance(symbol: str, depth: int = 100) -> dict[str, Any]:
+async def get_ob_snapshot_binance(
+    symbol: str,
+    depth: int = 100,
+    session: Optional[aiohttp.ClientSession] = None,
+    on_response: Optional[Callable[[str, bytes], None]] = None,
+    rest_url: str = "https://api.binance.com/",
+) -> dict[str, Any]:
     """gets the order book snapshot from the rest api"""
-    rest_url = "https://api.binance.com/"
     url = urljoin(rest_url, "api/v3/depth")
     params = {"symbol": symbol, "limit": depth}
-    return await get_request(url, params)
+    return await get_request(url, params, session, on_response)
 
 
-def parse_event_type_binance(data: dict[str, Any]) -> WsEventType:
+def retry_after_binance(e: Exception) -> Optional[float]:
+    """seconds to wait after a 429 (rate limit) or 418 (ip ban) response"""
+    if not isinstance(e, aiohttp.ClientResponseError) or e.status not in (418, 429):
+        return None
+    try:
+        return float(e.headers["Retry-After"])  # type: ignore[index]
+    except (TypeError, KeyError, ValueError):
+        return None
+
+
+def depth_weight_binance(limit: int) -> int:
+    """request weight of an orderbook snapshot of limit levels"""
+    if limit <= 100:
+        return 5
+    if limit <= 500:
+        return 25
+    if limit <= 1000:
+        return 50
+    return 250
+
+
+def unwrap_msg_binance(data: Any) -> Any:
+    """
+    returns the message of a decoded frame, unwrapping combined stream
+    frames. data is a dict or, from the msgspec decoder, a typed struct
+    (see decoders.get_binance_decoder) that the parsers read as attributes.
+    """
+    if not isinstance(data, dict):
+        return data.data  # typed combined stream frame
+    if data.get("stream") is not None:
+        return data["data"]
+    return data
+
+
+def parse_event_type_binance(data: Any) -> WsEventType:
     """parses the event type from the binance websocket message"""
-    if data.get("e") == "depthUpdate":
+    if isinstance(data, dict):
+        e = data.get("e")
+    else:
+        e = data.__struct_config__.tag
+    if e == "depthUpdate":
         return WsEventType.BOOK
-    if data.get("e") == "aggTrade":
+    if e == "aggTrade":
         return WsEventType.TRADE
     return WsEventType.OTHER
 
 
-def parse_level_binance(data: list[str]) -> Level:
+def parse_level_binance(
+    data: list[str], scale: Optional[FixedPointScale] = None
+) -> Level:
     """parses a level from the binance websocket message"""
+    if scale is not None:
+        return Level(scale.price(data[0]), scale.qty(data[1]))
     price = float(data[0])
     qty = float(data[1])
     return Level(price, qty)
 
 
 def parse_book_msg_binance(
-    exch_name: str, symbol: str, data: dict[str, Any]
+    exch_name: str,
+    symbol: str,
+    data: Any,
+    scale: Optional[FixedPointScale] = None,
+    fmt: LevelsFormat = LevelsFormat.OBJECTS,
 ) -> OrderbookEvent:
     """parses a binance websocket message and returns an OrderbookEvent"""
-    ts_exchange = int(data["E"] * 1e6)
-    bids = [parse_level_binance(b) for b in data["b"]]
-    asks = [parse_level_binance(a) for a in data["a"]]
-    update_ids = {"first_update_id": data["U"], "last_update_id": data["u"]}
+    if isinstance(data, dict):
+        E, U, u, b, a = data["E"], data["U"], data["u"], data["b"], data["a"]
+    else:
+        E, U, u, b, a = data.E, data.U, data.u, data.b, data.a
+    ts_exchange = int(E * 1e6)
+    bids = parse_levels(b, parse_level_binance, scale, fmt)
+    asks = parse_levels(a, parse_level_binance, scale, fmt)
+    update_ids = {"first_update_id": U, "last_update_id": u}
     return OrderbookEvent(
         exch_name=exch_name,
         symbol=symbol,
@@ -52,33 +114,48 @@ def parse_book_msg_binance(
         bids=bids,
         asks=asks,
         ts_exchange=ts_exchange,
-        ts_recorded=int(time.time() * 1e9),
+        ts_recorded=time.time_ns(),
         other=update_ids,
     )
 
 
 def parse_trade_msg_binance(
-    exch_name: str, symbol: str, data: dict[str, Any]
+    exch_name: str,
+    symbol: str,
+    data: Any,
+    scale: Optional[FixedPointScale] = None,
 ) -> TradeEvent:
     """parses a binance websocket message and returns a TradeEvent"""
-    ts_exchange = int(data["T"] * 1e6)
-    side = TradeSide.SELL if data["m"] else TradeSide.BUY
-    trade = Trade(price=float(data["p"]), qty=float(data["q"]), side=side)
+    if isinstance(data, dict):
+        T, m, p, q = data["T"], data["m"], data["p"], data["q"]
+    else:
+        T, m, p, q = data.T, data.m, data.p, data.q
+    ts_exchange = int(T * 1e6)
+    side = TradeSide.SELL if m else TradeSide.BUY
+    if scale is not None:
+        trade = Trade(price=scale.price(p), qty=scale.qty(q), side=side)
+    else:
+        trade = Trade(price=float(p), qty=float(q), side=side)
     return TradeEvent(
         exch_name=exch_name,
         symbol=symbol,
         ts_exchange=ts_exchange,
-        ts_recorded=int(time.time() * 1e9),
+        ts_recorded=time.time_ns(),
         trades=[trade],
     )
 
 
 def parse_snapshot_binance(
-    exch_name: str, symbol: str, ts_exchange: int, data: dict[str, Any]
+    exch_name: str,
+    symbol: str,
+    ts_exchange: int,
+    data: dict[str, Any],
+    scale: Optional[FixedPointScale] = None,
+    fmt: LevelsFormat = LevelsFormat.OBJECTS,
 ) -> OrderbookEvent:
     """parses a binance rest api response and returns an OrderbookEvent"""
-    bids = [parse_level_binance(b) for b in data["bids"]]
-    asks = [parse_level_binance(a) for a in data["asks"]]
+    bids = parse_levels(data["bids"], parse_level_binance, scale, fmt)
+    asks = parse_levels(data["asks"], parse_level_binance, scale, fmt)
     update_ids = {"last_update_id": data["lastUpdateId"]}
     return OrderbookEvent(
         exch_name=exch_name,
@@ -87,7 +164,7 @@ def parse_snapshot_binance(
         bids=bids,
         asks=asks,
         ts_exchange=ts_exchange,
-        ts_recorded=int(time.time() * 1e9),
+        ts_recorded=time.time_ns(),
         other=update_ids,
     )
 
@@ -110,25 +187,65 @@ class BinanceWebsocket(Websocket):
     """
     Binance Websocket returns WsEvents rather than raw messages
     It also buffers orderbook events and synchronizes them with snapshots
+
+    Several symbols can share one connection: it subscribes to all of them on
+    the combined stream endpoint and demuxes the frames by symbol (each book
+    stream gets its own BinanceEventsBuffer).
+
+    A book snapshot is requested as soon as the first update of the book has
+    been buffered. Snapshots are fetched through the (shared) RestClient,
+    which keeps them within binance's request weight limit; resyncs go
+    first. After a reconnect every book is resynced: its buffer is reset
+    and a fresh snapshot is requested.
+
+    With fixed_point=True prices and quantities are parsed to scaled ints
+    (see utils.FixedPointScale) instead of floats. levels_format selects
+    how orderbook levels are stored (list of Level, LevelColumns, or
+    LazyLevels that defer number conversion until they are accessed).
     """
 
     _name = "binance"
     _symbolsMeta: SymbolsMeta = SymbolsMeta()
     _rest_url = "https://api.binance.com/"
-    _ws_url = "wss://stream.binance.com:9443/ws"
-
-    def __init__(self, streamType: StreamType, symbol: str, depth: Optional[int]):
-        subscription_msg = self._prepare_subscription_msg(streamType, symbol)
+    _ws_url = "wss://stream.binance.com:9443/stream"
+    _decode = staticmethod(get_binance_decoder())
+    _max_streams = 1024  # max number of streams per connection
+    # diff-depth updates never resend deeper levels, so a bbo book needs a
+    # deep snapshot and can't be trimmed (deletes keep it bounded)
+    _bbo_depth = 1000
+
+    def __init__(
+        self,
+        streamType: StreamType,
+        symbol: Union[str, list[str]],
+        depth: Optional[int],
+        fixed_point: bool = False,
+        levels_format: LevelsFormat = LevelsFormat.OBJECTS,
+    ):
+        symbols = [symbol] if isinstance(symbol, str) else list(symbol)
+        if len(symbols) > self._max_streams:
+            raise ValueError(f"too many streams for one connection {symbols}")
+
+        subscription_msg = self._prepare_subscription_msg(streamType, symbols)
         super().__init__(self._ws_url, subscription_msg)
 
-        self.symbol = symbol
+        self.symbols = symbols
+
         self.depth = depth
         self.streamType = streamType
+        self.fixed_point = fixed_point
+        self.levels_format = levels_format
 
         # binance orderbook streams require special treatment.
         if self.streamType == StreamType.BOOK:
+            # holds at most the buffered events of one flush, so no bound
             self._buffer_queue = asyncio.Queue()
-            self.eventsBuffer = BinanceEventsBuffer(self._buffer_queue)
+            self.eventsBuffers = {
+                s: BinanceEventsBuffer(self._buffer_queue) for s in self.symbols
+            }
+        self._snapshot_tasks: dict[str, asyncio.Task] = {}
+        # books waiting for their first buffered update (to the snapshot priority)
+        self._snapshots_wanted: dict[str, int] = {}
 
         self._logger = logging.getLogger(__name__)
 
@@ -136,96 +253,259 @@ class BinanceWebsocket(Websocket):
         """connects to the websocket and subscribes to the symbols"""
         await super().connect()
         if self.streamType == StreamType.BOOK:
-            task = self._loop.create_task(self._queue_snapshot_rest(self.symbol))
-            self._coros.append(task)
+            for symbol in self.symbols:
+                self._snapshots_wanted[symbol] = PRIORITY_SNAPSHOT
+
+    async def cleanup(self):
+        for task in self._snapshot_tasks.values():
+            task.cancel()
+        await super().cleanup()
+
+    async def _on_reconnect(self):
+        await super()._on_reconnect()
+        if self.streamType == StreamType.BOOK:
+            for symbol in self.symbols:
+                await self._resync(symbol)
+
+    def _reset_sync(self, symbol: str):
+        """resets the sync state of a book, a snapshot follows the next update"""
+        self._logger.info(f"resyncing {symbol}")
+        eventsBuffer = self.eventsBuffers[symbol]
+        eventsBuffer.reset()
+        eventsBuffer.n_resyncs += 1
+        self._cancel_snapshot(symbol)
+        self._snapshots_wanted[symbol] = PRIORITY_RESYNC
+
+    async def _resync(self, symbol: str):
+        """resets the sync state of a book and requests a new snapshot"""
+        self._reset_sync(symbol)
+        await self._put_status(symbol, StatusEventType.RESYNC)
+
+    def _restart_sync(self, symbol: str, reason: str):
+        """resyncs a book from recv (the status goes before the queued events)"""
+        self._reset_sync(symbol)
+        if self.status_events:
+            status = self._status_event(symbol, StatusEventType.RESYNC, reason)
+            self._buffer_queue.put_nowait(status)
+
+    def _cancel_snapshot(self, symbol: str):
+        task = self._snapshot_tasks.pop(symbol, None)
+        if task is not None and not task.done():
+            task.cancel()
+
+    def _request_snapshot(self, symbol: str, priority: int = PRIORITY_SNAPSHOT):
+        """queues a snapshot of symbol (replaces a pending request)"""
+        self._cancel_snapshot(symbol)
+        task = self._loop.create_task(self._queue_snapshot_rest(symbol, priority))
+        self._snapshot_tasks[symbol] = task
 
     async def _listen(self):
-        assert self._conn is not None
-        msg = await self._conn.recv()
+        msg = await self._recv_frame()
+        stamps = self._start_stamps()
+
+        data = unwrap_msg_binance(self._decode(msg))
+        if stamps is not None:
+            stamps.mark(Stage.DECODED)
 
-        data = json.loads(msg)
         event_type = parse_event_type_binance(data)
         if event_type == WsEventType.BOOK:
-            await self._queue.put(self._parse_book_msg(data))
+            await self._queue_event(self._parse_book_msg(data), stamps)
         elif event_type == WsEventType.TRADE:
-            await self._queue.put(self._parse_trade_msg(data))
+            await self._queue_event(self._parse_trade_msg(data), stamps)
         else:
             self._logger.info(f"received other event {event_type}")
 
-    async def recv(self) -> Union[OrderbookEvent, TradeEvent]:
+    async def recv(self) -> Union[OrderbookEvent, TradeEvent, StatusEvent]:
         """returns an OrderbookEvent or a TradeEvent"""
+        return await self._next_event()
+
+    def _pop_ready(self) -> Optional[OrderbookEvent]:
         # always flush buffer queue when possible
         if self.streamType == StreamType.BOOK and not self._buffer_queue.empty():
-            return await self._buffer_queue.get()
+            return self._buffer_queue.get_nowait()
+        return None
 
-        # take events off the queue until one can get returned
-        while True:
-            try:
-                event = await asyncio.wait_for(self._queue.get(), timeout=self._timeout)
-            except asyncio.TimeoutError:
-                self._logger.info("timeout in recv")
-                continue
+    async def _process(self, event: Any) -> Optional[Any]:
+        """returns the event if it can be returned, buffers it otherwise"""
+        if not isinstance(event, OrderbookEvent):
+            return event
 
-            if not isinstance(event, OrderbookEvent):
+        eventsBuffer = self.eventsBuffers[event.symbol]
+        if event.type == OBEventType.SNAPSHOT:
+            if await eventsBuffer.flush_to_buffer_queue(event):
                 return event
-
-            if event.type == OBEventType.SNAPSHOT:
-                await self.eventsBuffer.flush_to_buffer_queue(event)
-                return event
-
-            if self.eventsBuffer.is_event_valid(event):
-                return event
-            else:
-                self.eventsBuffer.buffer_event(event)
-                self._logger.info("buffered event")
-
-    def _parse_book_msg(self, data: dict[str, Any]) -> OrderbookEvent:
-        symbol = self._symbolsMeta.rest_sym2sym(self._name, data["s"])
-        return parse_book_msg_binance(self._name, symbol, data)
-
-    def _parse_trade_msg(self, data: dict[str, Any]) -> TradeEvent:
-        symbol = self._symbolsMeta.rest_sym2sym(self._name, data["s"])
-        return parse_trade_msg_binance(self._name, symbol, data)
+            self._logger.info(f"snapshot of {event.symbol} is older than updates")
+            self._restart_sync(event.symbol, "snapshot")
+            return None
+
+        if eventsBuffer.is_event_valid(event):
+            return event
+        if eventsBuffer.is_stale(event):
+            eventsBuffer.n_stale += 1
+            return None
+        if eventsBuffer.is_gap(event):
+            self._logger.info(f"gap in updates of {event.symbol}")
+            eventsBuffer.n_gaps += 1
+            self._restart_sync(event.symbol, "gap")
+
+        eventsBuffer.buffer_event(event)
+        self._logger.debug("buffered event")
+
+        # the snapshot is only useful once there is an update to sync it with
+        priority = self._snapshots_wanted.pop(event.symbol, None)
+        if priority is not None:
+            self._request_snapshot(event.symbol, priority)
+        return None
+
+    def _get_scale(self, symbol: str) -> Optional[FixedPointScale]:
+        if not self.fixed_point:
+            return None
+        return self._symbolsMeta.fixed_point_scale(self._name, symbol)
+
+    def _msg_symbol(self, data: Any) -> str:
+        rest_symbol = data["s"] if isinstance(data, dict) else data.s
+        return self._symbolsMeta.rest_sym2sym(self._name, rest_symbol)
+
+    def _parse_book_msg(self, data: Any) -> OrderbookEvent:
+        symbol = self._msg_symbol(data)
+        scale, fmt = self._get_scale(symbol), self.levels_format
+        return parse_book_msg_binance(self._name, symbol, data, scale, fmt)
+
+    def _parse_trade_msg(self, data: Any) -> TradeEvent:
+        symbol = self._msg_symbol(data)
+        scale = self._get_scale(symbol)
+        return parse_trade_msg_binance(self._name, symbol, data, scale)
 
     async def _get_snapshot_rest(self, symbol: str) -> OrderbookEvent:
         """gets the order book snapshot from the rest api and returns an OrderbookEvent"""
         t = time.time()
         rest_symbol = self._symbolsMeta.sym2rest_sym(self._name, symbol)
-        data = await get_ob_snapshot_binance(rest_symbol, self.depth)
+        on_response = self._record_rest if self.recorder is not None else None
+        data = await get_ob_snapshot_binance(
+            rest_symbol, self.depth, self.rest.session, on_response, self._rest_url
+        )
         ts_exchange = int((time.time() + t) / 2 * 1e9)  # fake ts_exchange
-        return parse_snapshot_binance(self._name, symbol, ts_exchange, data)
-
-    async def _queue_snapshot_rest(self, symbol: str):
-        """gets the order book snapshot from the rest api and queues it"""
-        await asyncio.sleep(1)  # wait for the connection to be established
-        snapshot = await self._get_snapshot_rest(symbol)
+        scale, fmt = self._get_scale(symbol), self.levels_format
+        return parse_snapshot_binance(self._name, symbol, ts_exchange, data, scale, fmt)
+
+    async def _queue_snapshot_rest(self, symbol: str, priority: int):
+        """
+        schedules the order book snapshot from the rest api and queues it.
+        failed requests are retried with backoff, or after the Retry-After
+        of a rate limit response (which pauses all requests of the client).
+        """
+        weight = depth_weight_binance(self.depth or 100)
+        t = time.monotonic()
+        attempt = 0
+        while True:
+            fetch = lambda: self._get_snapshot_rest(symbol)
+            try:
+                snapshot = await self.rest.schedule(fetch, weight, priority)
+                break
+            except Exception as e:
+                if self._closing:
+                    return
+                delay = retry_after_binance(e)
+                if delay is not None:
+                    self.rest.budget.pause(delay)
+                else:
+                    delay = self._backoff_delay(attempt)
+                msg = f"snapshot of {symbol} failed ({e}), retry in {delay:.2f}s"
+                if isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)):
+                    self._logger.info(msg)
+                else:
+                    self._logger.exception(msg)
+                await asyncio.sleep(delay)
+                attempt += 1
+        eventsBuffer = self.eventsBuffers[symbol]
+        eventsBuffer.n_snapshots += 1
+        eventsBuffer.snapshot_latency = time.monotonic() - t
         await self._queue.put(snapshot)
 
-    def _prepare_subscription_msg(self, streamType: StreamType, symbol: str) -> str:
-        """returns the subscription message for the given symbol and streamType"""
-        ws_symbol = self._symbolsMeta.sym2ws_sym(self._name, symbol)
+    def metrics(self, labels: Optional[dict[str, str]] = None) -> list[Sample]:
+        samples = super().metrics(labels)
+        if self.streamType == StreamType.BOOK:
+            labels = {"exchange": self._name, **(labels or {})}
+            samples.append(
+                Sample("binance_ready_queue_size", labels, self._buffer_queue.qsize())
+            )
+            for symbol, eventsBuffer in self.eventsBuffers.items():
+                samples += eventsBuffer.metrics({**labels, "symbol": symbol})
+        return samples
+
+    def _prepare_subscription_msg(
+        self, streamType: StreamType, symbols: list[str]
+    ) -> str:
+        """returns the subscription message for the given symbols and streamType"""
+        ws_symbols = [self._symbolsMeta.sym2ws_sym(self._name, s) for s in symbols]
         if streamType == StreamType.TRADES:
-            return prepare_trades_subscription_msg_binance([ws_symbol], 0)
+            return prepare_trades_subscription_msg_binance(ws_symbols, 0)
         if streamType == StreamType.BOOK:
-            return prepare_book_subscription_msg_binance([ws_symbol], 0)
+            return prepare_book_subscription_msg_binance(ws_symbols, 0)
         raise ValueError(f"streamType {streamType} not supported")
 
 
+def _update_id(event: OrderbookEvent) -> int:
+    assert isinstance(event.other, dict)
+    return event.other["last_update_id"]
+
+
 class BinanceEventsBuffer:
-    """for handling events order in Binance"""
+    """
+    for handling events order in Binance
+
+    Updates are buffered until the snapshot arrives. The buffer drops its
+    oldest events when it is full; its size adapts to the number of updates
+    that arrived during the last snapshot request (between min_buffer_size
+    and max_buffer_size). At the snapshot, the stale events are skipped by a
+    binary search on their last update id.
 
-    def __init__(self, buffer_queue: asyncio.Queue, max_buffer_size: int = 100):
-        self.events_buffer: list[OrderbookEvent] = []
+    Once a snapshot has been loaded, an update that doesn't follow the last
+    one (or a snapshot that is older than the buffered updates) is a gap: the
+    caller has to resync (see BinanceWebsocket._process).
+
+    The counters (gaps, resyncs, overflows, stale updates and snapshots, with
+    the latency of the last snapshot request) are returned by metrics().
+    """
+
+    def __init__(
+        self,
+        buffer_queue: asyncio.Queue,
+        min_buffer_size: int = 100,
+        max_buffer_size: int = 100_000,
+    ):
+        self.events_buffer: deque[OrderbookEvent] = deque()
+        self.min_buffer_size = min_buffer_size
         self.max_buffer_size = max_buffer_size
+        self.buffer_size = min_buffer_size
         self.last_update_id = 0
+        self.has_snapshot = False
         self.handled_first_event = False
         self.buffer_queue = buffer_queue
 
+        self.n_waiting = 0  # updates received while waiting for the snapshot
+        self.n_gaps = 0
+        self.n_resyncs = 0
+        self.n_overflows = 0
+        self.n_stale = 0  # updates already contained in the snapshot or book
+        self.n_snapshots = 0
+        self.snapshot_latency = 0.0  # from the request to the response (in seconds)
+
+    def reset(self):
+        """forgets the sync state (before waiting for a new snapshot)"""
+        self.events_buffer.clear()
+        self.last_update_id = 0
+        self.has_snapshot = False
+        self.handled_first_event = False
+        self.n_waiting = 0
+
     def buffer_event(self, event: OrderbookEvent):
-        if len(self.events_buffer) >= self.max_buffer_size:
-            raise ValueError("buffer size exceeded")
+        if len(self.events_buffer) >= self.buffer_size:
+            self.events_buffer.popleft()
+            self.n_overflows += 1
 
         self.events_buffer.append(event)
+        self.n_waiting += 1
 
     def _is_first_event_valid(self, fid: int, lid: int) -> bool:
         """the first event following a snapshot is a special case"""
@@ -236,6 +516,9 @@ class BinanceEventsBuffer:
 
     def _is_event_valid(self, fid: int, lid: int) -> bool:
         """returns true the first and last update ids are consistent with the last event"""
+        if not self.has_snapshot:
+            return False
+
         if not self.handled_first_event:
             return self._is_first_event_valid(fid, lid)
 
@@ -252,18 +535,56 @@ class BinanceEventsBuffer:
             return True
         return False
 
-    async def flush_to_buffer_queue(self, snapEvent: OrderbookEvent):
-        assert isinstance(snapEvent.other, dict)
-        self.last_update_id = snapEvent.other["last_update_id"]
+    def is_stale(self, event: OrderbookEvent) -> bool:
+        """returns true if the event is already contained in the book"""
+        return self.has_snapshot and _update_id(event) <= self.last_update_id
 
-        while len(self.events_buffer) > 0:
-            event = self.events_buffer.pop(0)
-            fid, lid = self.parse_update_ids(event)
+    def is_gap(self, event: OrderbookEvent) -> bool:
+        """returns true if updates between the book and the event are missing"""
+        fid, _ = self.parse_update_ids(event)
+        return self.has_snapshot and fid > self.last_update_id + 1
 
-            # queue the next event if it is valid
-            if self._is_event_valid(fid, lid):
-                await self.buffer_queue.put(event)
-                self.last_update_id = lid
+    async def flush_to_buffer_queue(self, snapEvent: OrderbookEvent) -> bool:
+        """
+        loads the snapshot and queues the buffered events that follow it.
+        returns False if there is a gap between the snapshot and the events.
+        """
+        assert isinstance(snapEvent.other, dict)
+        self.last_update_id = snapEvent.other["last_update_id"]
+        self.has_snapshot = True
+
+        # size the buffer for the next snapshot by the updates of this one
+        # (shrinking by at most half at a time)
+        size = max(2 * self.n_waiting, self.buffer_size // 2, self.min_buffer_size)
+        self.buffer_size = min(size, self.max_buffer_size)
+        self.n_waiting = 0
+
+        # updates are ordered by update id, skip the ones up to the snapshot
+        n_stale = bisect_right(self.events_buffer, self.last_update_id, key=_update_id)
+        for _ in range(n_stale):
+            self.events_buffer.popleft()
+        self.n_stale += n_stale
+
+        events = list(self.events_buffer)
+        self.events_buffer.clear()
+        if not all(self.is_event_valid(event) for event in events):
+            return False
+
+        for event in events:
+            await self.buffer_queue.put(event)
+        return True
+
+    def metrics(self, labels: dict[str, str]) -> list[Sample]:
+        return [
+            Sample("binance_buffered_events", labels, len(self.events_buffer)),
+            Sample("binance_buffer_size", labels, self.buffer_size),
+            Sample("binance_gaps_total", labels, self.n_gaps),
+            Sample("binance_resyncs_total", labels, self.n_resyncs),
+            Sample("binance_overflows_total", labels, self.n_overflows),
+            Sample("binance_stale_total", labels, self.n_stale),
+            Sample("binance_snapshots_total", labels, self.n_snapshots),
+            Sample("binance_snapshot_latency_seconds", labels, self.snapshot_latency),
+        ]
 
     @staticmethod
     def parse_update_ids(event: OrderbookEvent) -> tuple[int, int]:
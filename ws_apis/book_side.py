@@ -0,0 +1,85 @@
+from bisect import bisect_left, insort
+from typing import Iterable, Optional
+
+from .events import Level
+
+
+class SortedSide:
+    """
+    One side of an orderbook kept in price order.
+
+    Prices are stored in a dict (price -> qty) and in a sorted list of keys.
+    Keys are signed so that the list is always ascending with the best price
+    at the end: updates mostly happen near the top of the book, so inserts
+    and deletes only shift the few keys behind them.
+
+    Trimming is lazy: trimmed levels are removed from the dict right away but
+    their keys stay in front of `_lo` until enough of them pile up, at which
+    point they are dropped in one go (amortized constant time per level).
+    """
+
+    __slots__ = ("levels", "_keys", "_lo", "_sign")
+
+    def __init__(self, is_bids: bool):
+        self.levels: dict[float, float] = {}
+        self._keys: list[float] = []
+        self._lo = 0
+        self._sign = 1 if is_bids else -1
+
+    def __len__(self) -> int:
+        return len(self._keys) - self._lo
+
+    def __contains__(self, price: float) -> bool:
+        return price in self.levels
+
+    def load(self, levels: Iterable[tuple[float, float]]):
+        """replaces the side with the given (price, qty) pairs"""
+        self.levels = {p: q for p, q in levels if q > 0}
+        self._keys = sorted(self._sign * p for p in self.levels)
+        self._lo = 0
+
+    def set(self, price: float, qty: float):
+        """sets the qty at price, a qty <= 0 deletes the level"""
+        if qty > 0:
+            if price not in self.levels:
+                insort(self._keys, self._sign * price, self._lo)
+            self.levels[price] = qty
+        elif price in self.levels:
+            del self.levels[price]
+            del self._keys[bisect_left(self._keys, self._sign * price, self._lo)]
+
+    def trim(self, depth: int) -> list[float]:
+        """removes all levels beyond depth and returns their prices"""
+        excess = len(self) - depth
+        if excess <= 0:
+            return []
+
+        lo = self._lo + excess
+        removed = [self._sign * k for k in self._keys[self._lo : lo]]
+        for p in removed:
+            del self.levels[p]
+        self._lo = lo
+
+        if lo >= depth or lo > len(self._keys) // 2:
+            del self._keys[:lo]
+            self._lo = 0
+        return removed
+
+    def best(self) -> Optional[Level]:
+        """returns the best level or None if the side is empty"""
+        if len(self._keys) == self._lo:
+            return None
+        p = self._sign * self._keys[-1]
+        return Level(p, self.levels[p])
+
+    def prices(self, n: Optional[int] = None) -> list[float]:
+        """returns the best n prices (all prices if n is None), best first"""
+        size = len(self)
+        n = size if n is None else min(n, size)
+        sign = self._sign
+        return [sign * k for k in self._keys[len(self._keys) - n :][::-1]]
+
+    def top(self, n: Optional[int] = None) -> list[Level]:
+        """returns the best n levels, best first"""
+        levels = self.levels
+        return [Level(p, levels[p]) for p in self.prices(n)]
@@ -0,0 +1,223 @@
+import glob
+import os
+
+import numpy as np
+
+from typing import Iterator, Optional, Sequence, Union
+from .events import OrderbookEvent, OBEventType, TradeEvent, TradeSide, level_pairs
+
+# columns of the streams, book events are stored as one row per level
+# (side 1 = bid, -1 = ask), trade events as one row per trade (1 = buy, -1 = sell)
+TRADE_COLUMNS = {
+    "ts_exchange": np.int64,
+    "ts_recorded": np.int64,
+    "price": np.float64,
+    "qty": np.float64,
+    "side": np.int8,
+}
+BOOK_COLUMNS = {
+    **TRADE_COLUMNS,
+    "event_id": np.int64,  # rows of the same event share it
+    "snapshot": np.bool_,
+    "first_update_id": np.int64,  # -1 if the exchange has no update ids
+    "last_update_id": np.int64,
+}
+_STREAM_COLUMNS = {"book": BOOK_COLUMNS, "trades": TRADE_COLUMNS}
+_SIDES = {TradeSide.BUY: 1, TradeSide.SELL: -1}
+
+
+def stream_dir(directory: str, exch_name: str, symbol: str, stream: str) -> str:
+    return os.path.join(directory, exch_name, symbol, stream)
+
+
+def list_chunks(path: str) -> list[str]:
+    """returns the complete chunk directories of a stream directory, in order"""
+    return sorted(glob.glob(os.path.join(path, "[0-9]" * 8)))
+
+
+class _ChunkBuffer:
+    """rows of one stream buffered in preallocated columns"""
+
+    def __init__(self, path: str, columns: dict[str, type], chunk_rows: int):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.columns = {c: np.empty(chunk_rows, t) for c, t in columns.items()}
+        self.n = 0
+
+        chunks = list_chunks(path)
+        self.n_chunks = int(os.path.basename(chunks[-1])) + 1 if chunks else 0
+        self.next_event_id = 0
+        if chunks and "event_id" in columns:
+            last = np.load(os.path.join(chunks[-1], "event_id.npy"), mmap_mode="r")
+            self.next_event_id = int(last[-1]) + 1 if len(last) else 0
+
+    def append(self, rows: dict[str, Union[np.ndarray, int, float]], n: int):
+        """appends n rows (scalars are repeated), writes the chunks that fill up"""
+        start = 0
+        while start < n:
+            k = min(n - start, self.chunk_rows - self.n)
+            for c, col in self.columns.items():
+                value = rows[c]
+                if isinstance(value, np.ndarray):
+                    value = value[start : start + k]
+                col[self.n : self.n + k] = value
+            self.n += k
+            start += k
+            if self.n == self.chunk_rows:
+                self.flush()
+
+    def flush(self):
+        """writes the buffered rows as a chunk (readers only see complete chunks)"""
+        if self.n == 0:
+            return
+        name = os.path.join(self.path, f"{self.n_chunks:08d}")
+        tmp = name + ".tmp"
+        os.makedirs(tmp, exist_ok=True)
+        for c, col in self.columns.items():
+            np.save(os.path.join(tmp, f"{c}.npy"), col[: self.n])
+        os.rename(tmp, name)
+        self.n_chunks += 1
+        self.n = 0
+
+
+class ColumnarWriter:
+    """
+    Writes OrderbookEvents and TradeEvents to columnar storage: the rows of
+    each (exchange, symbol, stream) are batched into chunks of chunk_rows
+    rows, and each chunk is a directory with one .npy file per column (see
+    BOOK_COLUMNS and TRADE_COLUMNS):
+
+        {directory}/{exch_name}/{symbol}/{book|trades}/{chunk:08d}/{column}.npy
+
+    Chunks are written once complete (or on flush/close) and read back with
+    ColumnarReader. Prices and qtys are stored as float64 (fixed-point ints
+    as well).
+    """
+
+    def __init__(self, directory: str, chunk_rows: int = 1 << 16):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self._buffers: dict[tuple[str, str, str], _ChunkBuffer] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _buffer(self, exch_name: str, symbol: str, stream: str) -> _ChunkBuffer:
+        key = (exch_name, symbol, stream)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            path = stream_dir(self.directory, *key)
+            os.makedirs(path, exist_ok=True)
+            columns = _STREAM_COLUMNS[stream]
+            buffer = self._buffers[key] = _ChunkBuffer(path, columns, self.chunk_rows)
+        return buffer
+
+    def write(self, event: Union[OrderbookEvent, TradeEvent]):
+        if isinstance(event, OrderbookEvent):
+            self._write_book(event)
+        elif isinstance(event, TradeEvent):
+            self._write_trades(event)
+
+    def _write_book(self, event: OrderbookEvent):
+        buffer = self._buffer(event.exch_name, event.symbol, "book")
+        bids = np.array(list(level_pairs(event.bids)), np.float64).reshape(-1, 2)
+        asks = np.array(list(level_pairs(event.asks)), np.float64).reshape(-1, 2)
+        levels = np.concatenate((bids, asks))
+        side = np.ones(len(levels), np.int8)
+        side[len(bids) :] = -1
+
+        ids = event.other if isinstance(event.other, dict) else {}
+        rows = {
+            "ts_exchange": event.ts_exchange,
+            "ts_recorded": event.ts_recorded,
+            "price": levels[:, 0],
+            "qty": levels[:, 1],
+            "side": side,
+            "event_id": buffer.next_event_id,
+            "snapshot": event.type == OBEventType.SNAPSHOT,
+            "first_update_id": ids.get("first_update_id", -1),
+            "last_update_id": ids.get("last_update_id", -1),
+        }
+        buffer.next_event_id += 1
+        buffer.append(rows, len(levels))
+
+    def _write_trades(self, event: TradeEvent):
+        buffer = self._buffer(event.exch_name, event.symbol, "trades")
+        trades = event.trades
+        rows = {
+            "ts_exchange": event.ts_exchange,
+            "ts_recorded": event.ts_recorded,
+            "price": np.array([t.price for t in trades], np.float64),
+            "qty": np.array([t.qty for t in trades], np.float64),
+            "side": np.array([_SIDES[t.side] for t in trades], np.int8),
+        }
+        buffer.append(rows, len(trades))
+
+    def flush(self):
+        """writes the buffered rows of all streams"""
+        for buffer in self._buffers.values():
+            buffer.flush()
+
+    def close(self):
+        self.flush()
+        self._buffers.clear()
+
+
+class ColumnarReader:
+    """
+    Reads a stream written by ColumnarWriter. Chunks are memory-mapped, scan
+    returns views into the files (nothing is copied or loaded up front).
+
+    Range scans bisect the time column, which is assumed to be non-decreasing
+    (ts_recorded, and ts_exchange for exchanges that timestamp in order).
+    """
+
+    def __init__(self, directory: str, exch_name: str, symbol: str, stream: str):
+        self.path = stream_dir(directory, exch_name, symbol, stream)
+        self.columns = list(_STREAM_COLUMNS[stream])
+
+    @property
+    def chunks(self) -> list[str]:
+        return list_chunks(self.path)
+
+    def _column(self, chunk: str, column: str) -> np.ndarray:
+        return np.load(os.path.join(chunk, f"{column}.npy"), mmap_mode="r")
+
+    def scan(
+        self,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        columns: Optional[Sequence[str]] = None,
+        by: str = "ts_recorded",
+    ) -> Iterator[dict[str, np.ndarray]]:
+        """yields the rows with start <= by < end (ns) chunk by chunk, as read-only views"""
+        columns = columns or self.columns
+        for chunk in self.chunks:
+            ts = self._column(chunk, by)
+            if not len(ts):
+                continue
+            if (start is not None and ts[-1] < start) or (
+                end is not None and ts[0] >= end
+            ):
+                continue
+            lo = 0 if start is None else int(np.searchsorted(ts, start, "left"))
+            hi = len(ts) if end is None else int(np.searchsorted(ts, end, "left"))
+            if lo < hi:
+                yield {c: self._column(chunk, c)[lo:hi] for c in columns}
+
+    def read(
+        self,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        columns: Optional[Sequence[str]] = None,
+        by: str = "ts_recorded",
+    ) -> dict[str, np.ndarray]:
+        """returns the rows with start <= by < end (ns) as arrays (copied)"""
+        columns = columns or self.columns
+        parts = list(self.scan(start, end, columns, by))
+        if not parts:
+            return {c: np.empty(0, BOOK_COLUMNS[c]) for c in columns}
+        return {c: np.concatenate([p[c] for p in parts]) for c in columns}
@@ -0,0 +1,100 @@
+import json
+
+from typing import Any, Callable, Optional, Union
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+Frame = Union[str, bytes]
+Decoder = Callable[[Frame], Any]
+
+
+def available_decoders() -> list[str]:
+    """returns the names of the installed json decoders, fastest first"""
+    names = []
+    if msgspec is not None:
+        names.append("msgspec")
+    if orjson is not None:
+        names.append("orjson")
+    names.append("json")
+    return names
+
+
+def get_decoder(name: Optional[str] = None) -> Decoder:
+    """returns a json decoder by name (defaults to the fastest one installed)"""
+    name = name or available_decoders()[0]
+    if name == "msgspec" and msgspec is not None:
+        return msgspec.json.Decoder().decode
+    if name == "orjson" and orjson is not None:
+        return orjson.loads
+    if name == "json":
+        return json.loads
+    raise ValueError(f"decoder {name} not available")
+
+
+""" ==================== Typed Schemas ==================== """
+
+
+if msgspec is not None:
+
+    class BinanceDepthUpdate(msgspec.Struct, tag_field="e", tag="depthUpdate"):
+        E: int
+        s: str
+        U: int
+        u: int
+        b: list[tuple[str, str]]
+        a: list[tuple[str, str]]
+
+    class BinanceAggTrade(msgspec.Struct, tag_field="e", tag="aggTrade"):
+        s: str
+        p: str
+        q: str
+        T: int
+        m: bool
+
+    BinanceMsg = Union[BinanceDepthUpdate, BinanceAggTrade]
+
+    class BinanceStreamMsg(msgspec.Struct):
+        """frame of the combined stream endpoint"""
+
+        stream: str
+        data: BinanceMsg
+
+
+def get_binance_decoder(name: Optional[str] = None) -> Decoder:
+    """
+    returns a decoder for binance combined stream frames. with msgspec,
+    depthUpdate and aggTrade frames are decoded into typed structs (only the
+    fields the parsers read, as attributes) and other frames fall back to
+    untyped decoding (dicts).
+    """
+    name = name or available_decoders()[0]
+    if name != "msgspec" or msgspec is None:
+        return get_decoder(name)
+
+    typed = msgspec.json.Decoder(BinanceStreamMsg)
+    untyped = msgspec.json.Decoder()
+
+    def decode(frame: Frame) -> Any:
+        try:
+            return typed.decode(frame)
+        except msgspec.ValidationError:
+            return untyped.decode(frame)
+
+    return decode
+
+
+def get_kraken_decoder(name: Optional[str] = None) -> Decoder:
+    """
+    returns a decoder for kraken frames. kraken book and trade messages are
+    positional arrays whose length depends on the content, so they are
+    decoded untyped.
+    """
+    return get_decoder(name)
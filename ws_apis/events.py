@@ -1,12 +1,14 @@
+from array import array
 from dataclasses import dataclass
 from enum import Enum
-from typing import Optional, Any
+from typing import Iterable, Iterator, Optional, Any, Union
 
 
 # TODO: move StreamType to __init__.py
 class StreamType(Enum):
     TRADES = "trades"
     BOOK = "book"
+    BBO = "bbo"  # best bid/offer, derived from the book stream (see bbo.py)
 
 
 # TODO: move ExchangeType to __init__.py
@@ -27,40 +29,174 @@ class OBEventType(Enum):
     UPDATE = "update"
 
 
+class StatusEventType(Enum):
+    RECONNECTED = "reconnected"  # connection was reopened and resubscribed
+    RESYNC = "resync"  # orderbook is resynced, a new snapshot follows
+
+
 class TradeSide(Enum):
     BUY = "buy"
     SELL = "sell"
 
 
-@dataclass
+class LevelsFormat(Enum):
+    OBJECTS = "objects"  # list of Level
+    COLUMNS = "columns"  # LevelColumns
+    LAZY = "lazy"  # LazyLevels
+
+
+@dataclass(slots=True)
 class Level:
-    price: float
+    price: float  # scaled int in fixed-point mode (see utils.FixedPointScale)
     qty: float
 
 
-@dataclass
+class LevelColumns:
+    """
+    Levels stored as parallel price and qty arrays (array('d'), or array('q')
+    in fixed-point mode). Iterating or indexing yields Level objects, so
+    LevelColumns can stand in for list[Level].
+    """
+
+    __slots__ = ("prices", "qtys")
+
+    def __init__(self, prices: array, qtys: array):
+        self.prices = prices
+        self.qtys = qtys
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def __iter__(self) -> Iterator[Level]:
+        return map(Level, self.prices, self.qtys)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return LevelColumns(self.prices[idx], self.qtys[idx])
+        return Level(self.prices[idx], self.qtys[idx])
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, LevelColumns):
+            return self.prices == other.prices and self.qtys == other.qtys
+        return list(self) == other
+
+    def __repr__(self) -> str:
+        return f"LevelColumns(prices={self.prices!r}, qtys={self.qtys!r})"
+
+
+class LazyLevels:
+    """
+    Raw [price, qty, ...] string levels as decoded from the exchange message.
+    They are only converted to numbers when accessed: pairs() converts them
+    in one batch without creating Level objects, iterating or indexing
+    creates Level objects from those pairs. Both are converted once and
+    cached, so raw must not be modified. scale is an optional FixedPointScale.
+    """
+
+    __slots__ = ("raw", "scale", "_pairs", "_levels")
+
+    def __init__(self, raw: list, scale: Optional[Any] = None):
+        self.raw = raw
+        self.scale = scale
+        self._pairs: Optional[list[tuple[float, float]]] = None
+        self._levels: Optional[list[Level]] = None
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def __iter__(self) -> Iterator[Level]:
+        return iter(self.levels)
+
+    def __getitem__(self, idx):
+        return self.levels[idx]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, LazyLevels):
+            return self.levels == other.levels
+        return self.levels == other
+
+    def __repr__(self) -> str:
+        return f"LazyLevels(raw={self.raw!r})"
+
+    @property
+    def levels(self) -> list[Level]:
+        """the converted levels"""
+        if self._levels is None:
+            self._levels = [Level(p, q) for p, q in self.pairs()]
+        return self._levels
+
+    def pairs(self) -> list[tuple[float, float]]:
+        """the raw levels converted to (price, qty) pairs (on the first call)"""
+        if self._pairs is None:
+            if self.scale is not None:
+                price, qty = self.scale.price, self.scale.qty
+                self._pairs = [(price(l[0]), qty(l[1])) for l in self.raw]
+            else:
+                self._pairs = [(float(l[0]), float(l[1])) for l in self.raw]
+        return self._pairs
+
+
+Levels = Union[list[Level], LevelColumns, LazyLevels]
+
+
+def level_pairs(levels: Levels) -> Iterable[tuple[float, float]]:
+    """iterates (price, qty) pairs without creating Level objects where possible"""
+    if isinstance(levels, LevelColumns):
+        return zip(levels.prices, levels.qtys)
+    if isinstance(levels, LazyLevels):
+        return levels.pairs()
+    return ((l.price, l.qty) for l in levels)
+
+
+@dataclass(slots=True)
 class OrderbookEvent:
     exch_name: str
     symbol: str
     type: OBEventType
-    bids: list[Level]
-    asks: list[Level]
+    bids: Levels
+    asks: Levels
     ts_exchange: int  # timestamp from exchange (in nanoseconds)
     ts_recorded: int  # timestamp when event was recorded (in nanoseconds)
     other: Optional[Any] = None
+    stamps: Optional[Any] = None  # latency.StageStamps when stamping is enabled
 
 
-@dataclass
+@dataclass(slots=True)
 class Trade:
-    price: float
+    price: float  # scaled int in fixed-point mode (see utils.FixedPointScale)
     qty: float
     side: TradeSide
 
 
-@dataclass
+@dataclass(slots=True)
 class TradeEvent:
     exch_name: str
     symbol: str
     ts_exchange: int
     ts_recorded: int
     trades: list[Trade]
+    stamps: Optional[Any] = None  # latency.StageStamps when stamping is enabled
+
+
+@dataclass(slots=True)
+class StatusEvent:
+    exch_name: str
+    symbol: str
+    type: StatusEventType
+    ts_recorded: int
+    other: Optional[Any] = None
+
+
+@dataclass(slots=True)
+class BboEvent:
+    """best bid and ask of a book (price and qty are 0 while a side is empty)"""
+
+    exch_name: str
+    symbol: str
+    bid_price: float
+    bid_qty: float
+    ask_price: float
+    ask_qty: float
+    ts_exchange: int
+    ts_recorded: int
+    stamps: Optional[Any] = None  # of the book event it was derived from
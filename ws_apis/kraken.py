@@ -1,14 +1,15 @@
-import asyncio
 import json
 import logging
 import time
 
 from typing import Any, Optional, Union
 
+from .decoders import get_kraken_decoder
 from .events import WsEventType, StreamType
-from .events import OrderbookEvent, OBEventType, Level
-from .events import TradeEvent, Trade, TradeSide
-from .utils import SymbolsMeta
+from .events import OrderbookEvent, OBEventType, Level, LevelsFormat
+from .events import TradeEvent, Trade, TradeSide, StatusEvent
+from .latency import Stage
+from .utils import parse_levels, SymbolsMeta, FixedPointScale
 from .websocket import Websocket
 
 
@@ -25,22 +26,35 @@ def parse_event_type_kraken(data: Union[list, dict]) -> WsEventType:
     return WsEventType.OTHER
 
 
-def parse_level_kraken(levels: list[str]) -> Level:
+def parse_level_kraken(
+    levels: list[str], scale: Optional[FixedPointScale] = None
+) -> Level:
     """parse a level from the kraken websocket message"""
+    if scale is not None:
+        return Level(price=scale.price(levels[0]), qty=scale.qty(levels[1]))
     return Level(price=float(levels[0]), qty=float(levels[1]))
 
 
-def parse_book_msg_kraken(exch_name: str, symbol: str, data: list) -> OrderbookEvent:
+def parse_book_msg_kraken(
+    exch_name: str,
+    symbol: str,
+    data: list,
+    scale: Optional[FixedPointScale] = None,
+    fmt: LevelsFormat = LevelsFormat.OBJECTS,
+) -> OrderbookEvent:
     """parse a book message from the kraken websocket message and return an OrderbookEvent"""
+    # updates of both sides may arrive as two separate objects
+    book = data[1] if len(data) == 4 else {**data[1], **data[2]}
+
     akey, bkey, event_type = "a", "b", OBEventType.UPDATE
-    if data[1].get("as") or data[1].get("bs"):
+    if book.get("as") or book.get("bs"):
         akey, bkey, event_type = "as", "bs", OBEventType.SNAPSHOT
 
-    asks = [parse_level_kraken(a) for a in data[1].get(akey, [])]
-    bids = [parse_level_kraken(b) for b in data[1].get(bkey, [])]
+    asks = parse_levels(book.get(akey, []), parse_level_kraken, scale, fmt)
+    bids = parse_levels(book.get(bkey, []), parse_level_kraken, scale, fmt)
 
-    ask_timestamps = [float(x[2]) for x in data[1].get(akey, [])]
-    bid_timestamps = [float(x[2]) for x in data[1].get(bkey, [])]
+    ask_timestamps = [float(x[2]) for x in book.get(akey, [])]
+    bid_timestamps = [float(x[2]) for x in book.get(bkey, [])]
     if not ask_timestamps and not bid_timestamps:
         raise ValueError("no timestamps found in orderbook levels")
     ts_exchange = int(max(ask_timestamps + bid_timestamps) * 1e9)
@@ -52,22 +66,25 @@ def parse_book_msg_kraken(exch_name: str, symbol: str, data: list) -> OrderbookE
         bids=bids,
         asks=asks,
         ts_exchange=ts_exchange,
-        ts_recorded=int(time.time() * 1e9),
+        ts_recorded=time.time_ns(),
     )
 
 
-def parse_trade_kraken(trade: list[Any]) -> Trade:
+def parse_trade_kraken(
+    trade: list[Any], scale: Optional[FixedPointScale] = None
+) -> Trade:
     """parses a trade from the kraken websocket message"""
-    return Trade(
-        price=float(trade[0]),
-        qty=float(trade[1]),
-        side=TradeSide.SELL if trade[3] == "s" else TradeSide.BUY,
-    )
+    side = TradeSide.SELL if trade[3] == "s" else TradeSide.BUY
+    if scale is not None:
+        return Trade(price=scale.price(trade[0]), qty=scale.qty(trade[1]), side=side)
+    return Trade(price=float(trade[0]), qty=float(trade[1]), side=side)
 
 
-def parse_trade_msg_kraken(exch_name: str, symbol: str, data: list) -> TradeEvent:
+def parse_trade_msg_kraken(
+    exch_name: str, symbol: str, data: list, scale: Optional[FixedPointScale] = None
+) -> TradeEvent:
     """parses a trade message from the kraken websocket message and returns a TradeEvent"""
-    trades = [parse_trade_kraken(trade) for trade in data[1]]
+    trades = [parse_trade_kraken(trade, scale) for trade in data[1]]
     ts_exchange = max([int(float(trade[2]) * 1e9) for trade in data[1]])
 
     return TradeEvent(
@@ -75,7 +92,7 @@ def parse_trade_msg_kraken(exch_name: str, symbol: str, data: list) -> TradeEven
         symbol=symbol,
         trades=trades,
         ts_exchange=ts_exchange,
-        ts_recorded=int(time.time() * 1e9),
+        ts_recorded=time.time_ns(),
     )
 
 
@@ -98,17 +115,49 @@ def prepare_trades_subscription_msg_kraken(symbols: list[str]) -> str:
 
 
 class KrakenWebsocket(Websocket):
+    """
+    Kraken Websocket returns WsEvents rather than raw messages
+
+    Several symbols can share one connection: they are subscribed with a
+    single multi-pair subscription and frames are demuxed by pair.
+
+    With fixed_point=True prices and quantities are parsed to scaled ints
+    (see utils.FixedPointScale) instead of floats. levels_format selects
+    how orderbook levels are stored (list of Level, LevelColumns, or
+    LazyLevels that defer number conversion until they are accessed).
+    """
+
     _name = "kraken"
     _symbolsMeta: SymbolsMeta = SymbolsMeta()
     _ws_url: str = "wss://ws.kraken.com"
-
-    def __init__(self, streamType: StreamType, symbol: str, depth: Optional[int]):
-        subscription_msg = self._prepare_subscription_msg(streamType, symbol, depth)
+    _decode = staticmethod(get_kraken_decoder())
+    _max_streams = 100  # max number of pairs per connection
+    # the book channel refills the levels of its depth itself
+    _bbo_depth = 10
+    _bounded_book = True
+
+    def __init__(
+        self,
+        streamType: StreamType,
+        symbol: Union[str, list[str]],
+        depth: Optional[int],
+        fixed_point: bool = False,
+        levels_format: LevelsFormat = LevelsFormat.OBJECTS,
+    ):
+        symbols = [symbol] if isinstance(symbol, str) else list(symbol)
+        if len(symbols) > self._max_streams:
+            raise ValueError(f"too many streams for one connection {symbols}")
+
+        subscription_msg = self._prepare_subscription_msg(streamType, symbols, depth)
         print(subscription_msg)
         super().__init__(self._ws_url, subscription_msg)
 
-        self.symbol = symbol
+        self.symbols = symbols
+
+        self.depth = depth
         self.streamType = streamType
+        self.fixed_point = fixed_point
+        self.levels_format = levels_format
 
         self._logger = logging.getLogger(__name__)
 
@@ -118,45 +167,49 @@ class KrakenWebsocket(Websocket):
 
     async def _listen(self):
         """listens for messages from the websocket, parses them and puts them in the queue"""
-        assert self._conn is not None
-        msg = await self._conn.recv()
-        data = json.loads(msg)
+        msg = await self._recv_frame()
+        stamps = self._start_stamps()
+        data = self._decode(msg)
+        if stamps is not None:
+            stamps.mark(Stage.DECODED)
 
         event_type = parse_event_type_kraken(data)
         if event_type == WsEventType.BOOK:
-            await self._queue.put(self._parse_book_msg(data))
+            await self._queue_event(self._parse_book_msg(data), stamps)
         elif event_type == WsEventType.TRADE:
-            await self._queue.put(self._parse_trade_msg(data))
+            await self._queue_event(self._parse_trade_msg(data), stamps)
         elif event_type == WsEventType.HEARTBEAT:
             pass
         else:
             self._logger.info(f"received other event {event_type}")
 
-    async def recv(self) -> Union[OrderbookEvent, TradeEvent]:
+    async def recv(self) -> Union[OrderbookEvent, TradeEvent, StatusEvent]:
         """receives a message from the websocket and returns it"""
-        while True:
-            try:
-                return await asyncio.wait_for(self._queue.get(), timeout=self._timeout)
-            except asyncio.TimeoutError:
-                self._logger.info("timeout in recv")
+        return await self._next_event()
+
+    def _get_scale(self, symbol: str) -> Optional[FixedPointScale]:
+        if not self.fixed_point:
+            return None
+        return self._symbolsMeta.fixed_point_scale(self._name, symbol)
 
     def _parse_book_msg(self, data: list) -> OrderbookEvent:
         symbol = self._symbolsMeta.ws_sym2sym(self._name, data[-1])
-        return parse_book_msg_kraken(self._name, symbol, data)
+        scale, fmt = self._get_scale(symbol), self.levels_format
+        return parse_book_msg_kraken(self._name, symbol, data, scale, fmt)
 
     def _parse_trade_msg(self, data: list) -> TradeEvent:
         symbol = self._symbolsMeta.ws_sym2sym(self._name, data[-1])
-        return parse_trade_msg_kraken(self._name, symbol, data)
+        return parse_trade_msg_kraken(self._name, symbol, data, self._get_scale(symbol))
 
     def _prepare_subscription_msg(
-        self, streamType: StreamType, symbol: str, depth: Optional[int] = None
+        self, streamType: StreamType, symbols: list[str], depth: Optional[int] = None
     ) -> str:
-        """returns the subscription message for the given symbol and streamType"""
-        ws_symbol = self._symbolsMeta.sym2ws_sym(self._name, symbol)
+        """returns the subscription message for the given symbols and streamType"""
+        ws_symbols = [self._symbolsMeta.sym2ws_sym(self._name, s) for s in symbols]
 
         if streamType == StreamType.BOOK:
             assert depth is not None
-            return prepare_book_subscription_msg_kraken([ws_symbol], depth)
+            return prepare_book_subscription_msg_kraken(ws_symbols, depth)
         if streamType == StreamType.TRADES:
-            return prepare_trades_subscription_msg_kraken([ws_symbol])
+            return prepare_trades_subscription_msg_kraken(ws_symbols)
         raise ValueError(f"invalid streamType: {streamType}")
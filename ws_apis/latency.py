@@ -0,0 +1,213 @@
+import time
+
+from enum import IntEnum
+from typing import Any, Iterable, Optional
+from .events import BboEvent, TradeEvent
+
+
+class Stage(IntEnum):
+    RECEIVED = 0  # frame received from the connection
+    DECODED = 1  # frame decoded to a dict
+    PARSED = 2  # event parsed (and about to be queued)
+    ENQUEUED = 3  # event on the queue (after waiting for space)
+    DEQUEUED = 4  # event handed to the consumer
+    APPLIED = 5  # event applied to the book (Orderbook.update)
+
+
+# latencies reported per stream, between two stages
+SEGMENTS = {
+    "decode": (Stage.RECEIVED, Stage.DECODED),
+    "parse": (Stage.DECODED, Stage.PARSED),
+    "enqueue": (Stage.PARSED, Stage.ENQUEUED),
+    "queue": (Stage.ENQUEUED, Stage.DEQUEUED),
+    "apply": (Stage.DEQUEUED, Stage.APPLIED),
+    "wire_to_book": (Stage.RECEIVED, Stage.APPLIED),
+}
+
+
+class StageStamps:
+    """
+    Monotonic time (perf_counter_ns) of each stage an event went through, and
+    the wall time (time_ns) its frame was received at, to compare with the
+    exchange timestamp.
+    """
+
+    __slots__ = ("received_wall", "ns")
+
+    def __init__(self):
+        self.received_wall = time.time_ns()
+        self.ns = [time.perf_counter_ns(), 0, 0, 0, 0, 0]
+
+    def mark(self, stage: Stage):
+        self.ns[stage] = time.perf_counter_ns()
+
+    def elapsed(self, start: Stage, end: Stage) -> Optional[int]:
+        """ns between two stages, None if one of them wasn't stamped"""
+        t0, t1 = self.ns[start], self.ns[end]
+        if not t0 or not t1:
+            return None
+        return t1 - t0
+
+
+def mark_all(events: Iterable[Any], stage: Stage):
+    """stamps the events that carry stamps"""
+    t = time.perf_counter_ns()
+    for event in events:
+        stamps = getattr(event, "stamps", None)
+        if stamps is not None:
+            stamps.ns[stage] = t
+
+
+class LatencyHistogram:
+    """
+    Streaming log-linear histogram of latencies in ns (HdrHistogram style):
+    values below 2**sub_bits are counted exactly, larger values in buckets
+    of 1/2**(sub_bits - 1) of their power of two, so percentiles are within
+    that relative error. Recording is O(1) and memory is fixed.
+    """
+
+    def __init__(self, sub_bits: int = 7, max_bits: int = 44):
+        self.sub_bits = sub_bits
+        self._sub = 1 << sub_bits
+        self._half = self._sub >> 1
+        self.counts = [0] * ((max_bits - sub_bits + 1) * self._half + self._sub)
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        if value < self._sub:
+            return value
+        shift = value.bit_length() - self.sub_bits
+        return (shift * self._half) + (value >> shift)
+
+    def _value(self, index: int) -> int:
+        """lowest value of a bucket"""
+        if index < self._sub:
+            return index
+        shift = index // self._half - 1
+        return (index - shift * self._half) << shift
+
+    def record(self, value: int):
+        value = max(value, 0)
+        index = min(self._index(value), len(self.counts) - 1)
+        self.counts[index] += 1
+        if not self.count or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+
+    def percentile(self, q: float) -> int:
+        """value at percentile q (0-100)"""
+        if not self.count:
+            return 0
+        rank = max(int(q / 100 * self.count + 0.5), 1)
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self._value(index), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def merge(self, other: "LatencyHistogram"):
+        assert other.sub_bits == self.sub_bits and len(other.counts) == len(self.counts)
+        for i, n in enumerate(other.counts):
+            if n:
+                self.counts[i] += n
+        if other.count and (not self.count or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.count = self.total = self.min = self.max = 0
+
+    def summary(self) -> dict[str, float]:
+        """count and mean, p50, p99, p999 and max in us"""
+        return {
+            "count": self.count,
+            "mean_us": self.mean / 1e3,
+            "p50_us": self.percentile(50) / 1e3,
+            "p99_us": self.percentile(99) / 1e3,
+            "p999_us": self.percentile(99.9) / 1e3,
+            "max_us": self.max / 1e3,
+        }
+
+
+def _stream(event: Any) -> str:
+    if isinstance(event, TradeEvent):
+        return "trades"
+    return "bbo" if isinstance(event, BboEvent) else "book"
+
+
+class LatencyTracker:
+    """
+    Latency histograms per (exchange, symbol, stream) and segment (see
+    SEGMENTS), fed from the stamps of the events (see StageStamps).
+
+    exchange_to_wire is the receive wall time minus the exchange timestamp
+    (it includes the clock offset to the exchange), the other segments are
+    measured on the monotonic clock.
+
+    record(event) is called once the consumer is done with an event: it
+    stamps APPLIED unless the book already did.
+    """
+
+    def __init__(self, sub_bits: int = 7):
+        self.sub_bits = sub_bits
+        self.histograms: dict[tuple[str, str, str], dict[str, LatencyHistogram]] = {}
+
+    def _histograms(self, key: tuple[str, str, str]) -> dict[str, LatencyHistogram]:
+        histograms = self.histograms.get(key)
+        if histograms is None:
+            names = ["exchange_to_wire", *SEGMENTS]
+            histograms = {n: LatencyHistogram(self.sub_bits) for n in names}
+            self.histograms[key] = histograms
+        return histograms
+
+    def record(self, event: Any):
+        stamps = getattr(event, "stamps", None)
+        if stamps is None:
+            return
+        if not stamps.ns[Stage.APPLIED]:
+            stamps.mark(Stage.APPLIED)
+
+        histograms = self._histograms((event.exch_name, event.symbol, _stream(event)))
+        histograms["exchange_to_wire"].record(stamps.received_wall - event.ts_exchange)
+        for name, (start, end) in SEGMENTS.items():
+            elapsed = stamps.elapsed(start, end)
+            if elapsed is not None:
+                histograms[name].record(elapsed)
+
+    def report(self) -> dict[tuple[str, str, str], dict[str, dict[str, float]]]:
+        return {
+            key: {name: h.summary() for name, h in histograms.items() if h.count}
+            for key, histograms in self.histograms.items()
+        }
+
+    def format(self) -> str:
+        lines = [
+            f"{'exchange':10s} {'symbol':10s} {'stream':7s} {'segment':18s} "
+            f"{'count':>8s} {'p50 (us)':>10s} {'p99 (us)':>10s} {'p999 (us)':>10s}"
+        ]
+        for (exch, symbol, stream), segments in self.report().items():
+            for name, s in segments.items():
+                lines.append(
+                    f"{exch:10s} {symbol:10s} {stream:7s} {name:18s} {s['count']:8d} "
+                    f"{s['p50_us']:10.1f} {s['p99_us']:10.1f} {s['p999_us']:10.1f}"
+                )
+        return "\n".join(lines)
+
+    def reset(self):
+        for histograms in self.histograms.values():
+            for h in histograms.values():
+                h.reset()
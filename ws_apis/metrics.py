@@ -0,0 +1,128 @@
+import logging
+import time
+
+from aiohttp import web
+from typing import Callable, Iterable, NamedTuple, Optional
+
+
+class Sample(NamedTuple):
+    name: str  # counters end with _total, everything else is a gauge
+    labels: dict[str, str]
+    value: float
+
+
+class StreamStats:
+    """counters of the events of one symbol of a connection"""
+
+    __slots__ = ("n_messages", "n_bytes", "lag_ns")
+
+    def __init__(self):
+        self.n_messages = 0
+        self.n_bytes = 0
+        self.lag_ns = 0  # ts_recorded - ts_exchange of the last event
+
+    def add(self, n_bytes: int, lag_ns: int):
+        self.n_messages += 1
+        self.n_bytes += n_bytes
+        self.lag_ns = lag_ns
+
+    def metrics(self, labels: dict[str, str]) -> list[Sample]:
+        return [
+            Sample("stream_messages_total", labels, self.n_messages),
+            Sample("stream_bytes_total", labels, self.n_bytes),
+            Sample("stream_lag_seconds", labels, self.lag_ns / 1e9),
+        ]
+
+
+def _key(sample: Sample) -> tuple:
+    return (sample.name, tuple(sorted(sample.labels.items())))
+
+
+class RateMeter:
+    """
+    Per-second rates of the counters between two pulls: rates(samples)
+    returns a {name}_per_second gauge for each _total counter (0 on the
+    first pull). Each pull resets the baseline, so every consumer needs its
+    own meter (prometheus computes rates from the counters with rate()).
+    """
+
+    def __init__(self):
+        self._last: dict[tuple, float] = {}
+        self._last_time: Optional[float] = None
+
+    def rates(self, samples: Iterable[Sample]) -> list[Sample]:
+        now = time.monotonic()
+        elapsed = now - self._last_time if self._last_time is not None else 0.0
+        self._last_time = now
+
+        rates, last = [], {}
+        for sample in samples:
+            if not sample.name.endswith("_total"):
+                continue
+            key = _key(sample)
+            last[key] = sample.value
+            delta = sample.value - self._last.get(key, sample.value)
+            name = sample.name[: -len("_total")] + "_per_second"
+            rates.append(Sample(name, sample.labels, delta / elapsed if elapsed else 0))
+        self._last = last
+        return rates
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_prometheus(samples: Iterable[Sample], prefix: str = "ws_apis_") -> str:
+    """samples in the prometheus text exposition format"""
+    by_name: dict[str, list[Sample]] = {}
+    for sample in samples:
+        by_name.setdefault(sample.name, []).append(sample)
+
+    lines = []
+    for name, group in by_name.items():
+        kind = "counter" if name.endswith("_total") else "gauge"
+        lines.append(f"# TYPE {prefix}{name} {kind}")
+        for sample in group:
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in sample.labels.items())
+            labels = f"{{{labels}}}" if labels else ""
+            lines.append(f"{prefix}{name}{labels} {sample.value}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    Local http endpoint serving the samples of collect (called on each
+    scrape) in the prometheus text format at path.
+    """
+
+    def __init__(
+        self,
+        collect: Callable[[], Iterable[Sample]],
+        host: str = "localhost",
+        port: int = 9100,
+        path: str = "/metrics",
+    ):
+        self.collect = collect
+        self.host = host
+        self.port = port
+        self.path = path
+
+        self._logger = logging.getLogger(__name__)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        body = format_prometheus(self.collect())
+        return web.Response(text=body, content_type="text/plain", charset="utf-8")
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get(self.path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._logger.info(f"serving metrics on {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
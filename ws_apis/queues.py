@@ -0,0 +1,190 @@
+import asyncio
+
+from array import array
+from enum import Enum
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from .events import OrderbookEvent, OBEventType, TradeEvent, StatusEvent, BboEvent
+from .events import Level, LevelColumns, Levels, level_pairs
+
+
+class OverflowPolicy(Enum):
+    BLOCK = "block"  # put waits until there is space
+    DROP_OLDEST = "drop_oldest"  # the oldest queued item is dropped
+    DROP_NEWEST = "drop_newest"  # the new item is dropped
+    CONFLATE = "conflate"  # merge into a queued event of the same stream
+
+
+def _merge_levels(first: Levels, second: Levels) -> Levels:
+    """merges two sets of level updates, the second one wins on equal prices"""
+    merged = dict(level_pairs(first))
+    merged.update(level_pairs(second))
+    if isinstance(first, LevelColumns):
+        prices = array(first.prices.typecode, merged.keys())
+        return LevelColumns(prices, array(first.qtys.typecode, merged.values()))
+    return [Level(p, q) for p, q in merged.items()]
+
+
+def conflate_book_events(first: OrderbookEvent, second: OrderbookEvent):
+    """merges the update second into the (older) update first, in place"""
+    first.bids = _merge_levels(first.bids, second.bids)
+    first.asks = _merge_levels(first.asks, second.asks)
+    first.ts_exchange = second.ts_exchange
+    first.ts_recorded = second.ts_recorded
+
+    # the merged event spans the update ids of both (binance)
+    if isinstance(first.other, dict) and isinstance(second.other, dict):
+        first.other = {**second.other, **first.other}
+        if "last_update_id" in second.other:
+            first.other["last_update_id"] = second.other["last_update_id"]
+
+
+def conflate_trade_events(first: TradeEvent, second: TradeEvent):
+    """appends the trades of second to the (older) event first, in place"""
+    first.trades.extend(second.trades)
+    first.ts_exchange = max(first.ts_exchange, second.ts_exchange)
+    first.ts_recorded = second.ts_recorded
+
+
+def _conflation_key(item: Any) -> Optional[Hashable]:
+    """key of the stream an item can be conflated with (None if it can't)"""
+    if isinstance(item, OrderbookEvent) and item.type == OBEventType.UPDATE:
+        return ("book", item.exch_name, item.symbol)
+    if isinstance(item, TradeEvent):
+        return ("trades", item.exch_name, item.symbol)
+    if isinstance(item, BboEvent):
+        return ("bbo", item.exch_name, item.symbol)
+    return None
+
+
+class EventQueue(asyncio.Queue):
+    """
+    asyncio.Queue with a policy for what happens when it is full.
+
+    With CONFLATE, an orderbook update is merged into the update of the same
+    symbol that is still waiting in the queue (trades into the queued
+    TradeEvent, a BboEvent replaces the queued one), whether or not the
+    queue is full. Consumers that fall
+    behind get one aggregated event per stream instead of the backlog. If
+    nothing can be merged and the queue is full, put waits like BLOCK.
+
+    The drop policies lose events, which leaves an orderbook built from the
+    dropped deltas out of sync.
+    """
+
+    def __init__(self, maxsize: int = 0, policy: OverflowPolicy = OverflowPolicy.BLOCK):
+        super().__init__(maxsize)
+        self.policy = policy
+        self.n_dropped = 0
+        self.n_conflated = 0
+
+        # events still in the queue that later events can be merged into
+        self._pending: dict[Hashable, Any] = {}
+
+    def _get(self):
+        item = super()._get()
+        if self._pending:
+            key = _conflation_key(item)
+            if key is not None and self._pending.get(key) is item:
+                del self._pending[key]
+        return item
+
+    def _put(self, item):
+        super()._put(item)
+        if self.policy != OverflowPolicy.CONFLATE:
+            return
+
+        key = _conflation_key(item)
+        if key is not None:
+            self._pending[key] = item
+        elif isinstance(item, (OrderbookEvent, StatusEvent)):
+            # later updates must not be merged into events before a snapshot
+            self._pending.pop(("book", item.exch_name, item.symbol), None)
+
+    def _conflate(self, item) -> bool:
+        """merges item into a queued event, returns False if there is none"""
+        key = _conflation_key(item)
+        queued = self._pending.get(key) if key is not None else None
+        if queued is None:
+            return False
+
+        if isinstance(item, TradeEvent):
+            conflate_trade_events(queued, item)
+        elif isinstance(item, BboEvent):
+            for field in BboEvent.__slots__:
+                setattr(queued, field, getattr(item, field))  # the latest wins
+        else:
+            conflate_book_events(queued, item)
+        self.n_conflated += 1
+        return True
+
+    def _drop_oldest(self):
+        self._get()
+        self.task_done()
+        self.n_dropped += 1
+
+    def put_nowait(self, item):
+        if self.policy == OverflowPolicy.CONFLATE and self._conflate(item):
+            return
+
+        if self.full():
+            if self.policy == OverflowPolicy.DROP_NEWEST:
+                self.n_dropped += 1
+                return
+            if self.policy == OverflowPolicy.DROP_OLDEST:
+                self._drop_oldest()
+
+        super().put_nowait(item)
+
+    async def put(self, item):
+        if self.policy == OverflowPolicy.CONFLATE and self._conflate(item):
+            return
+        if self.policy in (OverflowPolicy.BLOCK, OverflowPolicy.CONFLATE):
+            return await super().put(item)
+        return self.put_nowait(item)
+
+
+class IdleTimer:
+    """
+    Calls on_idle for every timeout seconds a consumer waits in wait(). A
+    single timer handle re-arms itself, so waiting does not need a timer
+    per get (like asyncio.wait_for).
+    """
+
+    def __init__(self, timeout: float, on_idle: Callable[[], None]):
+        self.timeout = timeout
+        self.on_idle = on_idle
+        self.waiting = False
+        self._since = 0.0
+        self._handle: Optional[asyncio.TimerHandle] = None
+
+    def _arm(self):
+        loop = asyncio.get_running_loop()
+        self._handle = loop.call_at(self._since + self.timeout, self._fire)
+
+    def _fire(self):
+        self._handle = None
+        if not self.waiting:
+            return  # re-armed by the next wait
+
+        loop = asyncio.get_running_loop()
+        if loop.time() - self._since >= self.timeout:
+            self.on_idle()
+            self._since = loop.time()
+        self._arm()
+
+    async def wait(self, aw: Awaitable[Any]) -> Any:
+        """awaits aw while watching for idle timeouts"""
+        self._since = asyncio.get_running_loop().time()
+        self.waiting = True
+        if self._handle is None:
+            self._arm()
+        try:
+            return await aw
+        finally:
+            self.waiting = False
+
+    def cancel(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
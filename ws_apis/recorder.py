@@ -0,0 +1,215 @@
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+from enum import IntEnum
+from typing import Iterator, NamedTuple, Optional, Union
+
+_MAGIC = b"WSREC1\n"
+_BLOCK = struct.Struct("<II")  # compressed size, raw size
+_RECORD = struct.Struct("<qIBI")  # ts (ns), conn_id, kind, payload size
+_STOP = object()
+
+
+class RecordKind(IntEnum):
+    # payloads (multiple parts are separated by a newline):
+    CONNECT = 0  # ws url, subscription message
+    FRAME = 1  # websocket frame
+    REST = 2  # request url (with query), response body
+
+
+class Record(NamedTuple):
+    ts: int  # receive time (time.time_ns)
+    conn_id: int
+    kind: RecordKind
+    payload: bytes
+
+
+def _pack_records(records: list[tuple[int, int, int, bytes]]) -> bytes:
+    buf = bytearray()
+    for ts, conn_id, kind, payload in records:
+        buf += _RECORD.pack(ts, conn_id, kind, len(payload))
+        buf += payload
+    return bytes(buf)
+
+
+def iter_block_records(block: bytes) -> Iterator[Record]:
+    """yields the records of an uncompressed block"""
+    view, pos = memoryview(block), 0
+    while pos < len(block):
+        ts, conn_id, kind, size = _RECORD.unpack_from(view, pos)
+        pos += _RECORD.size
+        yield Record(ts, conn_id, RecordKind(kind), bytes(view[pos : pos + size]))
+        pos += size
+
+
+def read_records(path: str) -> Iterator[Record]:
+    """yields the records of a recording file, a truncated last block is skipped"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size <= len(_MAGIC):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[: len(_MAGIC)] != _MAGIC:
+                raise ValueError(f"{path} is not a recording")
+
+            pos = len(_MAGIC)
+            while pos + _BLOCK.size <= len(mm):
+                size, raw_size = _BLOCK.unpack_from(mm, pos)
+                pos += _BLOCK.size
+                if pos + size > len(mm):
+                    break  # still being written
+                block = zlib.decompress(mm[pos : pos + size], bufsize=raw_size)
+                pos += size
+                yield from iter_block_records(block)
+
+
+class FrameRecorder:
+    """
+    Records raw websocket frames and REST responses with their receive time
+    and connection id to append-only files in directory.
+
+    record() only puts the frame on a queue; a writer thread batches the
+    records into zlib-compressed blocks (written when block_size bytes are
+    buffered or the oldest buffered record is flush_interval seconds old)
+    and rotates files after max_file_size bytes or max_file_age seconds.
+
+    Files are named {prefix}-{start time}-{n}.wsrec (n is bumped past the
+    files that already exist) and read with read_records.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        prefix: str = "capture",
+        block_size: int = 1 << 20,
+        flush_interval: float = 1.0,
+        max_file_size: int = 1 << 30,
+        max_file_age: float = 3600.0,
+        compression_level: int = 1,
+    ):
+        self.directory = directory
+        self.prefix = prefix
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        self.max_file_size = max_file_size
+        self.max_file_age = max_file_age
+        self.compression_level = compression_level
+
+        self.n_records = 0
+        self.n_bytes_written = 0
+        self.paths: list[str] = []
+
+        self._logger = logging.getLogger(__name__)
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._file = None
+        self._file_size = 0
+        self._file_opened = 0.0
+        self._n_files = 0
+        self._conn_ids = iter(range(1, 1 << 32))
+
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def new_conn_id(self) -> int:
+        return next(self._conn_ids)
+
+    def record(self, conn_id: int, kind: RecordKind, payload: Union[str, bytes]):
+        """queues a record (called on the event loop, does no io)"""
+        self._queue.put((time.time_ns(), conn_id, kind, payload))
+
+    def _open_file(self):
+        if self._file is not None:
+            self._file.close()
+
+        start = time.strftime("%Y%m%d-%H%M%S")
+        while True:
+            name = f"{self.prefix}-{start}-{self._n_files:04d}.wsrec"
+            path = os.path.join(self.directory, name)
+            self._n_files += 1
+            try:
+                self._file = open(path, "xb")
+                break
+            except FileExistsError:
+                continue  # another recorder with the same prefix
+        self._file.write(_MAGIC)
+        self._file_size = len(_MAGIC)
+        self._file_opened = time.monotonic()
+        self.paths.append(path)
+
+    def _write_block(self, records: list):
+        raw = _pack_records(records)
+        compressed = zlib.compress(raw, self.compression_level)
+        size = _BLOCK.size + len(compressed)
+
+        age = time.monotonic() - self._file_opened
+        if (
+            self._file is None
+            or self._file_size + size > self.max_file_size
+            or age > self.max_file_age
+        ):
+            self._open_file()
+
+        assert self._file is not None
+        self._file.write(_BLOCK.pack(len(compressed), len(raw)))
+        self._file.write(compressed)
+        self._file.flush()
+        self._file_size += size
+        self.n_bytes_written += size
+        self.n_records += len(records)
+
+    def _run(self):
+        """writer thread"""
+        records: list = []
+        buffered, oldest = 0, 0.0
+        stop = False
+        while not stop:
+            timeout = None
+            if records:
+                timeout = max(oldest + self.flush_interval - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                stop = True
+            elif item is not None:
+                if not records:
+                    oldest = time.monotonic()
+                if isinstance(item[3], str):
+                    item = (*item[:3], item[3].encode())
+                records.append(item)
+                buffered += _RECORD.size + len(item[3])
+
+            if records and (
+                stop
+                or buffered >= self.block_size
+                or time.monotonic() - oldest >= self.flush_interval
+            ):
+                try:
+                    self._write_block(records)
+                except Exception as e:
+                    self._logger.exception(f"failed to write recording: {e}")
+                records, buffered = [], 0
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        """writes the buffered records and stops the writer thread"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
@@ -0,0 +1,288 @@
+import asyncio
+import glob
+import math
+import os
+import time
+
+import websockets
+
+from collections import deque
+from typing import Any, Iterator, Optional, Union
+from urllib.parse import parse_qs, urlsplit
+
+from .binance import BinanceWebsocket, parse_snapshot_binance
+from .decoders import get_decoder
+from .events import OrderbookEvent
+from .kraken import KrakenWebsocket
+from .recorder import Record, RecordKind, read_records
+from .rest import RestClient
+
+
+class Replay:
+    """
+    Source of a replay: recording files (see recorder.FrameRecorder) and the
+    replay clock.
+
+    speed=1.0 replays in real time, speed=N N times faster and speed=None as
+    fast as possible. Files are read through mmap one block at a time, so
+    captures of any size are streamed. They are read once for all the
+    connections (once every added websocket has opened its connection), and
+    each record is handed to the connections opened with its subscription.
+    done is set once every connection has replayed all of its frames.
+
+    Replayed snapshots don't count against a request weight budget (see
+    rest_client).
+    """
+
+    # how long a recorded snapshot waits to be requested, and a snapshot
+    # request waits for its recorded response (in seconds)
+    rest_timeout = 1.0
+    _yield_every = 1024  # records read without yielding to the event loop
+
+    def __init__(self, paths: Union[str, list[str]], speed: Optional[float] = 1.0):
+        if isinstance(paths, str):
+            paths = [paths]
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(sorted(glob.glob(os.path.join(path, "*.wsrec"))))
+            else:
+                files.append(path)
+        self.paths = files
+        self.speed = speed
+
+        first = self.records()
+        self._t0 = next((r.ts for r in first), 0)
+        first.close()
+        self._start: Optional[float] = None
+
+        self.done = asyncio.Event()
+        self._n_open = 0
+
+        # replayed connections by subscription message
+        self._connections: dict[bytes, list["ReplayConnection"]] = {}
+        self._n_connections = 0
+        self._n_live = 0  # connections that still replay
+        self._reader: Optional[asyncio.Task] = None
+
+    def records(self) -> Iterator[Record]:
+        for path in self.paths:
+            yield from read_records(path)
+
+    async def pace(self, ts: int):
+        """waits until the replay clock reaches the recorded time ts"""
+        if self.speed is None:
+            return
+        if self._start is None:
+            self._start = time.monotonic()
+        at = self._start + (ts - self._t0) / 1e9 / self.speed
+        delay = at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def rest_client() -> RestClient:
+        """REST client of the replayed connections (no weight budget)"""
+        return RestClient(weight_limit=math.inf)
+
+    def add(self, ws: "ReplayWebsocket"):
+        """replays the recording on ws"""
+        ws.replay = self
+        self._n_open += 1
+        self.done.clear()
+
+    def _finished(self):
+        self._n_open -= 1
+        if self._n_open == 0:
+            self.done.set()
+
+    def _connect(self, conn: "ReplayConnection"):
+        """registers conn, starts reading once all the websockets are connected"""
+        self._connections.setdefault(conn.subscription, []).append(conn)
+        self._n_connections += 1
+        self._n_live += 1
+        if self._reader is None and self._n_connections >= self._n_open:
+            self._reader = asyncio.get_running_loop().create_task(self._read())
+
+    async def _read(self):
+        """reads the recording once and hands each record to its connections"""
+        by_id: dict[int, list[ReplayConnection]] = {}
+        records = self.records()
+        try:
+            for i, record in enumerate(records):
+                if record.kind == RecordKind.CONNECT:
+                    _, _, subscription = record.payload.partition(b"\n")
+                    by_id[record.conn_id] = self._connections.get(subscription, [])
+                    continue
+
+                for conn in by_id.get(record.conn_id, ()):
+                    if not conn.finished:
+                        await conn._records.put(record)
+                if self._n_live == 0:
+                    break
+                if i % self._yield_every == 0:
+                    await asyncio.sleep(0)  # records of no connection don't wait
+        finally:
+            records.close()
+            for conns in self._connections.values():
+                for conn in conns:
+                    conn._end_of_recording()
+
+
+class ReplayConnection:
+    """
+    Stands in for the websocket connection of a ReplayWebsocket: recv returns
+    the recorded frames of the connections that were opened with the same
+    subscription message (read ahead by Replay, at most buffer_size records),
+    and the connection closes at the end of the recording.
+
+    Recorded REST responses are handed to rest_response in order. The frames
+    after a response are held back until it was requested (at most
+    Replay.rest_timeout seconds), like the snapshot request followed the
+    frames before it when it was recorded. A request without a recorded
+    response times out after Replay.rest_timeout seconds, and fails once the
+    recording is over.
+    """
+
+    _yield_every = 64  # frames returned without yielding to the event loop
+    buffer_size = 1024
+
+    def __init__(self, replay: Replay, subscription_msg: str):
+        self.replay = replay
+        self.subscription = subscription_msg.encode()
+        self.finished = False
+
+        self._records: asyncio.Queue[Optional[Record]] = asyncio.Queue(self.buffer_size)
+        self._eof = False  # the replay has read all the records
+        self._n_frames = 0
+
+        self._responses: dict[str, deque[tuple[int, bytes]]] = {}
+        self._waiters: dict[str, asyncio.Future] = {}
+        self._taken = asyncio.Event()
+        replay._connect(self)
+
+    async def send(self, msg: Any):
+        pass
+
+    async def close(self):
+        self._finish()
+
+    def _finish(self):
+        """ends the recording, pending requests won't get a response"""
+        if not self.finished:
+            self.finished = True
+            self.replay._n_live -= 1
+        for waiter in self._waiters.values():
+            if not waiter.done():
+                waiter.set_exception(websockets.ConnectionClosedOK(None, None))
+        self._waiters.clear()
+
+        # unblocks the replay if it waits for room
+        while not self._records.empty():
+            self._records.get_nowait()
+
+    def _end_of_recording(self):
+        self._eof = True
+        if not self._records.full():
+            self._records.put_nowait(None)  # wakes recv
+
+    async def _deliver_rest(self, ts: int, payload: bytes):
+        url, _, body = payload.partition(b"\n")
+        query = parse_qs(urlsplit(url.decode()).query)
+        symbol = query.get("symbol", [""])[0]
+        self._responses.setdefault(symbol, deque()).append((ts, body))
+
+        waiter = self._waiters.pop(symbol, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+            return
+
+        self._taken.clear()
+        try:
+            await asyncio.wait_for(self._taken.wait(), self.replay.rest_timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def rest_response(self, symbol: str) -> tuple[int, bytes]:
+        """returns the next recorded (ts, body) of a request for symbol"""
+        responses = self._responses.setdefault(symbol, deque())
+        if not responses:
+            if self.finished:
+                raise websockets.ConnectionClosedOK(None, None)
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters[symbol] = waiter
+            try:
+                await asyncio.wait_for(waiter, self.replay.rest_timeout)
+            finally:
+                if self._waiters.get(symbol) is waiter:
+                    del self._waiters[symbol]
+        self._taken.set()
+        return responses.popleft()
+
+    async def recv(self) -> str:
+        while not self.finished and not (self._eof and self._records.empty()):
+            record = await self._records.get()
+            if record is None:
+                break
+
+            await self.replay.pace(record.ts)
+            if record.kind == RecordKind.REST:
+                await self._deliver_rest(record.ts, record.payload)
+                continue
+
+            self._n_frames += 1
+            if self._n_frames % self._yield_every == 0:
+                await asyncio.sleep(0)
+            return record.payload.decode()
+
+        self._finish()
+        raise websockets.ConnectionClosedOK(None, None)
+
+
+class ReplayWebsocket:
+    """
+    Mixin that replays a recording instead of connecting: frames go through
+    the parsing, syncing and recv paths of the exchange websocket. The
+    listen loop ends with the recording instead of reconnecting.
+    """
+
+    replay: Optional[Replay] = None
+
+    async def _open(self):
+        assert self.replay is not None, "add the websocket to a Replay first"
+        self._conn = ReplayConnection(self.replay, self._subscription_msg)
+
+    async def _listen_loop(self):
+        try:
+            await super()._listen_loop()
+        finally:
+            self.replay._finished()
+
+    async def _reconnect(self):
+        # the recording is over
+        self._closing = True
+
+    @property
+    def rest(self) -> RestClient:
+        if self._rest is None:
+            self._rest = self.replay.rest_client()
+            self._owns_rest = True
+        return self._rest
+
+
+class ReplayBinanceWebsocket(ReplayWebsocket, BinanceWebsocket):
+    """BinanceWebsocket that replays frames and depth snapshots"""
+
+    _decode_rest = staticmethod(get_decoder())
+
+    async def _get_snapshot_rest(self, symbol: str) -> OrderbookEvent:
+        assert isinstance(self._conn, ReplayConnection)
+        rest_symbol = self._symbolsMeta.sym2rest_sym(self._name, symbol)
+        ts, body = await self._conn.rest_response(rest_symbol)
+        data = self._decode_rest(body)
+        scale, fmt = self._get_scale(symbol), self.levels_format
+        return parse_snapshot_binance(self._name, symbol, ts, data, scale, fmt)
+
+
+class ReplayKrakenWebsocket(ReplayWebsocket, KrakenWebsocket):
+    """KrakenWebsocket that replays frames"""
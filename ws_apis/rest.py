@@ -0,0 +1,178 @@
+import aiohttp
+import asyncio
+import heapq
+import itertools
+import time
+
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+from .utils import get_request
+
+# lower values are fetched first
+PRIORITY_RESYNC = 0
+PRIORITY_SNAPSHOT = 1
+
+
+class WeightBudget:
+    """
+    request weight used in a sliding window of interval seconds. pause stops
+    all requests for a while (after a rate limit response).
+    """
+
+    def __init__(self, limit: float, interval: float):
+        self.limit = limit
+        self.interval = interval
+        self.used = 0
+        self.paused_until = 0.0
+        self._requests: deque[tuple[float, int]] = deque()  # (time, weight)
+
+    def _expire(self, now: float):
+        while self._requests and self._requests[0][0] <= now - self.interval:
+            self.used -= self._requests.popleft()[1]
+
+    def wait_time(self, weight: int) -> float:
+        """seconds until a request of weight fits in the budget (0 if it fits)"""
+        now = time.monotonic()
+        if self.paused_until > now:
+            return self.paused_until - now
+        self._expire(now)
+        excess = self.used + min(weight, self.limit) - self.limit
+        if excess <= 0:
+            return 0.0
+
+        # the oldest requests have to leave the window first
+        freed = 0
+        for t, w in self._requests:
+            freed += w
+            if freed >= excess:
+                return t + self.interval - now
+        return self.interval
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def use(self, weight: int):
+        self._requests.append((time.monotonic(), weight))
+        self.used += weight
+
+
+class RestClient:
+    """
+    REST client with a single pooled aiohttp session (connections are reused
+    instead of a TCP/TLS handshake per request) and a scheduler for weighted
+    requests.
+
+    schedule() queues a request by priority and starts it as soon as it fits
+    in the weight budget (weight_limit per interval seconds), with at most
+    max_concurrency requests in flight (weight_limit=math.inf disables the
+    budget).
+    """
+
+    def __init__(
+        self,
+        weight_limit: float = 6000,
+        interval: float = 60.0,
+        max_concurrency: int = 10,
+    ):
+        self.budget = WeightBudget(weight_limit, interval)
+        self.max_concurrency = max_concurrency
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._heap: list[tuple[int, int, int, Callable, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._runner: Optional[asyncio.Task] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """the shared session, created on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def get(self, url: str, params: dict[str, Any]) -> dict[str, Any]:
+        """makes an unscheduled get request on the shared session"""
+        return await get_request(url, params, self.session)
+
+    def schedule(
+        self,
+        fetch: Callable[[], Awaitable[Any]],
+        weight: int,
+        priority: int = PRIORITY_SNAPSHOT,
+    ) -> asyncio.Future:
+        """queues fetch, returns a future of its result (cancel it to drop it)"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), weight, fetch, future))
+
+        if self._runner is None or self._runner.done():
+            self._runner = loop.create_task(self._run())
+        self._wakeup.set()
+        return future
+
+    async def _next_request(self) -> tuple[int, Callable, asyncio.Future]:
+        """waits for the most urgent request that fits in the weight budget"""
+        while True:
+            while self._heap and self._heap[0][-1].done():
+                heapq.heappop(self._heap)  # cancelled while queued
+
+            delay = None
+            if self._heap:
+                delay = self.budget.wait_time(self._heap[0][2])
+                if delay == 0:
+                    _, _, weight, fetch, future = heapq.heappop(self._heap)
+                    return weight, fetch, future
+
+            # a more urgent request may be queued in the meantime
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                weight, fetch, future = await self._next_request()
+            except BaseException:
+                self._slots.release()
+                raise
+
+            self.budget.use(weight)
+            task = asyncio.get_running_loop().create_task(self._fetch(fetch, future))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            future.add_done_callback(lambda f, t=task: f.cancelled() and t.cancel())
+
+    async def _fetch(self, fetch: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        try:
+            result = await fetch()
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        tasks = list(self._tasks)
+        if self._runner is not None:
+            tasks.append(self._runner)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=10)
+
+        for _, _, _, _, future in self._heap:
+            future.cancel()
+        self._heap.clear()
+
+        if self._session is not None:
+            await self._session.close()
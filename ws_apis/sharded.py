@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import pickle
+import time
+import zlib
+
+from enum import Enum
+from typing import Any, Callable, Optional, Union
+
+from .events import OrderbookEvent, TradeEvent, StatusEvent, BboEvent
+from .queues import OverflowPolicy
+from .shm import ShmRing
+from .ws_manager import WsManager, Subscription
+
+StreamKey = tuple[str, str, str]  # (exch_name, symbol, stream_name)
+
+
+class Placement(Enum):
+    EXCHANGE = "exchange"  # all streams of an exchange on one shard
+    SYMBOL_HASH = "symbol_hash"  # all streams of a symbol on one shard
+    RATE = "rate"  # balance the message rates of the shards
+
+
+def stream_key(sub: Subscription) -> StreamKey:
+    return (sub.exch_name, sub.symbol, sub.stream_name)
+
+
+def assign_shards(
+    subscriptions: list[Subscription],
+    n_shards: int,
+    placement: Placement = Placement.SYMBOL_HASH,
+    rates: Optional[dict[StreamKey, float]] = None,
+) -> list[list[Subscription]]:
+    """
+    splits subscriptions into at most n_shards non-empty lists. RATE places
+    the busiest streams first, each on the least loaded shard, using rates
+    in messages per second (see measure_rates, unknown streams get the mean).
+    """
+    subscriptions = list(dict.fromkeys(subscriptions))
+    shards: list[list[Subscription]] = [[] for _ in range(n_shards)]
+
+    if placement == Placement.EXCHANGE:
+        exchanges = list(dict.fromkeys(sub.exch_name for sub in subscriptions))
+        for sub in subscriptions:
+            shards[exchanges.index(sub.exch_name) % n_shards].append(sub)
+
+    elif placement == Placement.SYMBOL_HASH:
+        # crc32 is stable across processes, unlike hash()
+        for sub in subscriptions:
+            shards[zlib.crc32(sub.symbol.encode()) % n_shards].append(sub)
+
+    elif placement == Placement.RATE:
+        rates = rates or {}
+        default = sum(rates.values()) / len(rates) if rates else 1.0
+        rate = lambda sub: rates.get(stream_key(sub), default)
+        load = [0.0] * n_shards
+        for sub in sorted(subscriptions, key=rate, reverse=True):
+            i = min(range(n_shards), key=load.__getitem__)
+            shards[i].append(sub)
+            load[i] += rate(sub)
+
+    return [shard for shard in shards if shard]
+
+
+async def measure_rates(
+    subscriptions: list[Subscription], duration: float = 10.0
+) -> dict[StreamKey, float]:
+    """counts the events of each stream for duration seconds (in messages per second)"""
+    counts = {stream_key(sub): 0 for sub in subscriptions}
+    async with WsManager(subscriptions) as wsm:
+        deadline = time.monotonic() + duration
+        while (remaining := deadline - time.monotonic()) > 0:
+            for event in await wsm.recv_many(timeout=remaining):
+                if isinstance(event, OrderbookEvent):
+                    key = (event.exch_name, event.symbol, "book")
+                elif isinstance(event, TradeEvent):
+                    key = (event.exch_name, event.symbol, "trades")
+                elif isinstance(event, BboEvent):
+                    key = (event.exch_name, event.symbol, "bbo")
+                else:
+                    continue
+                counts[key] = counts.get(key, 0) + 1
+    return {k: n / duration for k, n in counts.items()}
+
+
+async def _worker(
+    subscriptions: list[Subscription],
+    ring: ShmRing,
+    stop: Any,
+    manager_kwargs: dict[str, Any],
+    make_handler: Optional[Callable[[], Callable[[Any], Any]]],
+):
+    handler = make_handler() if make_handler is not None else None
+    async with WsManager(subscriptions, **manager_kwargs) as wsm:
+        while not stop.is_set():
+            for event in await wsm.recv_many(timeout=0.1):
+                if handler is not None:
+                    event = handler(event)
+                    if event is None:
+                        continue
+
+                # wait while the parent is behind
+                payload = pickle.dumps(event, protocol=pickle.HIGHEST_PROTOCOL)
+                while not ring.put(payload):
+                    if stop.is_set():
+                        return
+                    await asyncio.sleep(0.001)
+
+
+def _run_worker(
+    subscriptions: list[Subscription],
+    ring_name: str,
+    stop: Any,
+    manager_kwargs: dict[str, Any],
+    make_handler: Optional[Callable[[], Callable[[Any], Any]]],
+):
+    """entry point of a shard process"""
+    ring = ShmRing(ring_name)
+    try:
+        asyncio.run(_worker(subscriptions, ring, stop, manager_kwargs, make_handler))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+
+
+class ShardsExited(Exception):
+    """raised by recv once every worker process has exited"""
+
+
+class ShardedWsManager:
+    """
+    Runs the subscriptions in n_shards worker processes, each with its own
+    event loop and WsManager (connections, parsing, book sync), so the feed
+    isn't limited to one core. placement selects which subscriptions share
+    a shard (see assign_shards).
+
+    Each worker pickles its events into a shared-memory ring (see
+    shm.ShmRing) that recv polls, so events are returned like WsManager.recv.
+    Once every worker has exited and the rings are drained, recv and
+    recv_many raise ShardsExited (and async iteration stops).
+    make_handler (a picklable factory) can create a handler per worker that
+    transforms events in the worker before they are sent, e.g. to maintain
+    orderbooks there and only send snapshots. Events the handler maps to
+    None are not sent.
+
+    The workers are spawned, so the main module must be importable without
+    side effects (guarded by if __name__ == "__main__").
+    """
+
+    _max_sleep = 0.001  # longest sleep between polls of the empty rings
+
+    def __init__(
+        self,
+        subscriptions: list[Subscription],
+        n_shards: Optional[int] = None,
+        placement: Placement = Placement.SYMBOL_HASH,
+        rates: Optional[dict[StreamKey, float]] = None,
+        status_events: bool = False,
+        queue_size: int = 0,
+        overflow: OverflowPolicy = OverflowPolicy.BLOCK,
+        ring_size: int = 1 << 24,
+        make_handler: Optional[Callable[[], Callable[[Any], Any]]] = None,
+    ):
+        self.subscriptions = subscriptions
+        self.n_shards = n_shards or os.cpu_count() or 1
+        self.shards = assign_shards(subscriptions, self.n_shards, placement, rates)
+        self.ring_size = ring_size
+        self.make_handler = make_handler
+        self._manager_kwargs = {
+            "status_events": status_events,
+            "queue_size": queue_size,
+            "overflow": overflow,
+        }
+
+        self._logger = logging.getLogger(__name__)
+        self._ctx = mp.get_context("spawn")
+        self._stop = self._ctx.Event()
+        self._rings: list[ShmRing] = []
+        self._processes: list[Any] = []
+        self._next = 0  # ring polled first
+        self._n_idle = 0
+        self._exited: set[int] = set()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.cleanup()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(
+        self,
+    ) -> Union[OrderbookEvent, TradeEvent, StatusEvent, BboEvent]:
+        try:
+            return await self.recv()
+        except ShardsExited:
+            raise StopAsyncIteration
+
+    async def connect(self):
+        for i, subs in enumerate(self.shards):
+            self._logger.info(f"Starting shard {i} with {subs}")
+            ring = ShmRing(capacity=self.ring_size)
+            args = (
+                subs,
+                ring.name,
+                self._stop,
+                self._manager_kwargs,
+                self.make_handler,
+            )
+            process = self._ctx.Process(target=_run_worker, args=args, daemon=True)
+            process.start()
+            self._rings.append(ring)
+            self._processes.append(process)
+
+    async def cleanup(self):
+        self._stop.set()
+        for process in self._processes:
+            await asyncio.get_running_loop().run_in_executor(None, process.join, 10)
+            if process.is_alive():
+                process.terminate()
+
+        for ring in self._rings:
+            ring.close()
+        self._rings.clear()
+        self._processes.clear()
+
+    def _poll(self, events: list, max_n: int) -> list:
+        """appends up to max_n events from the rings, taking turns between them"""
+        n_rings = len(self._rings)
+        n_empty = 0
+        while len(events) < max_n and n_empty < n_rings:
+            ring = self._rings[self._next]
+            self._next = (self._next + 1) % n_rings
+            payload = ring.get()
+            if payload is None:
+                n_empty += 1
+                continue
+            n_empty = 0
+            events.append(pickle.loads(payload))
+        return events
+
+    async def _idle(self):
+        """yields to the event loop, sleeping longer the longer the rings are empty"""
+        self._n_idle += 1
+        if self._n_idle < 10:
+            await asyncio.sleep(0)
+            return
+
+        await asyncio.sleep(min(self._n_idle * 1e-5, self._max_sleep))
+        if self._n_idle % 1000 == 0:
+            self._check_workers()
+
+    def _check_workers(self):
+        for i, process in enumerate(self._processes):
+            if i not in self._exited and not process.is_alive():
+                self._exited.add(i)
+                self._logger.error(f"shard {i} exited with code {process.exitcode}")
+
+    def _all_exited(self) -> bool:
+        return bool(self._processes) and len(self._exited) == len(self._processes)
+
+    async def recv(self) -> Union[OrderbookEvent, TradeEvent, StatusEvent, BboEvent]:
+        """receive an event from the shards"""
+        while True:
+            exited = self._all_exited()  # before the last poll of the rings
+            events = self._poll([], 1)
+            if events:
+                self._n_idle = 0
+                return events[0]
+            if exited:
+                raise ShardsExited("all shards exited")
+            await self._idle()
+
+    async def recv_many(
+        self, max_n: int = 1000, timeout: Optional[float] = None
+    ) -> list[Union[OrderbookEvent, TradeEvent, StatusEvent, BboEvent]]:
+        """
+        returns up to max_n events. waits only if no event is ready, for at
+        most timeout seconds (an empty list is returned on timeout).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            exited = self._all_exited()
+            events = self._poll([], max_n)
+            if events:
+                self._n_idle = 0
+                return events
+            if exited:
+                raise ShardsExited("all shards exited")
+            if deadline is not None and time.monotonic() >= deadline:
+                return events
+            await self._idle()
@@ -0,0 +1,107 @@
+import pickle
+import struct
+
+from multiprocessing import shared_memory
+from typing import Any, Optional
+
+_HEADER = struct.Struct("<QQ")  # write position, read position
+_LENGTH = struct.Struct("<I")
+_WRAP = 0xFFFFFFFF  # the next record starts at the beginning of the buffer
+
+
+class ShmRing:
+    """
+    Single-producer single-consumer ring buffer of length-prefixed records in
+    shared memory.
+
+    The positions only grow (the offset is position % capacity). The producer
+    only writes the write position and the consumer only writes the read
+    position, so one process can put and another get without a lock. A
+    record is written before the write position is advanced past it.
+
+    The process that creates the ring unlinks it (see close).
+    """
+
+    def __init__(self, name: Optional[str] = None, capacity: int = 1 << 24):
+        if name is None:
+            size = _HEADER.size + capacity
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._owner = True
+            _HEADER.pack_into(self._shm.buf, 0, 0, 0)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+
+        self.name = self._shm.name
+        self.capacity = len(self._shm.buf) - _HEADER.size
+        self._buf = self._shm.buf
+        self._data = self._shm.buf[_HEADER.size :]
+
+    def __getstate__(self):
+        return {"name": self.name}
+
+    def __setstate__(self, state: dict[str, Any]):
+        self.__init__(state["name"])
+
+    def _positions(self) -> tuple[int, int]:
+        return _HEADER.unpack_from(self._buf, 0)
+
+    def put(self, payload: bytes) -> bool:
+        """writes a record, returns False if there isn't enough space"""
+        n = _LENGTH.size + len(payload)
+        if n > self.capacity:
+            raise ValueError(f"record of {n} bytes exceeds the ring capacity")
+
+        write, read = self._positions()
+        offset = write % self.capacity
+        tail = self.capacity - offset
+
+        # records don't wrap around, skip the tail if it is too short
+        skip = tail if tail < n else 0
+        if write + skip + n - read > self.capacity:
+            return False
+        if skip:
+            if tail >= _LENGTH.size:
+                _LENGTH.pack_into(self._data, offset, _WRAP)
+            write, offset = write + skip, 0
+
+        _LENGTH.pack_into(self._data, offset, len(payload))
+        self._data[offset + _LENGTH.size : offset + n] = payload
+        struct.pack_into("<Q", self._buf, 0, write + n)
+        return True
+
+    def get(self) -> Optional[bytes]:
+        """reads a record, returns None if the ring is empty"""
+        write, read = self._positions()
+        if read == write:
+            return None
+
+        offset = read % self.capacity
+        tail = self.capacity - offset
+        if tail < _LENGTH.size or _LENGTH.unpack_from(self._data, offset)[0] == _WRAP:
+            read, offset = read + tail, 0
+
+        (length,) = _LENGTH.unpack_from(self._data, offset)
+        start = offset + _LENGTH.size
+        payload = bytes(self._data[start : start + length])
+        struct.pack_into("<Q", self._buf, 8, read + _LENGTH.size + length)
+        return payload
+
+    def put_obj(self, obj: Any) -> bool:
+        return self.put(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def get_obj(self) -> Any:
+        """returns the next pickled object, None if the ring is empty"""
+        payload = self.get()
+        return None if payload is None else pickle.loads(payload)
+
+    def empty(self) -> bool:
+        write, read = self._positions()
+        return read == write
+
+    def close(self):
+        self._data.release()
+        self._buf = self._data = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
@@ -2,18 +2,103 @@ import aiohttp
 import os
 import json
 
+from array import array
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Callable, NamedTuple, Optional
+
+from .decoders import get_decoder
+from .events import Level, LevelColumns, LazyLevels, Levels, LevelsFormat, Trade
 
 _base_dir = os.path.dirname(__file__)
+_decode = get_decoder()
+
+
+async def get_request(
+    url: str,
+    params: dict[str, Any],
+    session: Optional[aiohttp.ClientSession] = None,
+    on_response: Optional[Callable[[str, bytes], None]] = None,
+) -> dict[str, Any]:
+    """
+    makes a get request to the given url and params. return JSON
+    (on a temporary session unless one is given, see rest.RestClient).
+    on_response is called with the request url and the raw body.
+    """
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await get_request(url, params, session, on_response)
+
+    async with session.get(url, params=params) as resp:
+        resp.raise_for_status()
+        if on_response is None:
+            return await resp.json(loads=_decode)
+        body = await resp.read()
+        on_response(str(resp.url), body)
+        return _decode(body)
+
+
+def str_to_fixed(s: str, decimals: int) -> int:
+    """parses a decimal string to an int scaled by 10**decimals (truncating)"""
+    whole, _, frac = s.partition(".")
+    return int(whole + frac[:decimals].ljust(decimals, "0"))
+
+
+class FixedPointScale(NamedTuple):
+    """number of decimals prices and quantities are scaled by in fixed-point mode"""
+
+    price_decimals: int = 8
+    qty_decimals: int = 8
+
+    def price(self, s: str) -> int:
+        """parses a price string to a fixed-point int"""
+        return str_to_fixed(s, self.price_decimals)
+
+    def qty(self, s: str) -> int:
+        """parses a qty string to a fixed-point int"""
+        return str_to_fixed(s, self.qty_decimals)
+
+    def price_to_float(self, price: int) -> float:
+        return price / 10**self.price_decimals
 
+    def qty_to_float(self, qty: int) -> float:
+        return qty / 10**self.qty_decimals
 
-async def get_request(url: str, params: dict[str, Any]) -> dict[str, Any]:
-    """makes a get request to the given url and params. return JSON"""
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, params=params) as resp:
-            resp.raise_for_status()
-            return await resp.json()
+    def level_to_float(self, level: Level) -> Level:
+        return Level(self.price_to_float(level.price), self.qty_to_float(level.qty))
+
+    def trade_to_float(self, trade: Trade) -> Trade:
+        price, qty = self.price_to_float(trade.price), self.qty_to_float(trade.qty)
+        return Trade(price, qty, trade.side)
+
+
+_default_scale = FixedPointScale()
+
+
+def parse_level_columns(
+    levels: list[list[str]], scale: Optional[FixedPointScale] = None
+) -> LevelColumns:
+    """parses [price, qty, ...] levels straight into price and qty arrays"""
+    if scale is not None:
+        prices = array("q", [scale.price(l[0]) for l in levels])
+        qtys = array("q", [scale.qty(l[1]) for l in levels])
+    else:
+        prices = array("d", [float(l[0]) for l in levels])
+        qtys = array("d", [float(l[1]) for l in levels])
+    return LevelColumns(prices, qtys)
+
+
+def parse_levels(
+    levels: list[list[str]],
+    parse_level: Callable[[list[str], Optional[FixedPointScale]], Level],
+    scale: Optional[FixedPointScale] = None,
+    fmt: LevelsFormat = LevelsFormat.OBJECTS,
+) -> Levels:
+    """parses exchange levels with parse_level, into columns or lazily"""
+    if fmt == LevelsFormat.COLUMNS:
+        return parse_level_columns(levels, scale)
+    if fmt == LevelsFormat.LAZY:
+        return LazyLevels(levels, scale)
+    return [parse_level(l, scale) for l in levels]
 
 
 def read_json(path: str) -> Any:
@@ -29,11 +114,30 @@ def parse_symbols_dict(
     return sym2ws, {v: k for k, v in sym2ws.items()}
 
 
+def parse_scales_dict(
+    symbols_map: dict[str, dict[str, Any]], exch: str
+) -> dict[str, FixedPointScale]:
+    """returns a dict of symbol to fixed-point scale for the symbols that set one"""
+    scales = {}
+    for k, v in symbols_map.items():
+        meta = v.get(exch) or {}
+        if "price_decimals" in meta or "qty_decimals" in meta:
+            scales[k] = FixedPointScale(
+                meta.get("price_decimals", _default_scale.price_decimals),
+                meta.get("qty_decimals", _default_scale.qty_decimals),
+            )
+    return scales
+
+
 class SymbolsMeta:
     """
     Global symbols object (for mapping symbols to exchange format).
     This is a singleton class to avoid loading symbols.json at each
     new instance.
+
+    It also holds the fixed-point scale of each symbol, read from the optional
+    "price_decimals" and "qty_decimals" keys of an exchange entry in
+    symbols.json (defaults to FixedPointScale()).
     """
 
     _instance = None
@@ -49,6 +153,7 @@ class SymbolsMeta:
     def __init(self):
         self.sym2ws, self.ws2sym = {}, {}
         self.sym2rest, self.rest2sym = {}, {}
+        self.scales: dict[str, dict[str, FixedPointScale]] = {}
         self.__load_symbols()
 
     def __load_symbols(self):
@@ -60,6 +165,7 @@ class SymbolsMeta:
             self.sym2rest[exch], self.rest2sym[exch] = parse_symbols_dict(
                 self.symbols_map, exch, "rest"
             )
+            self.scales[exch] = parse_scales_dict(self.symbols_map, exch)
 
     def sym2ws_sym(self, exchange: str, symbol: str) -> str:
         """map symbol to ws symbol"""
@@ -76,3 +182,13 @@ class SymbolsMeta:
     def rest_sym2sym(self, exchange: str, symbol: str) -> str:
         """map rest symbol to symbol"""
         return self.rest2sym[exchange][symbol]
+
+    def fixed_point_scale(self, exchange: str, symbol: str) -> FixedPointScale:
+        """returns the fixed-point scale of a symbol"""
+        return self.scales[exchange].get(symbol, _default_scale)
+
+    def set_fixed_point_scale(
+        self, exchange: str, symbol: str, scale: FixedPointScale
+    ) -> None:
+        """overrides the fixed-point scale of a symbol"""
+        self.scales[exchange][symbol] = scale
@@ -1,15 +1,66 @@
 import websockets
 import asyncio
 import logging
+import random
+import time
 
-from typing import Optional
+from typing import Any, Optional, Union
+
+from .events import StatusEvent, StatusEventType
+from .latency import Stage, StageStamps, mark_all
+from .metrics import Sample, StreamStats
+from .queues import EventQueue, IdleTimer, OverflowPolicy
+from .recorder import FrameRecorder, RecordKind
+from .rest import RestClient
 
 # disable websockets logging
 logging.getLogger("websockets").setLevel(logging.CRITICAL)
 
 
+def frame_size(msg: Union[str, bytes]) -> int:
+    """size of a frame in bytes (text frames are utf-8)"""
+    if isinstance(msg, bytes) or msg.isascii():
+        return len(msg)
+    return len(msg.encode())
+
+
 class Websocket:
+    """
+    Base websocket: connects, subscribes and queues incoming messages.
+
+    The connection is supervised: when it drops, it is reopened with jittered
+    exponential backoff and the subscription message is sent again. Subclasses
+    resync their state in _on_reconnect. With status_events=True a
+    StatusEvent is queued for each symbol after a reconnect.
+
+    The event queue is unbounded by default, see set_queue_policy.
+
+    With a recorder (see recorder.FrameRecorder) every connection, received
+    frame and REST response is recorded raw, with its receive time.
+
+    REST requests go through a RestClient, either shared (set_rest_client)
+    or created on first use and closed in cleanup.
+
+    Events can be received one at a time (recv, async for) or in batches
+    (recv_many). Both take events that are already queued without waiting
+    and only arm a timer when the queue is empty.
+
+    With latency_stamps=True every event carries the monotonic time of each
+    stage it went through (see latency.StageStamps).
+
+    Frames, bytes and reconnects are counted per connection, events, bytes
+    and the exchange to local clock lag per symbol (stream_stats), and
+    metrics() returns them with the queue gauges (see metrics.Sample).
+    """
+
+    _name = "websocket"
     _timeout = 10
+    _reconnect_delay = 0.5  # first backoff delay (in seconds)
+    _max_reconnect_delay = 30.0
+    _bbo_depth = 10  # default book depth of bbo subscriptions
+    # the exchange keeps books within the subscribed depth, levels pushed
+    # beyond it are not deleted (and have to be trimmed)
+    _bounded_book = False
 
     def __init__(self, ws_url: str, subscription_msg: str):
         self._ws_url = ws_url
@@ -20,8 +71,26 @@ class Websocket:
         self._loop = asyncio.get_event_loop()
         self._coros = []
 
-        self._queue = asyncio.Queue()
+        self._queue = EventQueue()
         self._conn: Optional[websockets.WebSocketClientProtocol] = None
+        self._closing = False
+
+        self.symbols: list[str] = []  # set by subclasses
+        self.status_events = False
+        self.latency_stamps = False
+        self.n_reconnects = 0
+        self.n_frames = 0
+        self.n_bytes = 0
+        self.stream_stats: dict[str, StreamStats] = {}
+        self._frame_size = 0  # of the last frame received
+
+        self._idle = IdleTimer(self._timeout, self._on_idle)
+
+        self._rest: Optional[RestClient] = None
+        self._owns_rest = False
+
+        self.recorder: Optional[FrameRecorder] = None
+        self._conn_id = 0  # of the recorder, new for every (re)connection
 
     async def __aenter__(self):
         await self.connect()
@@ -30,25 +99,95 @@ class Websocket:
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.cleanup()
 
-    async def connect(self):
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._next_event()
+
+    def set_queue_policy(self, maxsize: int, policy: OverflowPolicy):
+        """bounds the event queue (call before connecting)"""
+        self._queue = EventQueue(maxsize, policy)
+
+    def set_rest_client(self, rest: RestClient):
+        """shares a REST client, which is closed by its owner"""
+        self._rest = rest
+        self._owns_rest = False
+
+    @property
+    def rest(self) -> RestClient:
+        if self._rest is None:
+            self._rest = RestClient()
+            self._owns_rest = True
+        return self._rest
+
+    async def _open(self):
+        """opens the connection and subscribes"""
         self._conn = await websockets.connect(self._ws_url)
         await self._conn.send(self._subscription_msg)
+        if self.recorder is not None:
+            self._conn_id = self.recorder.new_conn_id()
+            payload = f"{self._ws_url}\n{self._subscription_msg}"
+            self.recorder.record(self._conn_id, RecordKind.CONNECT, payload)
+
+    async def connect(self):
+        await self._open()
 
         task = self._loop.create_task(self._listen_loop())
         self._coros.append(task)
 
     async def cleanup(self):
+        self._closing = True
         if self._conn is not None:
             await self._conn.close()
 
         for task in self._coros:
             task.cancel()
 
-        await asyncio.wait(self._coros, timeout=10)
+        if self._coros:
+            await asyncio.wait(self._coros, timeout=10)
+        self._idle.cancel()
 
-    async def _listen(self):
+        if self._owns_rest and self._rest is not None:
+            await self._rest.close()
+
+    async def _recv_frame(self):
+        """receives the next frame of the connection (and records it)"""
         assert self._conn is not None
         msg = await self._conn.recv()
+        self.n_frames += 1
+        self._frame_size = frame_size(msg)
+        self.n_bytes += self._frame_size
+        if self.recorder is not None:
+            self.recorder.record(self._conn_id, RecordKind.FRAME, msg)
+        return msg
+
+    def _record_rest(self, url: str, body: bytes):
+        if self.recorder is not None:
+            payload = url.encode() + b"\n" + body
+            self.recorder.record(self._conn_id, RecordKind.REST, payload)
+
+    def _start_stamps(self) -> Optional[StageStamps]:
+        """stamps of a frame that was just received (None unless enabled)"""
+        return StageStamps() if self.latency_stamps else None
+
+    async def _queue_event(self, event: Any, stamps: Optional[StageStamps]):
+        """queues a parsed event"""
+        stats = self.stream_stats.get(event.symbol)
+        if stats is None:
+            stats = self.stream_stats[event.symbol] = StreamStats()
+        stats.add(self._frame_size, event.ts_recorded - event.ts_exchange)
+
+        if stamps is None:
+            await self._queue.put(event)
+            return
+        stamps.mark(Stage.PARSED)
+        event.stamps = stamps
+        await self._queue.put(event)
+        stamps.mark(Stage.ENQUEUED)
+
+    async def _listen(self):
+        msg = await self._recv_frame()
         await self._queue.put(msg)
 
     async def _listen_loop(self):
@@ -60,23 +199,148 @@ class Websocket:
             except asyncio.CancelledError as e:
                 self._logger.info(f"cancelled error{e}")
                 break
-            except websockets.ConnectionClosedError as e:
-                self._logger.info(f"connection closed{e}")
-                break
             except websockets.ConnectionClosedOK as e:
                 self._logger.info(f"connection closed ok{e}")
-                break
+                if self._closing:
+                    break
+                await self._reconnect()
+            except (websockets.ConnectionClosedError, OSError) as e:
+                self._logger.info(f"connection closed{e}")
+                if self._closing:
+                    break
+                await self._reconnect()
             except Exception as e:
-                self._logger.info(f"exception: {e}")
+                self._logger.exception(f"exception: {e}")
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """exponential backoff with jitter (between half and the full delay)"""
+        delay = min(self._reconnect_delay * 2**attempt, self._max_reconnect_delay)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _reconnect(self):
+        """reopens the connection until it succeeds, then resyncs"""
+        attempt = 0
+        while not self._closing:
+            try:
+                await self._open()
                 break
+            except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+                delay = self._backoff_delay(attempt)
+                self._logger.info(f"reconnect failed ({e}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+        else:
+            return
+
+        self.n_reconnects += 1
+        self._logger.info(f"reconnected to {self._ws_url} ({self.symbols})")
+        await self._on_reconnect()
+
+    async def _on_reconnect(self):
+        """called after the connection has been reopened and resubscribed"""
+        for symbol in self.symbols:
+            await self._put_status(symbol, StatusEventType.RECONNECTED)
+
+    def _status_event(self, symbol: str, type: StatusEventType, other=None):
+        ts = time.time_ns()
+        return StatusEvent(self._name, symbol, type, ts, other)
+
+    async def _put_status(self, symbol: str, type: StatusEventType, other=None):
+        if self.status_events:
+            await self._queue.put(self._status_event(symbol, type, other))
+
+    def _on_idle(self):
+        self._logger.info("timeout in recv")
+
+    async def _process(self, item: Any) -> Optional[Any]:
+        """turns a queued item into an event, None if it is held back"""
+        return item
+
+    def _pop_ready(self) -> Optional[Any]:
+        """returns an event that goes before the queue (None if there is none)"""
+        return None
+
+    async def _drain(self, events: list, max_n: int) -> list:
+        """appends the events that are ready to events, without waiting"""
+        while len(events) < max_n:
+            event = self._pop_ready()
+            if event is None:
+                if self._queue.empty():
+                    break
+                event = await self._process(self._queue.get_nowait())
+                if event is None:
+                    continue
+            events.append(event)
+        return events
+
+    async def _next_event(self) -> Any:
+        """returns the next event, logs while none arrive for _timeout seconds"""
+        while True:
+            event = self._pop_ready()
+            if event is None:
+                if self._queue.empty():
+                    item = await self._idle.wait(self._queue.get())
+                else:
+                    item = self._queue.get_nowait()
+                event = await self._process(item)
+
+            if event is not None:
+                if self.latency_stamps:
+                    mark_all((event,), Stage.DEQUEUED)
+                return event
+
+    async def recv_many(self, max_n: int = 1000, timeout: Optional[float] = None):
+        """
+        returns up to max_n events. waits only if no event is ready, for at
+        most timeout seconds (an empty list is returned on timeout).
+        """
+        events = await self._drain([], max_n)
+
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while not events:
+            if deadline is None:
+                item = await self._idle.wait(self._queue.get())
+            else:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            event = await self._process(item)
+            if event is not None:
+                events.append(event)
+            await self._drain(events, max_n)
+
+        if self.latency_stamps:
+            mark_all(events, Stage.DEQUEUED)
+        return events
 
     async def _run(self, queue_out: asyncio.Queue):
         """Run the websocket in a loop and put the messages in the queue"""
         await self.connect()
         while True:
-            msg = await self.recv()
-            await queue_out.put(msg)
+            for event in await self.recv_many():
+                await queue_out.put(event)
+
+    def metrics(self, labels: Optional[dict[str, str]] = None) -> list[Sample]:
+        """current counters and gauges of the connection and its symbols"""
+        labels = {"exchange": self._name, **(labels or {})}
+        samples = [
+            Sample("ws_frames_total", labels, self.n_frames),
+            Sample("ws_bytes_total", labels, self.n_bytes),
+            Sample("ws_reconnects_total", labels, self.n_reconnects),
+            Sample("ws_queue_size", labels, self._queue.qsize()),
+            Sample("ws_queue_dropped_total", labels, self._queue.n_dropped),
+            Sample("ws_queue_conflated_total", labels, self._queue.n_conflated),
+        ]
+        for symbol, stats in self.stream_stats.items():
+            samples += stats.metrics({**labels, "symbol": symbol})
+        return samples
 
     async def recv(self):
-        msg = await asyncio.wait_for(self._queue.get(), timeout=self._timeout)
-        return msg
+        """returns the next event"""
+        return await self._next_event()
@@ -4,7 +4,16 @@ import logging
 from typing import NamedTuple, Optional, Union
 from .binance import BinanceWebsocket
 from .kraken import KrakenWebsocket
-from .events import StreamType, ExchangeType, OrderbookEvent, TradeEvent
+from .websocket import Websocket
+from .events import StreamType, ExchangeType, LevelsFormat
+from .events import OrderbookEvent, TradeEvent, StatusEvent, BboEvent
+from .bbo import BboTracker
+from .latency import LatencyTracker, Stage, mark_all
+from .metrics import MetricsServer, Sample
+from .queues import EventQueue, IdleTimer, OverflowPolicy
+from .recorder import FrameRecorder
+from .replay import Replay, ReplayBinanceWebsocket, ReplayKrakenWebsocket
+from .rest import RestClient
 
 
 class Subscription(NamedTuple):
@@ -12,22 +21,113 @@ class Subscription(NamedTuple):
     symbol: str
     stream_name: str
     orderbook_depth: Optional[int] = None
+    fixed_point: bool = False
+    levels_format: str = "objects"
+
+
+_ws_classes = {
+    ExchangeType.BINANCE: BinanceWebsocket,
+    ExchangeType.KRAKEN: KrakenWebsocket,
+}
+
+_replay_classes = {
+    ExchangeType.BINANCE: ReplayBinanceWebsocket,
+    ExchangeType.KRAKEN: ReplayKrakenWebsocket,
+}
+
+
+def group_subscriptions(
+    subscriptions: list[Subscription],
+) -> list[tuple[Subscription, ...]]:
+    """
+    groups subscriptions that can share a websocket connection: same exchange,
+    stream and options, at most _max_streams of the exchange per group.
+    """
+    groups: dict[Subscription, list[Subscription]] = {}
+    for sub in dict.fromkeys(subscriptions):  # drop duplicates, keep order
+        groups.setdefault(sub._replace(symbol=""), []).append(sub)
+
+    chunks = []
+    for key, subs in groups.items():
+        exchType = ExchangeType(key.exch_name)
+        if exchType not in _ws_classes:
+            raise ValueError(f"Exchange {exchType} not supported")
+        n = _ws_classes[exchType]._max_streams
+        chunks.extend(tuple(subs[i : i + n]) for i in range(0, len(subs), n))
+    return chunks
 
 
 class WsManager:
-    def __init__(self, subscriptions: list[Subscription]):
+    """
+    Manages the websocket connections of a list of subscriptions.
+    Subscriptions to the same exchange and stream share connections (see
+    group_subscriptions) and all events are put on a single queue.
+
+    With status_events=True, reconnects and orderbook resyncs are also
+    returned by recv as StatusEvents.
+
+    queue_size bounds the event queues (0 = unbounded) and overflow selects
+    what happens when they are full (see queues.EventQueue).
+
+    "bbo" subscriptions receive the book stream and keep the book in the
+    manager, only a BboEvent is returned when the best bid or ask changes
+    (orderbook_depth defaults to the _bbo_depth of the exchange: binance
+    books can't be trimmed, kraken refills the top levels itself).
+
+    With a recorder, the raw traffic of all connections is recorded (see
+    recorder.FrameRecorder, the recorder is closed by its owner). With a
+    replay, the connections replay a recording instead of connecting (see
+    replay.Replay, replay.done is set when it is over).
+
+    With latency=True events carry stage stamps (see latency.StageStamps)
+    and self.latency collects their histograms: pass each event to
+    latency.record once it has been handled (after Orderbook.update).
+
+    metrics() returns the counters and gauges of the manager and its
+    connections (see metrics.Sample) without changing any state, so it can
+    be pulled by several consumers (each with its own metrics.RateMeter for
+    per-second rates). serve_metrics exposes them on a local http endpoint
+    in the prometheus text format.
+
+    The connections share one RestClient (pooled session and request weight
+    budget) for orderbook snapshots.
+
+    Events are returned one at a time by recv (or async for), or in batches
+    by recv_many.
+    """
+
+    def __init__(
+        self,
+        subscriptions: list[Subscription],
+        status_events: bool = False,
+        queue_size: int = 0,
+        overflow: OverflowPolicy = OverflowPolicy.BLOCK,
+        recorder: Optional[FrameRecorder] = None,
+        replay: Optional[Replay] = None,
+        latency: bool = False,
+    ):
         self.subscriptions = subscriptions
+        self.status_events = status_events
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.recorder = recorder
+        self.replay = replay
+        self.latency: Optional[LatencyTracker] = LatencyTracker() if latency else None
 
         self._logger = logging.getLogger(__name__)
         self._loop = asyncio.get_event_loop()
         self._coros = []
 
-        self._queue = asyncio.Queue()
+        self._queue = EventQueue(queue_size, overflow)
         self._ws_connections = {}
+        self._rest = RestClient() if replay is None else replay.rest_client()
+        self._idle = IdleTimer(
+            Websocket._timeout, lambda: self._logger.info("timeout in recv")
+        )
+        self._metrics_server: Optional[MetricsServer] = None
 
-        for sub in self.subscriptions:
-            if sub not in self._ws_connections:
-                self._ws_connections[sub] = self.__create_ws_connection(sub)
+        for subs in group_subscriptions(self.subscriptions):
+            self._ws_connections[subs] = self.__create_ws_connection(subs)
 
     async def __aenter__(self):
         await self.connect()
@@ -36,37 +136,133 @@ class WsManager:
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.cleanup()
 
-    def __create_ws_connection(self, subscription: Subscription):
-        streamType = StreamType(subscription.stream_name)
-        exchType = ExchangeType(subscription.exch_name)
-        symbol = subscription.symbol
+    def __aiter__(self):
+        return self
 
-        if exchType == ExchangeType.BINANCE:
-            ws = BinanceWebsocket(streamType, symbol, subscription.orderbook_depth)
-        elif exchType == ExchangeType.KRAKEN:
-            ws = KrakenWebsocket(streamType, symbol, subscription.orderbook_depth)
-        else:
+    async def __anext__(
+        self,
+    ) -> Union[OrderbookEvent, TradeEvent, StatusEvent, BboEvent]:
+        return await self.recv()
+
+    def __create_ws_connection(self, subscriptions: tuple[Subscription, ...]):
+        """creates one websocket connection for a group of subscriptions"""
+        sub = subscriptions[0]
+        streamType = StreamType(sub.stream_name)
+        exchType = ExchangeType(sub.exch_name)
+        if exchType not in _ws_classes:
             raise ValueError(f"Exchange {exchType} not supported")
 
+        symbols, depth = [s.symbol for s in subscriptions], sub.orderbook_depth
+        if streamType == StreamType.BBO:
+            streamType = StreamType.BOOK
+            depth = depth or _ws_classes[exchType]._bbo_depth
+        fixed_point = sub.fixed_point
+        levels_format = LevelsFormat(sub.levels_format)
+
+        ws_class = (_replay_classes if self.replay else _ws_classes)[exchType]
+        ws = ws_class(streamType, symbols, depth, fixed_point, levels_format)
+        if self.replay is not None:
+            self.replay.add(ws)
+        ws.status_events = self.status_events
+        ws.latency_stamps = self.latency is not None
+        ws.set_queue_policy(self.queue_size, self.overflow)
+        ws.set_rest_client(self._rest)
+        ws.recorder = self.recorder
         return ws
 
     async def connect(self):
-        for sub, ws in self._ws_connections.items():
-            self._logger.info(f"Connecting to {sub}")
-            self._coros.append(self._loop.create_task(ws._run(self._queue)))
+        for subs, ws in self._ws_connections.items():
+            self._logger.info(f"Connecting to {subs}")
+            if StreamType(subs[0].stream_name) == StreamType.BBO:
+                coro = self._run_bbo(ws)
+            else:
+                coro = ws._run(self._queue)
+            self._coros.append(self._loop.create_task(coro))
+
+    async def _run_bbo(self, ws: Websocket):
+        """runs a book connection, queues a BboEvent when the top of a book changes"""
+        depth = ws.depth if ws._bounded_book else None
+        trackers = {s: BboTracker(ws._name, s, depth) for s in ws.symbols}
+        await ws.connect()
+        while True:
+            for event in await ws.recv_many():
+                if isinstance(event, OrderbookEvent):
+                    event = trackers[event.symbol].update(event)
+                    if event is None:
+                        continue
+                await self._queue.put(event)
 
     async def cleanup(self):
         for task in self._coros:
             task.cancel()
         await asyncio.wait(self._coros, timeout=10)
 
-    async def recv(self) -> Union[OrderbookEvent, TradeEvent]:
+        for ws in self._ws_connections.values():
+            await ws.cleanup()
+        await self._rest.close()
+        self._idle.cancel()
+        if self._metrics_server is not None:
+            await self._metrics_server.stop()
+
+    def metrics(self) -> list[Sample]:
+        """
+        counters and gauges of the manager and of each connection (conn
+        label). pulling them doesn't change any state (see RateMeter for rates).
+        """
+        samples = [
+            Sample("queue_size", {}, self._queue.qsize()),
+            Sample("queue_dropped_total", {}, self._queue.n_dropped),
+            Sample("queue_conflated_total", {}, self._queue.n_conflated),
+            Sample("connections", {}, len(self._ws_connections)),
+        ]
+        for i, (subs, ws) in enumerate(self._ws_connections.items()):
+            samples += ws.metrics({"conn": str(i), "stream": subs[0].stream_name})
+        return samples
+
+    async def serve_metrics(self, host: str = "localhost", port: int = 9100):
+        """serves metrics() at http://{host}:{port}/metrics until cleanup"""
+        if self._metrics_server is None:
+            self._metrics_server = MetricsServer(self.metrics, host, port)
+            await self._metrics_server.start()
+
+    async def recv(self) -> Union[OrderbookEvent, TradeEvent, StatusEvent, BboEvent]:
         """receive an event from the websocket connections"""
         try:
-            return await self._queue.get()
+            if not self._queue.empty():
+                event = self._queue.get_nowait()
+            else:
+                event = await self._idle.wait(self._queue.get())
         except asyncio.CancelledError:
             self._logger.info("cancelled error")
             raise
         except BaseException as e:
             self._logger.exception("exception: ", e)
             raise
+        if self.latency is not None:
+            mark_all((event,), Stage.DEQUEUED)
+        return event
+
+    async def recv_many(
+        self, max_n: int = 1000, timeout: Optional[float] = None
+    ) -> list[Union[OrderbookEvent, TradeEvent, StatusEvent, BboEvent]]:
+        """
+        returns up to max_n events. waits only if no event is queued, for at
+        most timeout seconds (an empty list is returned on timeout).
+        """
+        if self._queue.empty():
+            if timeout is None:
+                first = await self._idle.wait(self._queue.get())
+            else:
+                try:
+                    first = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    return []
+            events = [first]
+        else:
+            events = []
+
+        while len(events) < max_n and not self._queue.empty():
+            events.append(self._queue.get_nowait())
+        if self.latency is not None:
+            mark_all(events, Stage.DEQUEUED)
+        return events